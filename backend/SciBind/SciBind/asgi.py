@@ -5,8 +5,17 @@ from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SciBind.settings")
 
+# Initialize Django before importing anything that loads models
+django_asgi_app = get_asgi_application()
+
+from app.authentication import TokenAuthMiddleware  # noqa: E402
+from app.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),
+        "http": django_asgi_app,
+        "websocket": AuthMiddlewareStack(
+            TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        ),
     }
 )
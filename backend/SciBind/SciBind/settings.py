@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "app.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -78,15 +80,73 @@ TEMPLATES = [
 WSGI_APPLICATION = "SciBind.wsgi.application"
 ASGI_APPLICATION = "SciBind.asgi.application"
 
+# Channel layer used to broadcast binder edits between websocket consumers.
+# Use a shared layer (e.g. channels_redis) when running several processes.
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    },
+}
+
+# Seconds between database writes of a binder edited over websockets
+BINDER_SESSION_FLUSH_INTERVAL = 2.0
+
+# Write-behind buffer for binder autosaves (see app/helpers/writebehind.py),
+# off unless SCIBIND_WRITE_BEHIND=1
+BINDER_WRITE_BEHIND = {
+    "ENABLED": os.environ.get("SCIBIND_WRITE_BEHIND", "0") == "1",
+    "JOURNAL_DIR": BASE_DIR / "journal",
+    "INTERVAL": 2.0,
+    "MAX_PENDING": 100,
+    "FSYNC": True,
+}
+
+# Every this many revisions of a binder stores its full content, the others
+# store a patch against the previous revision (see app/helpers/revisions.py)
+BINDER_REVISION_KEYFRAME_INTERVAL = 20
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SCIBIND_DB_ENGINE selects the database: "sqlite" (default) or "postgresql".
+# PostgreSQL needs psycopg installed (pip install "psycopg[binary]").
+DB_ENGINE = os.environ.get("SCIBIND_DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("SCIBIND_DB_NAME", "scibind"),
+            "USER": os.environ.get("SCIBIND_DB_USER", "scibind"),
+            "PASSWORD": os.environ.get("SCIBIND_DB_PASSWORD", ""),
+            "HOST": os.environ.get("SCIBIND_DB_HOST", "localhost"),
+            "PORT": os.environ.get("SCIBIND_DB_PORT", "5432"),
+            # Keep connections open between requests, checking them first
+            "CONN_MAX_AGE": int(os.environ.get("SCIBIND_DB_CONN_MAX_AGE", 600)),
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("SCIBIND_DB_NAME", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": int(os.environ.get("SCIBIND_DB_CONN_MAX_AGE", 60)),
+            "CONN_HEALTH_CHECKS": True,
+        }
     }
+
+# PRAGMAs applied to every new SQLite connection (see app/helpers/db.py).
+# WAL lets readers run alongside the single writer, and busy_timeout makes
+# writers wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20000,
+    "temp_store": "memory",
 }
 
 
@@ -135,6 +195,71 @@ AUTH_USER_MODEL = "app.User"
 
 AUTH_TOKEN_VALIDITY = 3600
 
+# Seconds a token -> user lookup is trusted by the in-process token cache
+AUTH_TOKEN_CACHE_TTL = 300
+
+AUTH_TOKEN_CACHE_SIZE = 1024
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "app.authentication.CachedTokenAuthentication",
+    ],
+}
+
+# Seconds the serialized event catalog is cached before it is rebuilt
+EVENT_CATALOG_TTL = 300
+
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Images up to this size are kept in memory, up to IMAGE_CACHE_SIZE in total
+IMAGE_CACHE_MAX_ITEM_SIZE = 256 * 1024
+
+IMAGE_CACHE_SIZE = 16 * 1024 * 1024
+
+# Set to "X-Accel-Redirect" (nginx) or "X-Sendfile" (Apache) to let the web
+# server send image files. For nginx, IMAGE_SENDFILE_ROOT must be an internal
+# location aliased to lib/images/.
+IMAGE_SENDFILE_HEADER = None
+
+IMAGE_SENDFILE_ROOT = "/protected-images/"
+
+# Resized and recompressed images are generated into this directory
+IMAGE_VARIANT_DIR = MEDIA_ROOT / "variants"
+
+IMAGE_VARIANT_SENDFILE_ROOT = "/protected-variants/"
+
+# Rendered binder PDFs are cached in this directory
+PRINT_RENDER_DIR = MEDIA_ROOT / "renders"
+
+# Background tasks, run by `manage.py run_worker` (see app/helpers/tasks.py)
+TASKS = {
+    # Run tasks in the process queuing them as soon as they are queued
+    "EAGER": os.environ.get("SCIBIND_TASKS_EAGER", "0") == "1",
+    # Number of worker processes started by run_worker
+    "WORKERS": os.cpu_count() or 1,
+    # Seconds an idle worker waits before looking for tasks again
+    "POLL_INTERVAL": 1.0,
+    "MAX_ATTEMPTS": 3,
+    # Seconds before the first retry of a failed task, doubled for every retry
+    "RETRY_DELAY": 10,
+    # Seconds after which a running task is assumed to have lost its worker
+    "TIMEOUT": 600,
+}
+
+# Request metrics, exported at /api/metrics/ (see app/helpers/metrics.py)
+METRICS = {
+    "ENABLED": os.environ.get("SCIBIND_METRICS", "1") == "1",
+    # Requests taking longer than this many seconds are logged with their
+    # slowest queries
+    "SLOW_REQUEST": 1.0,
+    # Seconds between logs of slow requests to the same route
+    "SLOW_LOG_INTERVAL": 60,
+    # Addresses that may read the metrics, besides staff users, e.g. of a
+    # Prometheus server. Don't add the address of a reverse proxy in front of
+    # the server, every request would come from it.
+    "ALLOWED_IPS": [
+        ip for ip in os.environ.get("SCIBIND_METRICS_ALLOWED_IPS", "").split(",") if ip
+    ],
+}
+
 default_app_config = "app.apps.AppConfig"
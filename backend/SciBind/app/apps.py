@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 from django.db.models.signals import post_migrate
 
 
@@ -8,6 +9,14 @@ class AppConfig(AppConfig):
 
     def ready(self):
         from django.core.management import call_command
+        from app.helpers.db import configure_sqlite
+        from app.helpers.metrics import install_query_recorder
+
+        # Registers the background tasks
+        from app import tasks  # noqa: F401
+
+        connection_created.connect(configure_sqlite)
+        connection_created.connect(install_query_recorder)
 
         def load_csv_data(sender, **kwargs):
             from app.models import EventModel
@@ -0,0 +1,185 @@
+"""
+Async versions of the read endpoints the front end requests on every page load.
+
+They are plain Django async views served under /api/async/, so under ASGI
+they run on the event loop instead of a worker thread. Database queries and
+serializers leave it, since serializers look up image files on disk to build
+image URLs. DRF views are synchronous, so these authenticate with
+CachedTokenAuthentication.aauthenticate() themselves and render with DRF's
+JSON renderer, giving the same responses as their counterparts in views.py.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import CachedTokenAuthentication
+from .helpers.catalog import event_catalog
+from .models import BinderModel
+from .permissions import acan_access_binder
+from .serializers import BinderListSerializer, UserSerializer
+
+renderer = JSONRenderer()
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(
+        renderer.render(data), status=status, content_type="application/json"
+    )
+
+
+async def serialize(serializer):
+    """
+    Returns a serializer's data, built in a worker thread.
+    """
+    return await sync_to_async(lambda: serializer.data)()
+
+
+async def get_user(request):
+    """
+    Returns the user authenticated for this request, or None.
+
+    Sets request.user, like DRF's authentication does for the sync views.
+    """
+    try:
+        authenticated = await CachedTokenAuthentication().aauthenticate(request)
+    except exceptions.AuthenticationFailed:
+        authenticated = None
+    if authenticated is None:
+        return None
+    request.user = authenticated[0]
+    return request.user
+
+
+@require_GET
+async def binders(request):
+    """
+    Async version of Binders.list.
+
+    Args:
+        request: The request object.
+
+    Returns:
+        HttpResponse: A response containing the binders the user can access.
+    """
+    user = await get_user(request)
+    if user is None:
+        return json_response(
+            {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    queryset = BinderModel.objects.accessible_to(user).filter(old=False).for_listing()
+    serializer = BinderListSerializer(
+        [binder async for binder in queryset], many=True, context={"request": request}
+    )
+    return json_response(await serialize(serializer))
+
+
+@require_GET
+async def events(request):
+    """
+    Async version of Events.list.
+
+    Args:
+        request: The request object.
+
+    Returns:
+        HttpResponse: A response containing all events, or 304 if the
+        client's copy is current.
+    """
+    user = await get_user(request)
+    if user is None:
+        return json_response(
+            {"error": "Invalid token"}, status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    data, etag, last_modified = await event_catalog.aget()
+    if response := get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    ):
+        return response
+    response = json_response(data)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@require_GET
+async def event_info(request, pk):
+    """
+    Async version of get_event_info.
+
+    Args:
+        request: The request object.
+        pk: The id of the binder.
+
+    Returns:
+        HttpResponse: A response containing the binder's event.
+    """
+    user = await get_user(request)
+    if user is None:
+        return HttpResponse("Invalid token", status=status.HTTP_400_BAD_REQUEST)
+    try:
+        binder = await BinderModel.objects.select_related("event").aget(id=pk)
+    except BinderModel.DoesNotExist:
+        return HttpResponse("Binder not found", status=status.HTTP_404_NOT_FOUND)
+    if not await acan_access_binder(request, binder):
+        return HttpResponse(
+            "You don't have permission to view this binder",
+            status=status.HTTP_403_FORBIDDEN,
+        )
+    event = binder.event
+    return json_response(
+        {
+            "name": event.name,
+            "division": event.division,
+            "materialtype": event.materialtype,
+            "description": event.description,
+            "category": event.category,
+        }
+    )
+
+
+@require_GET
+async def user(request):
+    """
+    Async version of the user view.
+
+    Args:
+        request: The request object.
+
+    Returns:
+        HttpResponse: A response containing the user's data.
+    """
+    user = await get_user(request)
+    if user is None:
+        return json_response(
+            {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    serializer = UserSerializer(user, context={"request": request})
+    return json_response(await serialize(serializer))
+
+
+# Token authentication isn't vulnerable to CSRF, like DRF's sync views
+@csrf_exempt
+@require_POST
+async def validate_token(request):
+    """
+    Async version of validate_token.
+
+    Args:
+        request: The request object.
+
+    Returns:
+        HttpResponse: A response containing a message.
+    """
+    if await get_user(request) is None:
+        return json_response(
+            {"error": "Invalid token"}, status=status.HTTP_401_UNAUTHORIZED
+        )
+    return json_response({"message": "Token is valid"})
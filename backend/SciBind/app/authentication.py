@@ -0,0 +1,191 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+
+class TokenCache:
+    """
+    A thread-safe LRU cache mapping token keys to users, with a per-entry TTL.
+
+    Args:
+        maxsize: The maximum number of tokens kept in memory.
+        ttl: The maximum number of seconds an entry is trusted without a lookup.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def set(self, key, user, expires):
+        expires = min(expires, time.time() + self.ttl)
+        with self._lock:
+            self._entries[key] = (user, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (u, _) in self._entries.items() if u.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    maxsize=getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "AUTH_TOKEN_CACHE_TTL", 300),
+)
+
+
+def token_expiry(token):
+    """
+    Returns the unix timestamp at which a token stops being valid.
+    """
+    return token.created.timestamp() + settings.AUTH_TOKEN_VALIDITY
+
+
+def token_expired(token):
+    return token_expiry(token) <= timezone.now().timestamp()
+
+
+def rotate_token(user):
+    """
+    Returns a valid token for the user, replacing it if it has expired.
+
+    Args:
+        user: The user to get a token for.
+
+    Returns:
+        Token: The user's current token.
+    """
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and token_expired(token):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that remembers recently seen tokens in memory.
+
+    A cache hit costs no queries, a miss costs a single token + user lookup.
+    Tokens older than AUTH_TOKEN_VALIDITY are rejected.
+    """
+
+    def authenticate_credentials(self, key):
+        if (user := token_cache.get(key)) is not None:
+            return (copy.copy(user), key)
+        try:
+            token = Token.objects.select_related("user").get(key=key)
+        except Token.DoesNotExist:
+            token = None
+        return self._verify(key, token)
+
+    async def aauthenticate(self, request):
+        """
+        Async version of authenticate(), for the async views, which don't go
+        through DRF. A cache hit doesn't leave the event loop.
+
+        Returns:
+            tuple: The user and token key, or None if the request has no token.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        try:
+            key = auth[1].decode() if len(auth) == 2 else None
+        except UnicodeError:
+            key = None
+        if key is None:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+
+        if (user := token_cache.get(key)) is not None:
+            return (copy.copy(user), key)
+        try:
+            token = await Token.objects.select_related("user").aget(key=key)
+        except Token.DoesNotExist:
+            token = None
+        return self._verify(key, token)
+
+    @staticmethod
+    def _verify(key, token):
+        if token is None:
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        if token_expired(token):
+            raise exceptions.AuthenticationFailed("Token has expired.")
+
+        token_cache.set(key, token.user, token_expiry(token))
+        return (copy.copy(token.user), key)
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """
+    Channels middleware that authenticates websockets from a `token` query
+    parameter, since browsers cannot set headers on websocket requests.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        query = parse_qs(scope.get("query_string", b"").decode())
+        if key := query.get("token", [None])[0]:
+            scope["user"] = await database_sync_to_async(self.get_user)(key)
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def get_user(key):
+        try:
+            user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+            return user
+        except exceptions.AuthenticationFailed:
+            return AnonymousUser()
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def evict_changed_user(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.delete_user(instance.pk)
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .helpers.documents import parse_content, serialize_content
+from .helpers.jsonpatch import JsonPatchError, apply_patch
+from .helpers.writebehind import flush_pending
+from .models import BinderModel
+
+logger = logging.getLogger(__name__)
+
+
+class BinderSession:
+    """
+    The in-memory state of a binder that is being edited over websockets.
+
+    Edits are applied to the session's copy of the document and written to
+    the database at most once every BINDER_SESSION_FLUSH_INTERVAL seconds,
+    and when the last client disconnects. If the binder was saved elsewhere
+    in the meantime, the edits not written yet are applied again on top of
+    that save. Clients are told about edits that no longer apply.
+    """
+
+    sessions = {}
+    # Attempts to write edits before giving up until the next flush
+    MAX_REBASES = 5
+
+    def __init__(self, binder):
+        self.pk = binder.pk
+        self.like = binder.content
+        self.document = parse_content(binder.content)
+        self.version = binder.version
+        self.persisted_version = binder.version
+        # The patches applied since persisted_version
+        self.patches = []
+        self.clients = 0
+        self.users = Counter()
+        self.lock = asyncio.Lock()
+        self.flush_task = None
+
+    @classmethod
+    async def join(cls, binder):
+        if (session := cls.sessions.get(binder.pk)) is None:
+            session = cls.sessions[binder.pk] = cls(binder)
+        session.clients += 1
+        return session
+
+    async def leave(self):
+        self.clients -= 1
+        if self.clients > 0:
+            return
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+        if self.clients == 0 and self.sessions.get(self.pk) is self:
+            del self.sessions[self.pk]
+
+    @property
+    def content(self):
+        return serialize_content(self.document, like=self.like)
+
+    def apply(self, patch):
+        """
+        Applies a patch to the current version and returns the new version.
+
+        Raises:
+            JsonPatchError: If the patch cannot be applied.
+        """
+        self.document = apply_patch(self.document, patch)
+        self.patches.append(patch)
+        self.version += 1
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+        return self.version
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.BINDER_SESSION_FLUSH_INTERVAL)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            for _ in range(self.MAX_REBASES):
+                if self.version == self.persisted_version:
+                    return True
+                saved = await database_sync_to_async(self.save)(
+                    self.content, self.version, self.persisted_version
+                )
+                if saved:
+                    self.persisted_version = self.version
+                    self.patches = []
+                    return True
+                await self.rebase()
+            logger.warning("Binder %s keeps being saved elsewhere", self.pk)
+            return False
+
+    async def rebase(self):
+        """
+        Reloads the binder after it was saved elsewhere, and applies the
+        patches that weren't written yet to it.
+        """
+        binder = await database_sync_to_async(self.load)()
+        document, patches, rejected = parse_content(binder.content), [], 0
+        for patch in self.patches:
+            try:
+                document = apply_patch(document, patch)
+            except JsonPatchError:
+                rejected += 1
+            else:
+                patches.append(patch)
+        self.like = binder.content
+        self.document = document
+        self.patches = patches
+        self.persisted_version = binder.version
+        self.version = binder.version + len(patches)
+
+        group = f"binder_{self.pk}"
+        if rejected:
+            logger.warning(
+                "Binder %s was saved elsewhere, %d edits no longer apply",
+                self.pk,
+                rejected,
+            )
+            await get_channel_layer().group_send(
+                group, {"type": "binder.conflict", "rejected": rejected}
+            )
+        await get_channel_layer().group_send(group, {"type": "binder.resync"})
+
+    def load(self):
+        binder = BinderModel.objects.get(pk=self.pk)
+        binder.content  # Load the document while in a sync context
+        return binder
+
+    def save(self, content, version, persisted_version):
+        return BinderModel.objects.filter(
+            pk=self.pk, version=persisted_version
+        ).update_content(content, version=version)
+
+
+class BinderConsumer(AsyncJsonWebsocketConsumer):
+    """
+    A websocket consumer for collaboratively editing a binder.
+
+    Clients send {"type": "patch", "version": n, "patch": [...]} messages with
+    JSON Patch operations. Each accepted patch is acknowledged to the sender
+    and broadcast to the other clients editing the binder, in the order the
+    patches were applied. A patch made
+    against an outdated version is answered with a "resync" message holding
+    the current content. When the binder was saved elsewhere, every client
+    gets a "resync", preceded by a "conflict" message if some acknowledged
+    edits couldn't be applied to that save and were discarded.
+    """
+
+    async def connect(self):
+        self.session = None
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close(code=4001)
+            return
+        binder = await self.get_binder(self.scope["url_route"]["kwargs"]["pk"], user)
+        if binder is None:
+            await self.close(code=4003)
+            return
+
+        self.user = user
+        self.group_name = f"binder_{binder.pk}"
+        self.session = await BinderSession.join(binder)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        online_users = await self.set_online(True)
+        await self.send_json(
+            {
+                "type": "init",
+                "content": self.session.content,
+                "version": self.session.version,
+                "online_users": online_users,
+            }
+        )
+        await self.broadcast({"type": "binder.presence", "online_users": online_users})
+
+    async def disconnect(self, code):
+        if self.session is None:
+            return
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        online_users = await self.set_online(False)
+        await self.broadcast({"type": "binder.presence", "online_users": online_users})
+        await self.session.leave()
+
+    async def receive_json(self, content, **kwargs):
+        if content.get("type") != "patch":
+            await self.send_json({"type": "error", "error": "Unknown message type"})
+            return
+
+        session = self.session
+        async with session.lock:
+            if content.get("version") != session.version:
+                await self.send_json(
+                    {
+                        "type": "resync",
+                        "content": session.content,
+                        "version": session.version,
+                    }
+                )
+                return
+            try:
+                version = session.apply(content.get("patch"))
+            except JsonPatchError as e:
+                await self.send_json({"type": "error", "error": str(e)})
+                return
+
+            # Still holding the lock, so peers get patches in version order
+            await self.send_json({"type": "ack", "version": version})
+            await self.broadcast(
+                {
+                    "type": "binder.patch",
+                    "version": version,
+                    "patch": content["patch"],
+                    "sender": self.channel_name,
+                }
+            )
+
+    async def broadcast(self, message):
+        await self.channel_layer.group_send(self.group_name, message)
+
+    async def binder_patch(self, event):
+        if event["sender"] != self.channel_name:
+            await self.send_json(
+                {"type": "patch", "version": event["version"], "patch": event["patch"]}
+            )
+
+    async def binder_resync(self, event):
+        await self.send_json(
+            {
+                "type": "resync",
+                "content": self.session.content,
+                "version": self.session.version,
+            }
+        )
+
+    async def binder_conflict(self, event):
+        await self.send_json(
+            {
+                "type": "conflict",
+                "error": (
+                    f"The binder was changed elsewhere, {event['rejected']} "
+                    "edits could not be applied to it and were discarded"
+                ),
+                "rejected": event["rejected"],
+            }
+        )
+
+    async def binder_presence(self, event):
+        await self.send_json(
+            {"type": "presence", "online_users": event["online_users"]}
+        )
+
+    @database_sync_to_async
+    def get_binder(self, pk, user):
+        flush_pending(pk)
+        try:
+            binder = BinderModel.objects.get(pk=pk, old=False)
+        except BinderModel.DoesNotExist:
+            return None
+        if not binder.is_accessible_by(user):
+            return None
+        binder.content  # Load the document while in a sync context
+        return binder
+
+    async def set_online(self, online):
+        # A user may have the binder open in several tabs
+        users = self.session.users
+        users[self.user.pk] += 1 if online else -1
+        changed = users[self.user.pk] == (1 if online else 0)
+        return await self.update_online_users(online, changed)
+
+    @database_sync_to_async
+    def update_online_users(self, online, changed):
+        through = BinderModel.online_users.through
+        online_users = through.objects.filter(bindermodel_id=self.session.pk)
+        if changed and online:
+            through.objects.get_or_create(
+                bindermodel_id=self.session.pk, user_id=self.user.pk
+            )
+        elif changed:
+            online_users.filter(user_id=self.user.pk).delete()
+        return list(online_users.values_list("user_id", flat=True))
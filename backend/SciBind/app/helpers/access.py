@@ -0,0 +1,115 @@
+"""
+The BinderAccess table, holding a row per binder and user who can open it.
+
+Listing a user's binders is then a lookup on the table's (user, binder)
+index, however large the sharing graph is, instead of an OR of the owner and
+the shared_with table. The signals in models.py keep the rows in sync when
+binders are created or change owner and when shared_with changes. Writes that
+skip signals, e.g. bulk_create() or QuerySet.update(owner=...), must create
+the rows themselves or call sync_access(). The sync_binder_access command
+checks and repairs the whole table.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+OWNER = "owner"
+SHARED = "shared"
+
+
+def expected_access(binder_ids):
+    """
+    Returns the access binders should have according to their owners and
+    shared_with.
+
+    Args:
+        binder_ids: The ids of the binders.
+
+    Returns:
+        dict: (user id, binder id) -> role.
+    """
+    from app.models import BinderModel
+
+    expected = {}
+    shared = BinderModel.shared_with.through.objects.filter(
+        bindermodel_id__in=binder_ids
+    ).values_list("user_id", "bindermodel_id")
+    for user_id, binder_id in shared:
+        expected[user_id, binder_id] = SHARED
+    owners = BinderModel.objects.filter(pk__in=binder_ids).values_list("pk", "owner_id")
+    for binder_id, owner_id in owners:
+        expected[owner_id, binder_id] = OWNER
+    return expected
+
+
+def sync_access(binder_ids, dry_run=False):
+    """
+    Makes the BinderAccess rows of binders match their owners and
+    shared_with.
+
+    Args:
+        binder_ids: The ids of the binders, at most a few hundred.
+        dry_run: Only count the differences.
+
+    Returns:
+        tuple: The numbers of missing, wrong and stale rows.
+    """
+    from app.models import BinderAccess
+
+    binder_ids = list(binder_ids)
+    expected = expected_access(binder_ids)
+    current = {
+        (user_id, binder_id): (pk, role)
+        for pk, user_id, binder_id, role in BinderAccess.objects.filter(
+            binder_id__in=binder_ids
+        ).values_list("pk", "user_id", "binder_id", "role")
+    }
+    missing = [
+        BinderAccess(user_id=user_id, binder_id=binder_id, role=role)
+        for (user_id, binder_id), role in expected.items()
+        if (user_id, binder_id) not in current
+    ]
+    now = timezone.now()
+    wrong = [
+        BinderAccess(pk=pk, role=expected[key], updated_at=now)
+        for key, (pk, role) in current.items()
+        if key in expected and expected[key] != role
+    ]
+    stale = [pk for key, (pk, _) in current.items() if key not in expected]
+    if not dry_run and (missing or wrong or stale):
+        with transaction.atomic():
+            BinderAccess.objects.filter(pk__in=stale).delete()
+            BinderAccess.objects.bulk_create(missing)
+            BinderAccess.objects.bulk_update(wrong, ["role", "updated_at"])
+    return len(missing), len(wrong), len(stale)
+
+
+def share(binder_ids, user_ids):
+    """
+    Adds shared access to binders for users. Existing rows, e.g. the
+    owner's, are kept.
+    """
+    from app.models import BinderAccess
+
+    BinderAccess.objects.bulk_create(
+        (
+            BinderAccess(user_id=user_id, binder_id=binder_id, role=SHARED)
+            for binder_id in binder_ids
+            for user_id in user_ids
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def unshare(binder_ids=None, user_ids=None):
+    """
+    Removes shared access to binders for users. None means all of them.
+    """
+    from app.models import BinderAccess
+
+    access = BinderAccess.objects.filter(role=SHARED)
+    if binder_ids is not None:
+        access = access.filter(binder_id__in=binder_ids)
+    if user_ids is not None:
+        access = access.filter(user_id__in=user_ids)
+    access.delete()
@@ -0,0 +1,84 @@
+"""
+An in-process cache of the serialized event catalog.
+
+The catalog only changes when events are edited or `load_csv` runs, so the
+serialized list is kept in memory along with an ETag and Last-Modified time.
+It is invalidated by EventModel saves and deletes in this process, and
+rebuilt after EVENT_CATALOG_TTL seconds so other processes (e.g. a separate
+`load_csv` run) are picked up too.
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+class EventCatalog:
+    def __init__(self):
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns the serialized catalog.
+
+        Returns:
+            tuple: The list of serialized events, its ETag, and the unix time
+            it last changed at.
+        """
+        entry = self._entry
+        if entry is not None and entry[3] > time.time():
+            return entry[:3]
+        with self._lock:
+            if self._entry is None or self._entry[3] <= time.time():
+                self._entry = self._build(self._entry)
+            return self._entry[:3]
+
+    async def aget(self):
+        """
+        Async version of get(), which only leaves the event loop to rebuild
+        the catalog.
+        """
+        entry = self._entry
+        if entry is not None and entry[3] > time.time():
+            return entry[:3]
+        return await sync_to_async(self.get)()
+
+    def invalidate(self):
+        # Expired rather than dropped, so a rebuild can tell whether the
+        # catalog changed
+        if (entry := self._entry) is not None:
+            self._entry = (*entry[:3], 0)
+
+    @staticmethod
+    def _build(previous):
+        from app.models import EventModel
+        from app.serializers import EventSerializer
+
+        data = EventSerializer(EventModel.objects.order_by("id"), many=True).data
+        digest = hashlib.sha1(
+            json.dumps(data, separators=(",", ":")).encode()
+        ).hexdigest()
+        etag, now = f'"{digest}"', time.time()
+        # Last-Modified only moves when the catalog changes, so clients
+        # revalidating with If-Modified-Since keep their copy across rebuilds
+        if previous is not None and previous[1] == etag:
+            modified = previous[2]
+        else:
+            modified = int(now)
+        return data, etag, modified, now + settings.EVENT_CATALOG_TTL
+
+
+event_catalog = EventCatalog()
+
+
+@receiver(post_save, sender="app.EventModel")
+@receiver(post_delete, sender="app.EventModel")
+def invalidate_event_catalog(sender, **kwargs):
+    event_catalog.invalidate()
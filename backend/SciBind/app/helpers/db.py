@@ -0,0 +1,18 @@
+"""
+Database connection tuning.
+"""
+
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Applies SQLITE_PRAGMAS to new SQLite connections.
+
+    Connected to the connection_created signal in AppConfig.ready().
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
@@ -0,0 +1,66 @@
+"""
+Helpers for binder documents.
+
+The editor saves its document as a JSON encoded string, so BinderModel.content
+may hold either a string or an already parsed JSON value.
+
+Content is stored compressed in BinderContent rows, addressed by the SHA-256
+of its encoding so identical content is only stored once.
+"""
+
+import hashlib
+import json
+import zlib
+
+
+def parse_content(content):
+    """
+    Returns the parsed JSON document stored in a binder's content.
+    """
+    if isinstance(content, str):
+        return json.loads(content) if content else None
+    return content
+
+
+def serialize_content(document, like=None):
+    """
+    Converts a document back into the representation used by `like`.
+
+    Args:
+        document: The parsed JSON document.
+        like: The content value the document was parsed from.
+
+    Returns:
+        A JSON string if `like` was a string (or empty), otherwise the document.
+    """
+    if like is None or isinstance(like, str):
+        return json.dumps(document, separators=(",", ":"))
+    return document
+
+
+def encode_content(content):
+    """
+    Encodes a content value for storage.
+
+    Returns:
+        tuple: The hex SHA-256 digest of the encoded value, the zlib
+        compressed encoding, and the uncompressed size in bytes.
+    """
+    data = json.dumps(content, separators=(",", ":")).encode()
+    return hashlib.sha256(data).hexdigest(), zlib.compress(data), len(data)
+
+
+def compress_content(content):
+    """
+    Returns the zlib compressed encoding of a JSON value and its uncompressed
+    size in bytes.
+    """
+    data = json.dumps(content, separators=(",", ":")).encode()
+    return zlib.compress(data), len(data)
+
+
+def decode_content(data):
+    """
+    Returns the content value from its compressed encoding.
+    """
+    return json.loads(zlib.decompress(data))
@@ -0,0 +1,231 @@
+"""
+Serving of the images in lib/images.
+
+Every image gets a content-hashed URL (/api/images/<digest>/<name>) that can be
+cached forever, since a changed file gets a new URL. Small images are kept in
+an in-memory LRU, and serving can be offloaded to the web server with
+X-Accel-Redirect (nginx) or X-Sendfile (Apache) via IMAGE_SENDFILE_HEADER.
+"""
+
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+IMMUTABLE = {"public": True, "max_age": 60 * 60 * 24 * 365, "immutable": True}
+REVALIDATE = {"private": True, "no_cache": True}
+
+# Seconds between checks of the root's directories for added or removed
+# files, and between full scans for files changed in place, when looking up
+# unknown digests
+INDEX_CHECK_INTERVAL = 5
+INDEX_MAX_AGE = 60
+
+
+class Image:
+    def __init__(self, store, path, digest, size, mtime):
+        self.store = store
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.mtime = mtime
+        self.name = path.name
+        self.content_type = mimetypes.guess_type(path.name)[0] or "image/png"
+
+    @property
+    def etag(self):
+        return f'"{self.digest}"'
+
+    @property
+    def url(self):
+        return f"/api/images/{self.digest}/{self.name}"
+
+
+class ImageStore:
+    """
+    Finds images under a root directory by path or by content digest.
+
+    Args:
+        root: The directory images are served from.
+        cache_size: The total bytes of image data kept in memory.
+        max_item_size: Images larger than this are never kept in memory.
+        sendfile_root: The web server location that serves `root`, used with
+            X-Accel-Redirect.
+    """
+
+    def __init__(self, root, cache_size, max_item_size, sendfile_root=None):
+        self.root = Path(root).resolve()
+        self.sendfile_root = sendfile_root
+        self.cache_size = cache_size
+        self.max_item_size = max_item_size
+        self._images = {}
+        self._digests = {}
+        self._data = OrderedDict()
+        self._data_size = 0
+        self._lock = threading.Lock()
+        # Directory -> mtime at the last scan of the root
+        self._directories = None
+        self._scanned = self._checked = 0
+        self._index_lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Returns the Image for a path, or None if it is not an image file
+        under the root.
+        """
+        path = (settings.BASE_DIR / str(path).replace("\\", "/")).resolve()
+        if not path.is_relative_to(self.root):
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        image = self._images.get(path)
+        if image is None or (image.size, image.mtime) != (stat.st_size, stat.st_mtime):
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            image = Image(self, path, digest, stat.st_size, stat.st_mtime)
+            with self._lock:
+                self._images[path] = image
+                self._digests[digest] = image
+            self._remember(image, data)
+        return image
+
+    def find(self, digest):
+        """
+        Returns the Image with a content digest, or None.
+
+        Digests are looked up in an index of the root, so unknown digests,
+        e.g. of URLs built by another process, don't scan the root. The index
+        is rebuilt when files were added or removed, checked at most every
+        INDEX_CHECK_INTERVAL seconds, and every INDEX_MAX_AGE seconds.
+        """
+        if (image := self._digests.get(digest)) is None:
+            self._update_index()
+            if (image := self._digests.get(digest)) is None:
+                return None
+        # Make sure the file hasn't changed since it was indexed
+        if self.get(image.path) is image:
+            return image
+        return None
+
+    def _update_index(self):
+        now = time.monotonic()
+        with self._index_lock:
+            if self._directories is not None:
+                if now - self._checked < INDEX_CHECK_INTERVAL:
+                    return
+                self._checked = now
+                if now - self._scanned < INDEX_MAX_AGE and all(
+                    _mtime(directory) == mtime
+                    for directory, mtime in self._directories.items()
+                ):
+                    return
+            directories = {}
+            for directory, _, files in os.walk(self.root):
+                directories[directory] = _mtime(directory)
+                for name in files:
+                    self.get(Path(directory) / name)
+            self._directories = directories
+            self._scanned = self._checked = now
+
+    def read(self, image):
+        with self._lock:
+            if (data := self._data.get(image.digest)) is not None:
+                self._data.move_to_end(image.digest)
+                return data
+        with open(image.path, "rb") as f:
+            data = f.read()
+        self._remember(image, data)
+        return data
+
+    def _remember(self, image, data):
+        if len(data) > self.max_item_size:
+            return
+        with self._lock:
+            if image.digest in self._data:
+                return
+            self._data[image.digest] = data
+            self._data_size += len(data)
+            while self._data_size > self.cache_size:
+                _, evicted = self._data.popitem(last=False)
+                self._data_size -= len(evicted)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+image_store = ImageStore(
+    settings.BASE_DIR / "lib" / "images",
+    cache_size=settings.IMAGE_CACHE_SIZE,
+    max_item_size=settings.IMAGE_CACHE_MAX_ITEM_SIZE,
+    sendfile_root=settings.IMAGE_SENDFILE_ROOT,
+)
+
+
+def event_image(event):
+    """
+    Returns the display Image of an event, or None.
+    """
+    if not event.display_image:
+        return None
+    return image_store.get(
+        os.path.join("lib", "images", "event_images", event.display_image)
+    )
+
+
+def image_url(image, request=None):
+    """
+    Returns the content-hashed URL of an Image.
+
+    Args:
+        image: The Image, or None.
+        request: If given, the URL is made absolute.
+    """
+    if image is None:
+        return None
+    return request.build_absolute_uri(image.url) if request else image.url
+
+
+def serve_image(request, image, cache_control=REVALIDATE):
+    """
+    Returns a response for an image, or 304 if the client's copy is current.
+
+    Args:
+        request: The request object.
+        image: The Image to serve.
+        cache_control: Cache-Control directives for the response.
+    """
+    if image.etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    elif header := settings.IMAGE_SENDFILE_HEADER:
+        response = HttpResponse(content_type=image.content_type)
+        if header == "X-Accel-Redirect":
+            location = image.path.relative_to(image.store.root).as_posix()
+            response[header] = image.store.sendfile_root + location
+        else:
+            response[header] = str(image.path)
+    elif image.size <= image.store.max_item_size:
+        response = HttpResponse(
+            image.store.read(image), content_type=image.content_type
+        )
+    else:
+        response = FileResponse(open(image.path, "rb"), content_type=image.content_type)
+
+    response["ETag"] = image.etag
+    response["Content-Disposition"] = f"inline; filename={image.name}"
+    patch_cache_control(response, **cache_control)
+    return response
@@ -0,0 +1,213 @@
+"""
+A small implementation of JSON Patch (RFC 6902) for binder documents.
+"""
+
+import copy
+
+
+class JsonPatchError(ValueError):
+    pass
+
+
+class JsonPatchConflict(JsonPatchError):
+    """
+    Raised when a "test" operation does not match the document.
+    """
+
+
+def _parse_pointer(pointer):
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == "":
+        return []
+    return [
+        part.replace("~1", "/").replace("~0", "~") for part in pointer.split("/")[1:]
+    ]
+
+
+def _index(container, part, allow_end=False):
+    if part == "-" and allow_end:
+        return len(container)
+    if not (part.isascii() and part.isdigit()) or (
+        part != "0" and part.startswith("0")
+    ):
+        raise JsonPatchError(f"Invalid array index: {part!r}")
+    index = int(part)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {part}")
+    return index
+
+
+def _resolve(document, parts):
+    for part in parts:
+        if isinstance(document, dict):
+            if part not in document:
+                raise JsonPatchError(f"Path not found: {part!r}")
+            document = document[part]
+        elif isinstance(document, list):
+            document = document[_index(document, part)]
+        else:
+            raise JsonPatchError(f"Cannot traverse into {type(document).__name__}")
+    return document
+
+
+def _get(document, path):
+    return _resolve(document, _parse_pointer(path))
+
+
+def _add(document, path, value):
+    parts = _parse_pointer(path)
+    if not parts:
+        return value
+    parent = _resolve(document, parts[:-1])
+    if isinstance(parent, dict):
+        parent[parts[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, parts[-1], allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to {type(parent).__name__}")
+    return document
+
+
+def _remove(document, path):
+    parts = _parse_pointer(path)
+    if not parts:
+        raise JsonPatchError("Cannot remove the document root")
+    parent = _resolve(document, parts[:-1])
+    if isinstance(parent, dict):
+        if parts[-1] not in parent:
+            raise JsonPatchError(f"Path not found: {path!r}")
+        return document, parent.pop(parts[-1])
+    if isinstance(parent, list):
+        return document, parent.pop(_index(parent, parts[-1]))
+    raise JsonPatchError(f"Cannot remove from {type(parent).__name__}")
+
+
+def _replace(document, path, value):
+    parts = _parse_pointer(path)
+    if not parts:
+        return value
+    parent = _resolve(document, parts[:-1])
+    if isinstance(parent, dict):
+        if parts[-1] not in parent:
+            raise JsonPatchError(f"Path not found: {path!r}")
+        parent[parts[-1]] = value
+    elif isinstance(parent, list):
+        parent[_index(parent, parts[-1])] = value
+    else:
+        raise JsonPatchError(f"Cannot replace in {type(parent).__name__}")
+    return document
+
+
+def apply_patch(document, operations, in_place=False):
+    """
+    Applies a list of JSON Patch operations to a document.
+
+    Args:
+        document: The parsed JSON document.
+        operations: A list of RFC 6902 operation objects.
+        in_place: Modify the document directly instead of patching a copy.
+
+    Returns:
+        The patched document.
+
+    Raises:
+        JsonPatchError: If an operation is malformed or cannot be applied.
+        JsonPatchConflict: If a "test" operation fails.
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A patch must be a list of operations")
+    if not in_place:
+        document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or "path" not in operation:
+            raise JsonPatchError(f"Invalid operation: {operation!r}")
+        op, path = operation.get("op"), operation["path"]
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise JsonPatchError(f"Operation {op!r} requires a value")
+        if op in ("move", "copy") and "from" not in operation:
+            raise JsonPatchError(f"Operation {op!r} requires 'from'")
+
+        if op == "add":
+            document = _add(document, path, copy.deepcopy(operation["value"]))
+        elif op == "remove":
+            document, _ = _remove(document, path)
+        elif op == "replace":
+            document = _replace(document, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            source = operation["from"]
+            source_parts, parts = _parse_pointer(source), _parse_pointer(path)
+            if (
+                len(parts) > len(source_parts)
+                and parts[: len(source_parts)] == source_parts
+            ):
+                raise JsonPatchError("Cannot move a value into one of its children")
+            document, value = _remove(document, source)
+            document = _add(document, path, value)
+        elif op == "copy":
+            value = copy.deepcopy(_get(document, operation["from"]))
+            document = _add(document, path, value)
+        elif op == "test":
+            if _get(document, path) != operation["value"]:
+                raise JsonPatchConflict(f"Test failed at {path!r}")
+        else:
+            raise JsonPatchError(f"Unknown operation: {op!r}")
+    return document
+
+
+def _escape(key):
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _diff(source, target, path, operations):
+    if isinstance(source, dict) and isinstance(target, dict):
+        for key in source:
+            if key not in target:
+                operations.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in target.items():
+            if key not in source:
+                operations.append(
+                    {"op": "add", "path": f"{path}/{_escape(key)}", "value": value}
+                )
+            elif source[key] != value or type(source[key]) is not type(value):
+                _diff(source[key], value, f"{path}/{_escape(key)}", operations)
+    elif isinstance(source, list) and isinstance(target, list):
+        # Skip the common start and end, so inserting or removing an item
+        # doesn't shift and rewrite every item after it
+        start, source_end, target_end = 0, len(source), len(target)
+        while start < min(source_end, target_end) and source[start] == target[start]:
+            start += 1
+        while (
+            source_end > start
+            and target_end > start
+            and source[source_end - 1] == target[target_end - 1]
+        ):
+            source_end -= 1
+            target_end -= 1
+        common = min(source_end, target_end) - start
+        for i in range(start, start + common):
+            _diff(source[i], target[i], f"{path}/{i}", operations)
+        for i in range(source_end - 1, start + common - 1, -1):
+            operations.append({"op": "remove", "path": f"{path}/{i}"})
+        for i in range(start + common, target_end):
+            operations.append({"op": "add", "path": f"{path}/{i}", "value": target[i]})
+    elif source != target or type(source) is not type(target):
+        operations.append({"op": "replace", "path": path, "value": target})
+
+
+def make_patch(source, target):
+    """
+    Returns the JSON Patch operations that turn one document into another.
+
+    Args:
+        source: The original parsed JSON document.
+        target: The changed parsed JSON document.
+
+    Returns:
+        list: RFC 6902 operations, which apply_patch applies to `source`.
+        Values nested in equal lists or objects are compared with ==, so a
+        change between e.g. 1 and true inside them is not detected.
+    """
+    operations = []
+    _diff(source, target, "", operations)
+    return operations
@@ -0,0 +1,420 @@
+"""
+Seeded test data and scripted scenarios for benchmarking the API, used by the
+bench_api and seed_data commands.
+
+Scenarios replay what the front end does through Django's test client, so
+requests go through all middleware and views without a server. The latency
+and the database queries of every request are recorded per scenario step,
+and summaries can be saved as JSON baselines and compared against later runs.
+"""
+
+import json
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from app.models import (
+    BinderAccess,
+    BinderModel,
+    EventModel,
+    User,
+    get_random_profile_picture,
+)
+from .access import SHARED
+from .images import event_image
+
+
+def make_document(paragraphs, label=""):
+    """
+    Returns an editor document of `paragraphs` paragraphs of about 170 bytes.
+    """
+    return {
+        "type": "doc",
+        "content": [
+            {
+                "type": "paragraph",
+                "content": [{"type": "text", "text": f"{label} Paragraph {i} " * 12}],
+            }
+            for i in range(paragraphs)
+        ],
+    }
+
+
+class Dataset:
+    """
+    The users, events and binders created by seed().
+    """
+
+    def __init__(self):
+        self.users = []
+        self.tokens = {}
+        self.events = []
+        # user id -> ids of the binders the user owns or that are shared
+        self.accessible = defaultdict(list)
+        # binder id -> its document as last saved by a scenario
+        self.documents = {}
+        self.versions = {}
+        self._clients = {}
+
+    def client(self, user):
+        """
+        Returns a test client authenticated as a user.
+        """
+        if (client := self._clients.get(user.pk)) is None:
+            client = self._clients[user.pk] = Client(
+                headers={"Authorization": f"Token {self.tokens[user.pk]}"}
+            )
+        return client
+
+
+def seed(
+    users=50,
+    binders=300,
+    shares=2,
+    paragraphs=20,
+    large=0.05,
+    large_paragraphs=2000,
+    events=0,
+    prefix="bench",
+    seed=0,
+):
+    """
+    Creates users with tokens and chosen events, a binder for each chosen
+    event, and shares binders between the users.
+
+    Args:
+        users: The number of users.
+        binders: The number of binders, at most one per user and event.
+        shares: The average number of users each binder is shared with.
+        paragraphs: The size of binder documents, in paragraphs.
+        large: The fraction of binders that get large documents.
+        large_paragraphs: The size of large documents, in paragraphs.
+        events: The number of events to create on top of the existing ones.
+        prefix: The prefix of the usernames.
+        seed: The seed of the random choices, so the same arguments always
+            create the same data.
+
+    Returns:
+        Dataset: The created data.
+    """
+    rng = random.Random(seed)
+    data = Dataset()
+    with transaction.atomic():
+        EventModel.objects.bulk_create(
+            EventModel(
+                name=f"{prefix} event {i}",
+                materialtype=rng.choice(["Binder", "Cheatsheet"]),
+                division=rng.choice(["B", "C"]),
+            )
+            for i in range(events)
+        )
+        data.events = list(EventModel.objects.order_by("id"))
+        if binders > users * len(data.events):
+            raise ValueError(
+                f"{users} users can have at most {users * len(data.events)} binders"
+            )
+
+        # Hashing a password per user would take most of the time
+        password = make_password(None)
+        data.users = User.objects.bulk_create(
+            User(
+                username=f"{prefix}-{i}",
+                password=password,
+                profile_picture=get_random_profile_picture(),
+            )
+            for i in range(users)
+        )
+        tokens = Token.objects.bulk_create(
+            Token(key=Token.generate_key(), user=user) for user in data.users
+        )
+        data.tokens = {token.user_id: token.key for token in tokens}
+
+        # Spread the binders evenly over the users
+        chosen = User.chosen_events.through
+        chosen_rows, owned = [], []
+        for i, user in enumerate(data.users):
+            count = binders // users + (i < binders % users)
+            for event in rng.sample(data.events, count):
+                chosen_rows.append(chosen(user_id=user.pk, eventmodel_id=event.pk))
+                size = large_paragraphs if rng.random() < large else paragraphs
+                document = make_document(size, label=f"{user.username} {event.name}")
+                binder = BinderModel.objects.create(
+                    owner=user, event=event, content=json.dumps(document)
+                )
+                owned.append(binder)
+                data.accessible[user.pk].append(binder.pk)
+                data.documents[binder.pk] = document
+                data.versions[binder.pk] = binder.version
+        chosen.objects.bulk_create(chosen_rows)
+
+        shared = BinderModel.shared_with.through
+        shared_rows, access_rows = [], []
+        others = {user.pk: [u for u in data.users if u != user] for user in data.users}
+        for binder in owned:
+            candidates = others[binder.owner_id]
+            count = min(rng.randint(0, 2 * shares), len(candidates))
+            for other in rng.sample(candidates, count):
+                shared_rows.append(shared(bindermodel_id=binder.pk, user_id=other.pk))
+                access_rows.append(
+                    BinderAccess(user_id=other.pk, binder_id=binder.pk, role=SHARED)
+                )
+                data.accessible[other.pk].append(binder.pk)
+        # bulk_create() skips the signals that maintain BinderAccess
+        shared.objects.bulk_create(shared_rows)
+        BinderAccess.objects.bulk_create(access_rows)
+    return data
+
+
+class Recorder:
+    """
+    Makes requests and records their latency and database queries per step.
+    """
+
+    def __init__(self):
+        # step -> [(seconds, queries)]
+        self.samples = defaultdict(list)
+
+    def request(self, step, client, method, path, data=None, ok=(200,), **extra):
+        """
+        Makes a request with the test client and records it under `step`.
+
+        Args:
+            step: The name the request is recorded under.
+            client: The test client.
+            method: The lowercase HTTP method, e.g. "get".
+            path: The path to request.
+            data: The JSON body, for methods with one.
+            ok: The expected status codes.
+            **extra: Further arguments for the client, e.g. headers.
+
+        Returns:
+            HttpResponse: The response.
+
+        Raises:
+            RuntimeError: If the status code isn't in `ok`.
+        """
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        if data is not None:
+            extra.update(data=json.dumps(data), content_type="application/json")
+        start = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = getattr(client, method)(path, **extra)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+        if response.status_code not in ok:
+            raise RuntimeError(
+                f"{method.upper()} {path} returned {response.status_code}"
+            )
+        self.samples[step].append((elapsed, queries))
+        return response
+
+
+def dashboard(recorder, data, rng):
+    """
+    A user opens the dashboard: the requests of a page load, and the single
+    bootstrap request that replaces them.
+    """
+    user = rng.choice(data.users)
+    client = data.client(user)
+    for path in ("/api/user/", "/api/user-events/", "/api/events/", "/api/binders/"):
+        recorder.request(f"dashboard GET {path}", client, "get", path)
+    recorder.request("dashboard GET /api/bootstrap/", client, "get", "/api/bootstrap/")
+
+
+def autosave(recorder, data, rng):
+    """
+    A user types in a binder: a burst of saves of the whole document,
+    followed by a burst of JSON Patch saves.
+    """
+    user = rng.choice([user for user in data.users if data.accessible[user.pk]])
+    client = data.client(user)
+    binder_id = rng.choice(data.accessible[user.pk])
+    document = data.documents[binder_id]
+    paragraphs = document["content"]
+    for i in range(5):
+        paragraphs[rng.randrange(len(paragraphs))]["content"][0]["text"] = f"Edit {i}"
+        recorder.request(
+            "autosave PATCH /api/binders/<pk>/",
+            client,
+            "patch",
+            f"/api/binders/{binder_id}/",
+            {"content": json.dumps(document)},
+        )
+        data.versions[binder_id] += 1
+    for i in range(5):
+        index = rng.randrange(len(paragraphs))
+        paragraphs[index]["content"][0]["text"] = f"Patch {i}"
+        patch = {
+            "version": data.versions[binder_id],
+            "patch": [
+                {
+                    "op": "replace",
+                    "path": f"/content/{index}/content/0/text",
+                    "value": f"Patch {i}",
+                }
+            ],
+        }
+        response = recorder.request(
+            "autosave PATCH /api/binders/<pk>/content/",
+            client,
+            "patch",
+            f"/api/binders/{binder_id}/content/",
+            patch,
+            ok=(200, 409),
+        )
+        # Another user saved the binder, patch the latest version like the
+        # editor would
+        data.versions[binder_id] = response.json()["version"]
+        if response.status_code == 409:
+            patch["version"] = data.versions[binder_id]
+            response = recorder.request(
+                "autosave PATCH /api/binders/<pk>/content/",
+                client,
+                "patch",
+                f"/api/binders/{binder_id}/content/",
+                patch,
+            )
+            data.versions[binder_id] = response.json()["version"]
+
+
+def set_events_churn(recorder, data, rng):
+    """
+    A user changes their events, archiving and restoring binders.
+    """
+    user = rng.choice(data.users)
+    events = rng.sample(data.events, rng.randint(1, min(len(data.events), 10)))
+    recorder.request(
+        "set_events POST /api/event-set/",
+        data.client(user),
+        "post",
+        "/api/event-set/",
+        {"events": [event.pk for event in events]},
+    )
+
+
+def image_fetches(recorder, data, rng):
+    """
+    A user's binder cards load their event images, by binder and by the
+    content-hashed URLs of the binder list, and revalidate them.
+    """
+    user = rng.choice([user for user in data.users if data.accessible[user.pk]])
+    client = data.client(user)
+    binder_id = rng.choice(data.accessible[user.pk])
+    # Binders of events the user dropped are archived
+    recorder.request(
+        "images GET /api/get_binder_image/<pk>/",
+        client,
+        "get",
+        f"/api/get_binder_image/{binder_id}/",
+        ok=(200, 404),
+    )
+    if image := event_image(rng.choice(data.events)):
+        response = recorder.request(
+            "images GET /api/images/<digest>/<name>", client, "get", image.url
+        )
+        recorder.request(
+            "images GET /api/images/<digest>/<name> (revalidated)",
+            client,
+            "get",
+            image.url,
+            ok=(304,),
+            headers={"If-None-Match": response["ETag"]},
+        )
+
+
+SCENARIOS = {
+    "dashboard": dashboard,
+    "autosave": autosave,
+    "set_events": set_events_churn,
+    "images": image_fetches,
+}
+
+
+def run(data, scenarios, iterations, warmup=10, seed=0):
+    """
+    Runs scenarios one after another.
+
+    Args:
+        data: The Dataset from seed().
+        scenarios: The names of the scenarios in SCENARIOS.
+        iterations: The number of times each scenario is run.
+        warmup: The number of unrecorded runs of each scenario before them.
+        seed: The seed of the random choices.
+
+    Returns:
+        Recorder: The recorded requests.
+    """
+    rng = random.Random(seed)
+    recorder = Recorder()
+    for name in scenarios:
+        for _ in range(warmup):
+            SCENARIOS[name](Recorder(), data, rng)
+        for _ in range(iterations):
+            SCENARIOS[name](recorder, data, rng)
+    return recorder
+
+
+def summarize(recorder):
+    """
+    Returns the latency percentiles, in milliseconds, and the queries per
+    request of every step.
+    """
+    summary = {}
+    for step, samples in recorder.samples.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in samples)
+        queries = [count for _, count in samples]
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        else:
+            percentiles = latencies * 99
+        summary[step] = {
+            "requests": len(samples),
+            "p50": round(percentiles[49], 3),
+            "p95": round(percentiles[94], 3),
+            "p99": round(percentiles[98], 3),
+            "queries": round(statistics.mean(queries), 2),
+            "max_queries": max(queries),
+        }
+    return summary
+
+
+def compare(baseline, summary, threshold=0.25):
+    """
+    Compares a summary against a baseline.
+
+    Args:
+        baseline: The summary of an earlier run.
+        summary: The summary of this run.
+        threshold: The relative increase in p95 latency that counts as a
+            regression. Any increase in queries per request does.
+
+    Returns:
+        list: (step, metric, baseline value, new value, is regression) for
+        the steps in both.
+    """
+    rows = []
+    for step, new in summary.items():
+        if (old := baseline.get(step)) is None:
+            continue
+        for metric in ("p50", "p95", "p99", "queries"):
+            if metric == "queries":
+                regression = new[metric] > old[metric]
+            elif metric == "p95":
+                regression = new[metric] > old[metric] * (1 + threshold)
+            else:
+                regression = False
+            rows.append((step, metric, old[metric], new[metric], regression))
+    return rows
@@ -0,0 +1,264 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+MetricsMiddleware (app/middleware.py) records the latency, database queries
+and response size of every request per route. Queries are counted by an
+execute wrapper installed on every database connection, which records into
+the stats of the request being handled, found through a context variable, so
+queries the async ORM runs in another thread are counted too. Each process
+keeps its own metrics.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# SQL statements kept per request for slow request logs
+MAX_STATEMENTS = 200
+
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = []
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper recording queries into the stats of the current request.
+    """
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.query_time += elapsed
+        if len(stats.statements) < MAX_STATEMENTS:
+            stats.statements.append((elapsed, sql))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Adds record_query to a new database connection, connected to the
+    connection_created signal.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_request():
+    """
+    Starts recording the queries of a request.
+
+    Returns:
+        tuple: The request's stats and the token to pass to finish_request().
+    """
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def route_name(request):
+    """
+    Returns the URL pattern that matched a request, e.g. api/binders/<pk>/, so
+    requests for different objects are counted together.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None or match.route is None:
+        return "unmatched"
+    return clean_route(match.route)
+
+
+def clean_route(route):
+    """
+    Returns a URL pattern with the groups of regular expression patterns, like
+    the router's, written like path() converters.
+    """
+    route = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"<\1>", route)
+    return route.replace("^", "").replace("$", "")
+
+
+class RouteMetrics:
+    __slots__ = (
+        "count",
+        "duration",
+        "buckets",
+        "statuses",
+        "queries",
+        "query_time",
+        "bytes",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.statuses = {}
+        self.queries = 0
+        self.query_time = 0.0
+        self.bytes = 0
+
+    def copy(self):
+        copy = RouteMetrics()
+        for name in self.__slots__:
+            setattr(copy, name, getattr(self, name))
+        copy.buckets, copy.statuses = list(self.buckets), dict(self.statuses)
+        return copy
+
+
+class Registry:
+    """
+    Aggregates request metrics per method and route.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._slow_logged = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, duration, stats, size):
+        """
+        Records a finished request.
+
+        Args:
+            method: The HTTP method.
+            route: The matched route, see route_name().
+            status: The response status code.
+            duration: The seconds the request took.
+            stats: The request's RequestStats.
+            size: The response body size in bytes, or None if it is streamed.
+        """
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.count += 1
+            metrics.duration += duration
+            metrics.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.queries += stats.queries
+            metrics.query_time += stats.query_time
+            metrics.bytes += size or 0
+
+        if duration >= settings.METRICS["SLOW_REQUEST"]:
+            self.log_slow(method, route, duration, stats)
+
+    def log_slow(self, method, route, duration, stats):
+        """
+        Logs a slow request with its slowest queries, at most once per route
+        every METRICS["SLOW_LOG_INTERVAL"] seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._slow_logged.get((method, route))
+            if last is not None and now - last < settings.METRICS["SLOW_LOG_INTERVAL"]:
+                return
+            self._slow_logged[(method, route)] = now
+        slowest = sorted(stats.statements, key=lambda s: s[0], reverse=True)[:5]
+        logger.warning(
+            "Slow request %s %s took %.3fs with %d queries (%.3fs)%s",
+            method,
+            route,
+            duration,
+            stats.queries,
+            stats.query_time,
+            "".join(f"\n  {elapsed:.4f}s {sql}" for elapsed, sql in slowest),
+        )
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text format.
+        """
+        with self._lock:
+            routes = [(key, m.copy()) for key, m in sorted(self._routes.items())]
+
+        lines = []
+
+        def metric(name, kind, text, values):
+            lines.extend([f"# HELP {name} {text}", f"# TYPE {name} {kind}"])
+            for suffix, labels, value in values:
+                labels = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+                lines.append(f"{name}{suffix}{{{labels}}} {value}")
+
+        metric(
+            "scibind_http_requests_total",
+            "counter",
+            "Requests by route and status.",
+            [
+                ("", {"method": method, "route": route, "status": status}, count)
+                for (method, route), m in routes
+                for status, count in sorted(m.statuses.items())
+            ],
+        )
+        histogram = []
+        for (method, route), m in routes:
+            labels = {"method": method, "route": route}
+            cumulative = 0
+            for bound, observed in zip(BUCKETS + ("+Inf",), m.buckets):
+                cumulative += observed
+                histogram.append(("_bucket", {**labels, "le": bound}, cumulative))
+            histogram.append(("_sum", labels, f"{m.duration:.6f}"))
+            histogram.append(("_count", labels, m.count))
+        metric(
+            "scibind_http_request_duration_seconds",
+            "histogram",
+            "Request latency.",
+            histogram,
+        )
+        for name, text, value in [
+            ("scibind_db_queries_total", "Database queries.", lambda m: m.queries),
+            (
+                "scibind_db_query_duration_seconds_total",
+                "Time spent in database queries.",
+                lambda m: f"{m.query_time:.6f}",
+            ),
+            (
+                "scibind_http_response_bytes_total",
+                "Response body bytes, excluding streamed responses.",
+                lambda m: m.bytes,
+            ),
+        ]:
+            metric(
+                name,
+                "counter",
+                text,
+                [
+                    ("", {"method": method, "route": route}, value(m))
+                    for (method, route), m in routes
+                ],
+            )
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._slow_logged.clear()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
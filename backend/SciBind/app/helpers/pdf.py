@@ -0,0 +1,524 @@
+"""
+Paginated PDF rendering of binder documents.
+
+Documents are laid out in DejaVu Sans Mono (lib/fonts), whose glyphs all have
+the same width, so text can be wrapped and measured by counting characters.
+The laid out pages are drawn with fpdf2, which embeds the fonts subset to the
+glyphs a document uses, so any text they cover prints, including Greek
+letters, math symbols and subscripts. Italics are the regular fonts slanted.
+Images are drawn scaled to fit the column, from data a loader passed to
+render_pdf() returns for their URLs. This module doesn't use Django, so it
+can run in worker processes.
+"""
+
+import unicodedata
+from dataclasses import dataclass, field
+from functools import cache
+from io import BytesIO
+from pathlib import Path
+
+from fontTools.ttLib import TTFont
+from fpdf import FPDF
+from PIL import Image, ImageOps
+
+# US Letter, matching the editor's page size, in points
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+# Glyph width of the fonts as a fraction of the font size
+CHAR_WIDTH = 1233 / 2048
+LINE_HEIGHT = 1.2
+
+FONT_DIR = Path(__file__).resolve().parents[2] / "lib" / "fonts"
+FONT_FAMILY = "DejaVuSansMono"
+# The font file of each fpdf2 style, italics are slanted
+FONT_FILES = {
+    "": "DejaVuSansMono.ttf",
+    "B": "DejaVuSansMono-Bold.ttf",
+}
+
+# Horizontal shear of slanted text, in degrees
+SLANT = 12
+
+# Image sizes are given in CSS pixels, 96 per inch
+POINTS_PER_PIXEL = 0.75
+# Larger images are downscaled before they are embedded
+MAX_IMAGE_PIXELS = 2000
+
+HEADING_SCALE = {1: 1.6, 2: 1.35, 3: 1.15}
+
+
+class PageLimitExceeded(Exception):
+    """
+    Raised when a document doesn't fit in the pages allowed for it.
+    """
+
+
+class UnsupportedCharacters(Exception):
+    """
+    Raised when a document has characters the fonts don't have glyphs for.
+    """
+
+
+@dataclass(frozen=True)
+class Layout:
+    """
+    How a kind of material is laid out.
+
+    Args:
+        font_sizes: The body font sizes to try, largest first. The first size
+            at which the document fits in max_pages is used.
+        margin: The page margin in points.
+        columns: The number of text columns per page.
+        max_pages: The maximum number of pages, or None.
+        page_numbers: Whether to print page numbers in the bottom margin.
+    """
+
+    font_sizes: tuple
+    margin: float
+    columns: int = 1
+    max_pages: int = None
+    page_numbers: bool = True
+
+
+LAYOUTS = {
+    "Binder": Layout(font_sizes=(11,), margin=54),
+    # Cheat sheets are limited to one double-sided sheet, so the text is
+    # shrunk as far as is still legible to make it fit
+    "Cheatsheet": Layout(
+        font_sizes=(9, 8, 7.5, 7, 6.5, 6, 5.5, 5),
+        margin=18,
+        columns=2,
+        max_pages=2,
+        page_numbers=False,
+    ),
+}
+
+
+@dataclass
+class Line:
+    size: float
+    indent: float = 0
+    # (font, text, underline) runs, where a font is a (bold, italic) pair
+    runs: list = field(default_factory=list)
+    space_before: float = 0
+    rule: bool = False
+    # (PDFImage, width, height) of a line that is an image
+    image: tuple = None
+
+    @property
+    def height(self):
+        return self.image[2] if self.image else self.size * LINE_HEIGHT
+
+
+@dataclass
+class Block:
+    """
+    A paragraph-like node, with its text as (bold, italic, underline, text)
+    runs that are wrapped into lines.
+    """
+
+    runs: list
+    scale: float = 1
+    bold: bool = False
+    indent: int = 0
+    prefix: str = ""
+    space_before: float = 0.5
+    rule: bool = False
+    # The URL of an image block
+    image: str = None
+
+
+@dataclass
+class PDFImage:
+    """
+    An image prepared for embedding.
+    """
+
+    # A Pillow image, or a BytesIO holding a JPEG file
+    data: object
+    # The size the image is shown at, in points
+    natural_width: float
+    natural_height: float
+
+
+def _clean_text(text):
+    # Composed characters take one column, and invisible control and format
+    # characters (e.g. soft hyphens) take none
+    return "".join(
+        char
+        for char in unicodedata.normalize("NFC", text)
+        if char in "\n\t" or unicodedata.category(char) not in ("Cc", "Cf")
+    )
+
+
+def _image_placeholder(node):
+    return f"[image: {(node.get('attrs') or {}).get('alt') or 'image'}]"
+
+
+def _text_runs(node, bold=False, italic=False, underline=False):
+    if node.get("type") == "text":
+        marks = {mark.get("type") for mark in node.get("marks") or []}
+        yield (
+            bold or "bold" in marks,
+            italic or "italic" in marks,
+            underline or "underline" in marks or "link" in marks,
+            _clean_text(node.get("text", "")),
+        )
+    elif node.get("type") == "hardBreak":
+        yield (bold, italic, underline, "\n")
+    elif node.get("type") == "image":
+        # Images inside text
+        yield (bold, True, underline, _image_placeholder(node))
+    else:
+        for child in node.get("content") or []:
+            yield from _text_runs(child, bold, italic, underline)
+
+
+def _blocks(node, indent=0, prefix=""):
+    """
+    Flattens a Tiptap/ProseMirror node into Blocks.
+    """
+    kind = node.get("type")
+    children = node.get("content") or []
+    if kind == "heading":
+        level = (node.get("attrs") or {}).get("level", 1)
+        yield Block(
+            list(_text_runs(node)),
+            scale=HEADING_SCALE.get(level, 1),
+            bold=True,
+            indent=indent,
+            space_before=1,
+        )
+    elif kind in ("paragraph", "codeBlock"):
+        yield Block(list(_text_runs(node)), indent=indent, prefix=prefix)
+    elif kind == "horizontalRule":
+        yield Block([], rule=True)
+    elif kind in ("bulletList", "orderedList"):
+        start = (node.get("attrs") or {}).get("start", 1)
+        for i, item in enumerate(children):
+            marker = "• " if kind == "bulletList" else f"{start + i}. "
+            yield from _blocks(item, indent + 1, marker)
+    elif kind == "listItem":
+        for i, child in enumerate(children):
+            yield from _blocks(child, indent, prefix if i == 0 else "")
+    elif kind == "blockquote":
+        for child in children:
+            yield from _blocks(child, indent + 1)
+    elif kind == "table":
+        for row in children:
+            cells = [list(_text_runs(cell)) for cell in row.get("content") or []]
+            runs = []
+            for cell in cells:
+                if runs:
+                    runs.append((False, False, False, " | "))
+                runs.extend(cell)
+            yield Block(runs, bold=row is children[0], indent=indent)
+    elif kind == "image":
+        src = (node.get("attrs") or {}).get("src")
+        if isinstance(src, str) and src:
+            yield Block(
+                [(False, True, False, _image_placeholder(node))],
+                indent=indent,
+                image=src,
+            )
+    elif kind == "text":
+        yield Block(list(_text_runs(node)), indent=indent)
+    else:
+        for child in children:
+            yield from _blocks(child, indent, prefix)
+
+
+def _merge(runs):
+    # Joins neighbouring runs in the same style, so they are drawn at once
+    merged = []
+    for font, text, underline in runs:
+        if merged and merged[-1][0] == font and merged[-1][2] == underline:
+            merged[-1] = (font, merged[-1][1] + text, underline)
+        else:
+            merged.append((font, text, underline))
+    return merged
+
+
+def _wrap(block, size, width):
+    """
+    Wraps a block into Lines that fit in a column `width` points wide.
+    """
+    size = size * block.scale
+    indent = block.indent * 2 * CHAR_WIDTH * size
+    if block.rule:
+        return [Line(size, space_before=block.space_before * size, rule=True)]
+    columns = max(1, int((width - indent) / (CHAR_WIDTH * size)))
+
+    # Split the runs into words, keeping their style
+    words, word = [], []
+    runs = [(False, False, False, block.prefix)] if block.prefix else []
+    for bold, italic, underline, text in runs + block.runs:
+        font = (bold or block.bold, italic)
+        for i, part in enumerate(text.replace("\t", "    ").split("\n")):
+            if i:
+                words.append(word)
+                words.append(None)  # Line break
+                word = []
+            for j, piece in enumerate(part.split(" ")):
+                if j:
+                    words.append(word)
+                    word = []
+                if piece:
+                    word.append((font, piece, underline))
+    words.append(word)
+
+    lines, line, length = [], [], 0
+    for word in words:
+        if word is None:
+            lines.append(line)
+            line, length = [], 0
+            continue
+        word_length = sum(len(text) for _, text, _ in word)
+        if not word_length:
+            continue
+        if line and length + 1 + word_length > columns:
+            lines.append(line)
+            line, length = [], 0
+        if word_length > columns:
+            # Break words longer than a line
+            text = "".join(text for _, text, _ in word)
+            font, underline = word[0][0], word[0][2]
+            if line:
+                lines.append(line)
+                line, length = [], 0
+            while len(text) > columns:
+                lines.append([(font, text[:columns], underline)])
+                text = text[columns:]
+            word, word_length = [(font, text, underline)], len(text)
+        if line:
+            line.append((line[-1][0], " ", False))
+            length += 1
+        line.extend(word)
+        length += word_length
+    lines.append(line)
+
+    result = [Line(size, indent, _merge(runs)) for runs in lines]
+    result[0].space_before = block.space_before * size
+    return result
+
+
+def _image_line(block, image, size, width, height):
+    """
+    Returns the Line of an image block, scaled down to fit in a column
+    `width` by `height` points.
+    """
+    indent = block.indent * 2 * CHAR_WIDTH * size
+    scale = min(
+        1,
+        (width - indent) / image.natural_width,
+        height / image.natural_height,
+    )
+    return Line(
+        size,
+        indent,
+        space_before=block.space_before * size,
+        image=(image, image.natural_width * scale, image.natural_height * scale),
+    )
+
+
+def paginate(document, layout, size, images=None):
+    """
+    Lays a document out on pages.
+
+    Args:
+        images: The PDFImages of image URLs. Other images are shown as their
+            alt text.
+
+    Returns:
+        list: The pages, each a list of columns, each a list of
+        (y, Line) pairs.
+    """
+    images = images or {}
+    column_width = (
+        PAGE_WIDTH - 2 * layout.margin - (layout.columns - 1) * layout.margin
+    ) / layout.columns
+    top = PAGE_HEIGHT - layout.margin
+    bottom = layout.margin + (size * LINE_HEIGHT if layout.page_numbers else 0)
+
+    pages, column, y = [[[]]], [], top
+    pages[0][0] = column
+    for block in _blocks(document):
+        if block.image in images:
+            lines = [
+                _image_line(
+                    block, images[block.image], size, column_width, top - bottom
+                )
+            ]
+        else:
+            lines = _wrap(block, size, column_width)
+        for line in lines:
+            height = line.height
+            space = line.space_before if column else 0
+            if y - space - height < bottom:
+                if len(pages[-1]) == layout.columns:
+                    pages.append([])
+                    if layout.max_pages and len(pages) > layout.max_pages:
+                        raise PageLimitExceeded(
+                            f"Doesn't fit in {layout.max_pages} pages at {size}pt"
+                        )
+                column = []
+                pages[-1].append(column)
+                y, space = top, 0
+            y -= space + height
+            column.append((y, line))
+    return pages
+
+
+@cache
+def _cmap(style):
+    # The characters a font has glyphs for
+    cmap = TTFont(FONT_DIR / FONT_FILES[style], lazy=True).getBestCmap()
+    return frozenset(map(chr, cmap))
+
+
+def prepare_image(data):
+    """
+    Decodes an image file for embedding.
+
+    Args:
+        data: The bytes of the file, in a format Pillow reads.
+
+    Returns:
+        PDFImage: The image, or None if it can't be decoded.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+    except Exception:
+        return None
+    jpeg = image.format == "JPEG"
+    natural_width = image.width * POINTS_PER_PIXEL
+    natural_height = image.height * POINTS_PER_PIXEL
+    image = ImageOps.exif_transpose(image)
+    gray = image.mode in ("1", "L", "LA")
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("LA" if gray else "RGBA")
+    else:
+        image = image.convert("L" if gray else "RGB")
+    image.thumbnail((MAX_IMAGE_PIXELS, MAX_IMAGE_PIXELS))
+    if jpeg:
+        # Photos stay JPEGs, which fpdf2 embeds without decoding them again
+        output = BytesIO()
+        image.save(output, "JPEG", quality=90)
+        image = output
+    return PDFImage(image, natural_width, natural_height)
+
+
+def write_pdf(pages, layout):
+    """
+    Returns the bytes of a PDF file showing the pages from paginate().
+
+    Raises:
+        UnsupportedCharacters: If the pages have characters the fonts don't
+            have.
+    """
+    # Laid out from the bottom of the page, like PDF, while fpdf2 measures
+    # from the top
+    pdf = FPDF(unit="pt", format=(PAGE_WIDTH, PAGE_HEIGHT))
+    pdf.set_auto_page_break(False)
+    pdf.set_creator("SciBind")
+    column_width = (
+        PAGE_WIDTH - 2 * layout.margin - (layout.columns - 1) * layout.margin
+    ) / layout.columns
+    # Fonts are only embedded once used, subset to the glyphs used
+    added, missing = set(), set()
+
+    def text(font, size, x, y, value):
+        bold, slanted = font
+        style = "B" if bold else ""
+        if style not in added:
+            pdf.add_font(FONT_FAMILY, style, FONT_DIR / FONT_FILES[style])
+            added.add(style)
+        if absent := set(value).difference(_cmap(style)):
+            missing.update(absent)
+            value = "".join(char for char in value if char not in absent)
+        pdf.set_font(FONT_FAMILY, style, size)
+        if slanted:
+            with pdf.skew(ax=SLANT, x=x, y=PAGE_HEIGHT - y):
+                pdf.text(x, PAGE_HEIGHT - y, value)
+        else:
+            pdf.text(x, PAGE_HEIGHT - y, value)
+
+    for number, page in enumerate(pages, start=1):
+        pdf.add_page()
+        pdf.set_line_width(0.5)
+        for i, column in enumerate(page):
+            left = layout.margin + i * (column_width + layout.margin)
+            for y, line in column:
+                x = left + line.indent
+                if line.rule:
+                    y = PAGE_HEIGHT - y - line.size * 0.6
+                    pdf.line(left, y, left + column_width, y)
+                    continue
+                if line.image:
+                    image, width, height = line.image
+                    data = image.data
+                    if isinstance(data, BytesIO):
+                        data.seek(0)
+                    pdf.image(data, x, PAGE_HEIGHT - y - height, width, height)
+                    continue
+                for font, value, underline in line.runs:
+                    text(font, line.size, x, y, value)
+                    width = len(value) * CHAR_WIDTH * line.size
+                    if underline:
+                        pdf.line(
+                            x, PAGE_HEIGHT - y + 1.5, x + width, PAGE_HEIGHT - y + 1.5
+                        )
+                    x += width
+        if layout.page_numbers:
+            label = f"{number} / {len(pages)}"
+            size = layout.font_sizes[-1]
+            x = (PAGE_WIDTH - len(label) * CHAR_WIDTH * size) / 2
+            text((False, False), size, x, layout.margin / 2, label)
+    if missing:
+        raise UnsupportedCharacters(
+            "Can't print these characters: " + " ".join(sorted(missing))
+        )
+    return bytes(pdf.output())
+
+
+def render_pdf(document, materialtype, load_image=None):
+    """
+    Renders a parsed binder document to a PDF.
+
+    Args:
+        document: The parsed JSON document.
+        materialtype: The event's material type, a key of LAYOUTS. Other
+            types are laid out like binders.
+        load_image: A function returning the bytes of the image at a URL, or
+            None if it can't be loaded. Images that aren't loaded are shown
+            as their alt text.
+
+    Returns:
+        tuple: The PDF bytes and its number of pages.
+
+    Raises:
+        PageLimitExceeded: If the document doesn't fit the material type's
+            page limit even at the smallest font size.
+        UnsupportedCharacters: If the document has characters the fonts
+            don't have.
+    """
+    layout = LAYOUTS.get(materialtype, LAYOUTS["Binder"])
+    if not isinstance(document, dict):
+        document = {"type": "doc", "content": []}
+    images = {}
+    if load_image is not None:
+        for block in _blocks(document):
+            if block.image and block.image not in images:
+                data = load_image(block.image)
+                images[block.image] = data and prepare_image(data)
+        images = {src: image for src, image in images.items() if image}
+    for size in layout.font_sizes:
+        try:
+            pages = paginate(document, layout, size, images)
+        except PageLimitExceeded:
+            if size == layout.font_sizes[-1]:
+                raise
+            continue
+        return write_pdf(pages, layout), len(pages)
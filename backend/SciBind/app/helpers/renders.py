@@ -0,0 +1,163 @@
+"""
+Print rendering of binders with a render cache.
+
+PDFs are rendered by app.helpers.pdf in the background task workers (see
+app/tasks.py), so rendering large binders doesn't hold up the web server, and
+several binders render in parallel. Rendered files are kept in
+PRINT_RENDER_DIR under a key derived from the binder's content digest, its
+material type and the renderer version, so a binder is only rendered again
+after it changes.
+
+Images in binders are links to other sites. They are downloaded when the
+binder is rendered, only from public addresses so binders can't make the
+server request its own network, and within size and time limits.
+"""
+
+import base64
+import hashlib
+import http.client
+import ipaddress
+import logging
+import os
+import socket
+import uuid
+from pathlib import Path
+from urllib.parse import unquote_to_bytes, urljoin, urlsplit
+
+from django.conf import settings
+
+from .documents import parse_content
+from .pdf import render_pdf
+
+logger = logging.getLogger(__name__)
+
+# Bump when the output of app.helpers.pdf changes, to invalidate the cache
+RENDERER_VERSION = 3
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+IMAGE_TIMEOUT = 10
+MAX_REDIRECTS = 3
+
+
+def render_key(binder):
+    """
+    Returns the cache key of a binder's rendered PDF.
+    """
+    return hashlib.sha256(
+        f"{RENDERER_VERSION}:{binder.blob_id}:{binder.materialtype}".encode()
+    ).hexdigest()[:32]
+
+
+def render_path(binder):
+    """
+    Returns the path a binder's rendered PDF is cached at.
+    """
+    return Path(settings.PRINT_RENDER_DIR) / f"{render_key(binder)}.pdf"
+
+
+def cached_render(binder):
+    """
+    Returns the path of a binder's rendered PDF, or None if it isn't cached.
+    """
+    path = render_path(binder)
+    return path if path.exists() else None
+
+
+def render_binder(binder):
+    """
+    Returns the path of a binder's rendered PDF, rendering it if it isn't
+    cached yet.
+
+    Args:
+        binder: The BinderModel. Its content is only loaded on a cache miss.
+
+    Raises:
+        PageLimitExceeded: If the binder doesn't fit its material type's page
+            limit.
+        UnsupportedCharacters: If the binder has characters that can't be
+            printed.
+    """
+    if (path := cached_render(binder)) is not None:
+        return path
+    pdf, _ = render_pdf(
+        parse_content(binder.content), binder.materialtype, load_image=load_image
+    )
+    path = render_path(binder)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written under a temporary name, so no one reads a partial file
+    temporary = path.with_name(f".{uuid.uuid4().hex}.pdf")
+    temporary.write_bytes(pdf)
+    os.replace(temporary, path)
+    return path
+
+
+def _public_address(host, port):
+    # The address to connect to, if the host only resolves to public ones
+    addresses = {
+        info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    }
+    if not addresses or not all(
+        ipaddress.ip_address(address).is_global for address in addresses
+    ):
+        return None
+    return sorted(addresses)[0]
+
+
+def _download(url, redirects=MAX_REDIRECTS):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    if (address := _public_address(parts.hostname, port)) is None:
+        logger.info("Not loading image %s, it isn't on a public address", url)
+        return None
+    cls = (
+        http.client.HTTPSConnection
+        if parts.scheme == "https"
+        else http.client.HTTPConnection
+    )
+    connection = cls(parts.hostname, port, timeout=IMAGE_TIMEOUT)
+    # Connect to the checked address rather than resolving the host again
+    connection._create_connection = lambda _, *args, **kwargs: (
+        socket.create_connection((address, port), *args, **kwargs)
+    )
+    try:
+        path = parts.path or "/"
+        connection.request(
+            "GET",
+            f"{path}?{parts.query}" if parts.query else path,
+            headers={"Accept": "image/*", "User-Agent": "SciBind"},
+        )
+        response = connection.getresponse()
+        location = response.getheader("Location")
+        if response.status in (301, 302, 303, 307, 308) and location and redirects:
+            return _download(urljoin(url, location), redirects - 1)
+        if response.status != 200:
+            return None
+        data = response.read(MAX_IMAGE_BYTES + 1)
+        return data if len(data) <= MAX_IMAGE_BYTES else None
+    finally:
+        connection.close()
+
+
+def load_image(src):
+    """
+    Returns the bytes of an image in a binder, or None if it can't be
+    loaded.
+
+    Args:
+        src: The image's URL, a data: URL or an http(s) URL on a public
+            address.
+    """
+    try:
+        if src.startswith("data:"):
+            header, _, data = src[5:].partition(",")
+            if header.endswith(";base64"):
+                data = base64.b64decode(data, validate=False)
+            else:
+                data = unquote_to_bytes(data)
+            return data if len(data) <= MAX_IMAGE_BYTES else None
+        return _download(src)
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        logger.info("Couldn't load image %s: %s", src[:200], e)
+        return None
@@ -0,0 +1,139 @@
+"""
+Binder revision history.
+
+Every content save is recorded as a BinderRevision. Most revisions hold a
+JSON Patch against the previous revision's document. A keyframe holding the
+full content is stored every BINDER_REVISION_KEYFRAME_INTERVAL revisions, or
+when the patch wouldn't be smaller than the content, so rebuilding any
+revision applies a bounded number of patches.
+"""
+
+import json
+
+from django.conf import settings
+from django.db.models import Subquery
+
+from .documents import compress_content, decode_content, parse_content
+from .jsonpatch import apply_patch, make_patch
+
+
+def _chain(binder_id, number=None):
+    """
+    Returns the revisions from the last keyframe up to a revision, oldest
+    first.
+
+    Args:
+        binder_id: The id of the binder.
+        number: The revision number. Defaults to the latest revision.
+    """
+    from app.models import BinderRevision
+
+    revisions = BinderRevision.objects.filter(binder_id=binder_id)
+    if number is not None:
+        revisions = revisions.filter(number__lte=number)
+    keyframe = revisions.filter(keyframe=True).order_by("-number").values("number")
+    return list(revisions.filter(number__gte=Subquery(keyframe[:1])).order_by("number"))
+
+
+def _rebuild(chain):
+    """
+    Returns the parsed document of the last revision in a chain, and whether
+    its content is stored as a JSON string.
+    """
+    content = decode_content(chain[0].data)
+    document, string = parse_content(content), isinstance(content, str)
+    for revision in chain[1:]:
+        delta = decode_content(revision.data)
+        document = apply_patch(document, delta["patch"], in_place=True)
+        string = delta["string"]
+    return document, string
+
+
+def record_revision(binder_id, content):
+    """
+    Records a content save of a binder as its next revision.
+
+    Must be called in the transaction that saved the content, after the
+    binder row was written, so saves of the same binder are serialized.
+
+    Args:
+        binder_id: The id of the binder.
+        content: The saved content value.
+
+    Returns:
+        BinderRevision: The new revision.
+    """
+    from app.models import BinderRevision
+
+    chain = _chain(binder_id)
+    number = chain[-1].number + 1 if chain else 1
+    data, size = compress_content(content)
+    keyframe = (
+        not chain
+        or number - chain[0].number >= settings.BINDER_REVISION_KEYFRAME_INTERVAL
+    )
+    if not keyframe:
+        try:
+            previous, _ = _rebuild(chain)
+            patch = make_patch(previous, parse_content(content))
+        except ValueError:
+            # Content that isn't a JSON document can't be patched
+            keyframe = True
+        else:
+            delta, _ = compress_content(
+                {"patch": patch, "string": isinstance(content, str)}
+            )
+            if len(delta) < len(data):
+                data = delta
+            else:
+                keyframe = True
+    return BinderRevision.objects.create(
+        binder_id=binder_id, number=number, keyframe=keyframe, data=data, size=size
+    )
+
+
+def get_revision_content(binder_id, number):
+    """
+    Returns the content of a binder at a revision.
+
+    Args:
+        binder_id: The id of the binder.
+        number: The revision number.
+
+    Returns:
+        The content value.
+
+    Raises:
+        LookupError: If the revision doesn't exist.
+    """
+    chain = _chain(binder_id, number)
+    if not chain or chain[-1].number != number:
+        raise LookupError(f"Binder {binder_id} has no revision {number}")
+    if len(chain) == 1:
+        return decode_content(chain[0].data)
+    document, string = _rebuild(chain)
+    return json.dumps(document, separators=(",", ":")) if string else document
+
+
+def copy_revisions(source_id, target_id):
+    """
+    Appends the revisions of a binder to the history of another, e.g. before
+    the first one is deleted.
+
+    Args:
+        source_id: The id of the binder whose revisions are copied.
+        target_id: The id of the binder they are recorded as revisions of.
+
+    Returns:
+        int: The number of revisions copied.
+    """
+    from app.models import BinderRevision
+
+    numbers = list(
+        BinderRevision.objects.filter(binder_id=source_id)
+        .order_by("number")
+        .values_list("number", flat=True)
+    )
+    for number in numbers:
+        record_revision(target_id, get_revision_content(source_id, number))
+    return len(numbers)
@@ -0,0 +1,201 @@
+"""
+Full-text search over binder content.
+
+The text of every binder is kept in a BinderSearchDocument row, updated
+whenever its content is saved. On SQLite the rows are indexed by an FTS5
+table kept in sync by triggers (created in migration 0009), which ranks
+results with BM25 and builds snippets. On other databases search falls back
+to case-insensitive substring matching.
+"""
+
+import html
+import re
+
+from django.db import connection
+
+from .documents import parse_content
+
+FTS_TABLE = "app_binder_fts"
+
+# Statements creating the FTS5 index over BinderSearchDocument.text
+FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        text,
+        content='app_bindersearchdocument',
+        content_rowid='binder_id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON app_bindersearchdocument
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.binder_id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON app_bindersearchdocument
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.binder_id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON app_bindersearchdocument
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.binder_id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.binder_id, new.text);
+    END
+    """,
+]
+
+SNIPPET_TOKENS = 16
+SNIPPET_CHARS = 120
+
+# Private use characters marking matches in snippets until the text is
+# escaped, removed from indexed text so binders can't contain them
+MARK_START = "\ue000"
+MARK_END = "\ue001"
+
+
+def _collect(node, parts):
+    if isinstance(node, dict):
+        if isinstance(text := node.get("text"), str):
+            parts.append(text)
+        for key, value in node.items():
+            if key != "text":
+                _collect(value, parts)
+        if "content" in node:
+            # Keep the words of separate blocks apart
+            parts.append("\n")
+    elif isinstance(node, list):
+        for child in node:
+            _collect(child, parts)
+
+
+def extract_text(content):
+    """
+    Returns the searchable text of a binder's content.
+
+    The strings in "text" members of the document (ProseMirror text nodes)
+    are joined, with a line break after every node that has children.
+    """
+    try:
+        document = parse_content(content)
+    except ValueError:
+        text = content
+    else:
+        if isinstance(document, str):
+            text = document
+        else:
+            parts = []
+            _collect(document, parts)
+            text = re.sub(r"\n\s*", "\n", "".join(parts)).strip()
+    # The snippets' highlight markers, which must only come from matches
+    return text.replace(MARK_START, "").replace(MARK_END, "")
+
+
+def has_fts():
+    """
+    Returns whether the database has the FTS5 index.
+    """
+    if not hasattr(connection, "_binder_fts"):
+        connection._binder_fts = connection.vendor == "sqlite" and FTS_TABLE in (
+            connection.introspection.table_names()
+        )
+    return connection._binder_fts
+
+
+def index_binder(binder_id, content):
+    """
+    Updates the search document of a binder after its content is saved.
+    """
+    from app.models import BinderSearchDocument
+
+    BinderSearchDocument.objects.bulk_create(
+        [BinderSearchDocument(binder_id=binder_id, text=extract_text(content))],
+        update_conflicts=True,
+        unique_fields=["binder"],
+        update_fields=["text"],
+    )
+
+
+def _fts_query(query):
+    # Match every word, and the last one as a prefix since it may still be
+    # being typed. Quoting keeps FTS5 syntax characters literal.
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    # Binder text is user input, only the highlighting is markup
+    return (
+        html.escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+    )
+
+
+def _substring_snippet(text, words):
+    lowered = text.lower()
+    start = min(
+        (i for i in (lowered.find(word.lower()) for word in words) if i >= 0),
+        default=0,
+    )
+    start = max(0, start - SNIPPET_CHARS // 4)
+    snippet = text[start : start + SNIPPET_CHARS].replace("\n", " ")
+    for word in words:
+        snippet = re.sub(
+            f"({re.escape(word)})",
+            rf"{MARK_START}\1{MARK_END}",
+            snippet,
+            flags=re.IGNORECASE,
+        )
+    return ("…" if start else "") + _highlight(snippet)
+
+
+def search_binders(binders, query, limit=20):
+    """
+    Searches the content of binders.
+
+    Args:
+        binders: A BinderModel queryset to search in, e.g. the binders a user
+            can access.
+        query: The words to search for.
+        limit: The maximum number of results.
+
+    Returns:
+        list: (binder id, snippet) tuples, best matches first. Snippets are
+        HTML: the text is escaped and matched words are wrapped in <mark>
+        tags.
+    """
+    from app.models import BinderSearchDocument
+
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+    if not has_fts():
+        documents = BinderSearchDocument.objects.filter(binder__in=binders.values("pk"))
+        for word in words:
+            documents = documents.filter(text__icontains=word)
+        return [
+            (document.binder_id, _substring_snippet(document.text, words))
+            for document in documents.order_by("-binder_id")[:limit]
+        ]
+
+    # The unary + keeps SQLite from handing the rowid list to FTS5, which
+    # would run the query once per binder in scope. Instead the matches are
+    # filtered, and only the remaining ones are scored and get snippets.
+    scope, params = binders.values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND +rowid IN ({scope}) "
+            f"ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+            [MARK_START, MARK_END, SNIPPET_TOKENS, _fts_query(query), *params, limit],
+        )
+        return [(pk, _highlight(snippet)) for pk, snippet in cursor.fetchall()]
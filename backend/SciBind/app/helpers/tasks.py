@@ -0,0 +1,257 @@
+"""
+A database-backed background task queue.
+
+Functions decorated with @task can be queued with `func.enqueue(...)`, which
+stores a Task row. `manage.py run_worker` processes run queued tasks, highest
+priority first, retrying failed ones with exponential backoff. Claims are
+conditional updates, so any number of workers can share the queue without a
+broker. With TASKS["EAGER"], tasks run as soon as they are queued, which is
+useful for development and tests.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(func=None, *, priority=0, max_attempts=None):
+    """
+    Registers a function as a task.
+
+    The function's arguments and return value must be JSON serializable.
+
+    Args:
+        priority: The default priority of the task, higher runs first.
+        max_attempts: How often the task is tried before it fails. Defaults
+            to TASKS["MAX_ATTEMPTS"].
+    """
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        registry[name] = func
+
+        def enqueue(*args, priority=priority, user=None, key=None, **kwargs):
+            return enqueue_task(
+                name,
+                args,
+                kwargs,
+                priority=priority,
+                max_attempts=max_attempts,
+                user=user,
+                key=key,
+            )
+
+        func.task_name = name
+        func.enqueue = enqueue
+        return func
+
+    return decorator(func) if func is not None else decorator
+
+
+def enqueue_task(
+    name, args=(), kwargs=None, priority=0, max_attempts=None, user=None, key=None
+):
+    """
+    Queues a task.
+
+    Args:
+        name: The registered name of the task.
+        args: Positional arguments for the task.
+        kwargs: Keyword arguments for the task.
+        priority: Higher priority tasks run first.
+        max_attempts: How often the task is tried before it fails.
+        user: The user who may see the task's status.
+        key: If given and a task with the same key is still queued or
+            running, that task is returned instead of queuing another one.
+
+    Returns:
+        Task: The queued task, or the task that already ran with TASKS["EAGER"].
+    """
+    from app.models import Task
+
+    if name not in registry:
+        raise KeyError(f"Unknown task: {name}")
+    if key is not None:
+        pending = Task.objects.filter(
+            key=key, status__in=[Task.QUEUED, Task.RUNNING]
+        ).first()
+        if pending is not None:
+            return pending
+    created = Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=priority,
+        max_attempts=max_attempts or settings.TASKS["MAX_ATTEMPTS"],
+        user=user,
+        key=key,
+    )
+    if settings.TASKS["EAGER"] and claim(created):
+        execute(created)
+    return created
+
+
+def claim(task, worker="eager"):
+    """
+    Marks a queued task as running, returning whether this worker got it.
+
+    The attempt is counted when the task is claimed, so tasks that kill
+    their worker still run out of attempts.
+    """
+    from app.models import Task
+
+    now = timezone.now()
+    claimed = Task.objects.filter(pk=task.pk, status=Task.QUEUED).update(
+        status=Task.RUNNING, worker=worker, started=now, attempts=F("attempts") + 1
+    )
+    if claimed:
+        task.status, task.worker, task.started = Task.RUNNING, worker, now
+        task.attempts += 1
+    return bool(claimed)
+
+
+def claim_next(worker):
+    """
+    Claims the next task that is due, or returns None.
+    """
+    from app.models import Task
+
+    due = Task.objects.filter(status=Task.QUEUED, run_at__lte=timezone.now())
+    # Another worker may claim a task between reading and claiming it, so
+    # try the next few candidates
+    for candidate in due.order_by("-priority", "run_at", "id")[:10]:
+        if claim(candidate, worker):
+            return candidate
+    return None
+
+
+def execute(task):
+    """
+    Runs a claimed task and records its result, or schedules a retry.
+    """
+    from app.models import Task
+
+    try:
+        result = registry[task.name](*task.args, **task.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s (%s) failed:\n%s", task.pk, task.name, error)
+        task.error = error
+        if task.attempts < task.max_attempts:
+            task.status = Task.QUEUED
+            task.run_at = timezone.now() + timedelta(
+                seconds=settings.TASKS["RETRY_DELAY"] * 2 ** (task.attempts - 1)
+            )
+        else:
+            task.status = Task.FAILED
+            task.finished = timezone.now()
+    else:
+        task.status, task.result, task.error = Task.DONE, result, ""
+        task.finished = timezone.now()
+    task.save(update_fields=["status", "result", "error", "run_at", "finished"])
+    return task
+
+
+def requeue_stale():
+    """
+    Queues running tasks again whose worker must have died, i.e. that have
+    been running for longer than TASKS["TIMEOUT"] seconds. Those that have
+    used up their attempts fail instead.
+
+    Returns:
+        int: The number of tasks queued again.
+    """
+    from app.models import Task
+
+    now = timezone.now()
+    stale = Task.objects.filter(
+        status=Task.RUNNING,
+        started__lt=now - timedelta(seconds=settings.TASKS["TIMEOUT"]),
+    )
+    if failed := stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Task.FAILED,
+        error="The worker stopped while running the task",
+        finished=now,
+    ):
+        logger.warning("%d tasks failed after their workers stopped", failed)
+    return stale.update(status=Task.QUEUED, run_at=now)
+
+
+def run_worker(burst=False):
+    """
+    Runs queued tasks until stopped with SIGTERM or SIGINT.
+
+    Args:
+        burst: Return once there are no due tasks instead of waiting for more.
+
+    Returns:
+        int: The number of tasks run.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stopping = []
+    if not burst:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.append(True))
+
+    count, last_requeue = 0, 0
+    while not stopping:
+        if time.monotonic() - last_requeue > settings.TASKS["TIMEOUT"] / 2:
+            requeue_stale()
+            last_requeue = time.monotonic()
+        claimed = claim_next(worker)
+        if claimed is not None:
+            execute(claimed)
+            count += 1
+        elif burst:
+            break
+        else:
+            time.sleep(settings.TASKS["POLL_INTERVAL"])
+        close_old_connections()
+    return count
+
+
+def _worker_process(burst):
+    # Runs in a spawned process, which has to set up Django itself
+    import django
+
+    django.setup()
+    run_worker(burst)
+
+
+def start_workers(count, burst=False):
+    """
+    Starts worker processes.
+
+    Workers are spawned rather than forked, so they don't share the parent's
+    database connections.
+
+    Args:
+        count: The number of processes.
+        burst: Stop the processes once there are no due tasks.
+
+    Returns:
+        list: The started multiprocessing.Process objects.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_worker_process, args=(burst,), daemon=False)
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
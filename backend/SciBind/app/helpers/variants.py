@@ -0,0 +1,137 @@
+"""
+Resized and recompressed variants of images.
+
+Variants are generated with Pillow by a background task the first time they
+are requested, and until then the original image is served. They are stored in
+IMAGE_VARIANT_DIR under a name derived from the source image's content digest,
+so a changed source never reuses a stale variant.
+"""
+
+import os
+import uuid
+
+from django.conf import settings
+from django.http import HttpResponseBadRequest
+from django.utils.cache import patch_vary_headers
+from PIL import Image as PILImage
+
+from .images import REVALIDATE, ImageStore, serve_image
+
+# Variant name -> maximum width and height
+SIZES = {"thumb": 64, "card": 256, "full": 1024}
+
+# Modern formats in order of preference, used when the client accepts them
+PREFERRED_FORMATS = [
+    fmt
+    for fmt in ("avif", "webp")
+    if PILImage.registered_extensions().get(f".{fmt}") in PILImage.SAVE
+]
+
+FORMATS = PREFERRED_FORMATS + ["png", "jpeg"]
+
+SAVE_OPTIONS = {
+    "avif": {"quality": 60},
+    "webp": {"quality": 80, "method": 4},
+    "png": {"optimize": True},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+variant_store = ImageStore(
+    settings.IMAGE_VARIANT_DIR,
+    cache_size=settings.IMAGE_CACHE_SIZE,
+    max_item_size=settings.IMAGE_CACHE_MAX_ITEM_SIZE,
+    sendfile_root=settings.IMAGE_VARIANT_SENDFILE_ROOT,
+)
+
+
+def fallback_format(image):
+    """
+    Returns the format used for clients that don't accept modern formats.
+    """
+    return "jpeg" if image.name.lower().endswith((".jpg", ".jpeg")) else "png"
+
+
+def get_variant(image, size, fmt):
+    """
+    Returns a variant of an image, or queues generating it.
+
+    Args:
+        image: The source Image.
+        size: A key of SIZES.
+        fmt: One of FORMATS.
+
+    Returns:
+        Image: The variant, served from variant_store, or None if it isn't
+        generated yet.
+    """
+    from app.tasks import generate_image_variant
+
+    path = variant_store.root / f"{image.digest}-{size}.{fmt}"
+    if (variant := variant_store.get(path)) is not None:
+        return variant
+    generate_image_variant.enqueue(
+        str(image.path), str(path), size, fmt, key=f"variant:{path.name}"
+    )
+    # Tasks run right away with TASKS["EAGER"]
+    return variant_store.get(path)
+
+
+def generate(source, destination, size, fmt):
+    with PILImage.open(source) as original:
+        original.thumbnail((size, size), PILImage.LANCZOS)
+        has_alpha = original.mode in ("RGBA", "LA", "P")
+        if fmt == "jpeg" or not has_alpha:
+            if has_alpha:
+                # JPEG has no transparency, flatten onto white
+                background = PILImage.new("RGB", original.size, "white")
+                background.paste(original, mask=original.convert("RGBA"))
+                resized = background
+            else:
+                resized = original.convert("RGB")
+        else:
+            resized = original.convert("RGBA")
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    temporary = destination.with_name(f".{uuid.uuid4().hex}{destination.suffix}")
+    resized.save(temporary, fmt.upper(), **SAVE_OPTIONS[fmt])
+    os.replace(temporary, destination)
+
+
+def serve_variant(request, image, cache_control=REVALIDATE):
+    """
+    Serves an image, resized and converted according to the request.
+
+    The size comes from the `size` query parameter (thumb, card or full) and
+    the format from `format`, or else from the Accept header. Without either
+    parameter, or while the variant is being generated, the original image is
+    served.
+
+    Args:
+        request: The request object.
+        image: The source Image.
+        cache_control: Cache-Control directives for the response.
+    """
+    size = request.GET.get("size")
+    fmt = request.GET.get("format")
+    if size is None and fmt is None:
+        return serve_image(request, image, cache_control)
+    if (size := size or "full") not in SIZES:
+        return HttpResponseBadRequest(f"Unknown size, use one of {', '.join(SIZES)}")
+    if fmt is not None and fmt not in FORMATS:
+        return HttpResponseBadRequest(
+            f"Unknown format, use one of {', '.join(FORMATS)}"
+        )
+
+    negotiated = fmt is None
+    if negotiated:
+        accept = request.headers.get("Accept", "")
+        fmt = next(
+            (f for f in PREFERRED_FORMATS if f"image/{f}" in accept),
+            fallback_format(image),
+        )
+    if (variant := get_variant(image, size, fmt)) is None:
+        return serve_image(request, image, {"no_store": True})
+    response = serve_image(request, variant, cache_control)
+    if negotiated:
+        patch_vary_headers(response, ["Accept"])
+    return response
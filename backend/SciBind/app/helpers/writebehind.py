@@ -0,0 +1,274 @@
+"""
+A write-behind buffer for binder content saves.
+
+Saves are appended to a local journal and kept in memory, where repeated
+saves of the same binder collapse into one. Pending saves are written to the
+database in a single transaction every INTERVAL seconds, or as soon as
+MAX_PENDING binders are waiting.
+
+Each save records the binder version it was made against, and is only
+written if the binder still has that version. A save that lost to another
+writer in the meantime (a JSON Patch, a websocket session, another process)
+is dropped and logged rather than written over the newer content.
+
+Each process writes its own journal file and holds a lock on it. When a
+buffer starts, it replays and removes journal files that no running process
+holds a lock on, i.e. the journals of processes that crashed before flushing.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+def _try_lock(file):
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _entry(binder_id, content, version):
+    return json.dumps({"id": binder_id, "content": content, "version": version}) + "\n"
+
+
+class WriteBehindBuffer:
+    """
+    Buffers binder content saves and flushes them to the database in batches.
+
+    Args:
+        directory: The directory journal files are written to.
+        interval: Seconds between background flushes, or None to only flush
+            when MAX_PENDING is reached or flush() is called.
+        max_pending: The number of pending binders that triggers a flush.
+        fsync: Whether to fsync the journal after every save.
+    """
+
+    def __init__(self, directory, interval=2.0, max_pending=100, fsync=True):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.journal = None
+        self.thread = None
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.journal = self._open_journal()
+        self.replay()
+        if self.interval:
+            self.thread = threading.Thread(
+                target=self._run, name="binder-write-behind", daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+            if not self.pending:
+                os.remove(self.journal.name)
+            self.journal = None
+
+    def put(self, binder_id, content, version):
+        """
+        Records a content save for a binder.
+
+        Args:
+            binder_id: The id of the binder.
+            content: The new content.
+            version: The version of the binder in the database the save was
+                made against.
+        """
+        line = _entry(binder_id, content, version)
+        with self.lock:
+            self.journal.write(line)
+            self.journal.flush()
+            if self.fsync:
+                os.fsync(self.journal.fileno())
+            self.pending[binder_id] = (content, version)
+            full = len(self.pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def has_pending(self, binder_id):
+        return binder_id in self.pending
+
+    def flush(self, binder_ids=None):
+        """
+        Writes pending saves to the database in one transaction. Saves of
+        binders that were changed since they were made are dropped.
+
+        Args:
+            binder_ids: Only flush these binders. Defaults to all of them.
+
+        Returns:
+            int: The number of binders written.
+        """
+        from app.models import BinderModel
+
+        with self.flush_lock:
+            with self.lock:
+                ids = self.pending if binder_ids is None else binder_ids
+                batch = {pk: self.pending[pk] for pk in ids if pk in self.pending}
+            if not batch:
+                return 0
+
+            written = set()
+            with transaction.atomic():
+                for pk, (content, version) in batch.items():
+                    if BinderModel.objects.filter(
+                        pk=pk, version=version
+                    ).update_content(content):
+                        written.add(pk)
+                    else:
+                        logger.warning(
+                            "Dropped a buffered save of binder %s made against "
+                            "version %s, it has been changed since",
+                            pk,
+                            version,
+                        )
+
+            with self.lock:
+                for pk, item in batch.items():
+                    # Keep saves that arrived while the batch was being written
+                    current = self.pending.get(pk)
+                    if current is item:
+                        del self.pending[pk]
+                    elif (
+                        pk in written and current is not None and current[1] == item[1]
+                    ):
+                        # Made against the version the batch just wrote over,
+                        # so it follows the buffered save rather than losing
+                        # to it
+                        self.pending[pk] = (current[0], item[1] + 1)
+                self._compact()
+            return len(written)
+
+    def replay(self):
+        """
+        Writes the saves from journals left behind by crashed processes.
+        """
+        for path in sorted(self.directory.glob("*.jsonl")):
+            if path.name == Path(self.journal.name).name:
+                continue
+            with open(path, "a+", encoding="utf-8") as file:
+                if not _try_lock(file):
+                    continue
+                file.seek(0)
+                entries = {}
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write from the crash, only the last line can be
+                        # incomplete
+                        break
+                    entries[entry["id"]] = (entry["content"], entry.get("version"))
+                with self.lock:
+                    for pk, item in entries.items():
+                        self.pending.setdefault(pk, item)
+                self.flush(list(entries))
+            path.unlink(missing_ok=True)
+            logger.info("Replayed %d binder saves from %s", len(entries), path)
+
+    def _open_journal(self):
+        journal = open(
+            self.directory / f"{uuid.uuid4().hex}.jsonl", "a+", encoding="utf-8"
+        )
+        _try_lock(journal)
+        return journal
+
+    def _compact(self):
+        # Start a new journal holding only what is still pending, so journals
+        # don't grow without bound
+        journal = self._open_journal()
+        for pk, (content, version) in self.pending.items():
+            journal.write(_entry(pk, content, version))
+        journal.flush()
+        os.fsync(journal.fileno())
+        old, self.journal = self.journal, journal
+        old.close()
+        os.remove(old.name)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush binder saves")
+            finally:
+                close_old_connections()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    Returns the process's write-behind buffer, or None if it is disabled.
+    """
+    global _buffer
+    config = settings.BINDER_WRITE_BEHIND
+    if not config.get("ENABLED"):
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBehindBuffer(
+                config["JOURNAL_DIR"],
+                interval=config.get("INTERVAL", 2.0),
+                max_pending=config.get("MAX_PENDING", 100),
+                fsync=config.get("FSYNC", True),
+            )
+            _buffer.start()
+        return _buffer
+
+
+def flush_pending(binder_id):
+    """
+    Writes any buffered save of a binder so the database copy is current.
+
+    Returns:
+        bool: Whether a buffered save was written.
+    """
+    if _buffer is not None and _buffer.has_pending(binder_id):
+        return _buffer.flush([binder_id]) > 0
+    return False
+
+
+@receiver(setting_changed)
+def reset_buffer(setting, **kwargs):
+    global _buffer
+    if setting == "BINDER_WRITE_BEHIND" and _buffer is not None:
+        _buffer.stop()
+        _buffer = None
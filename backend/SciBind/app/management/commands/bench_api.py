@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from app.helpers.loadtest import SCENARIOS, compare, run, seed, summarize
+
+
+def add_data_arguments(parser):
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--binders", type=int, default=300)
+    parser.add_argument(
+        "--shares",
+        type=int,
+        default=2,
+        help="Average number of users each binder is shared with",
+    )
+    parser.add_argument(
+        "--paragraphs", type=int, default=20, help="Size of binder documents"
+    )
+    parser.add_argument(
+        "--large",
+        type=float,
+        default=0.05,
+        help="Fraction of binders with large documents",
+    )
+    parser.add_argument(
+        "--large-paragraphs", type=int, default=2000, help="Size of large documents"
+    )
+    parser.add_argument(
+        "--events", type=int, default=0, help="Events to add to the catalog"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run scripted API scenarios against seeded data and report latency "
+        "percentiles and queries per request. Runs in a throwaway test "
+        "database, so the configured one is left alone."
+    )
+
+    def add_arguments(self, parser):
+        add_data_arguments(parser)
+        parser.add_argument(
+            "--scenarios",
+            nargs="+",
+            choices=list(SCENARIOS),
+            default=list(SCENARIOS),
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=200, help="Runs of each scenario"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=10, help="Unrecorded runs of each scenario"
+        )
+        parser.add_argument("--save", help="Save the results as a JSON baseline")
+        parser.add_argument("--compare", help="Compare against a JSON baseline")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="Relative p95 increase reported as a regression",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error if there are regressions",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read the baseline: {e}")
+
+        old_name = connection.settings_dict["NAME"]
+        directory = tempfile.mkdtemp()
+        if connection.vendor == "sqlite":
+            # A file rather than the in-memory default, like the real database
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                directory, "bench_api.sqlite3"
+            )
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # A journal of its own, so buffered saves are flushed into the test
+        # database before it is destroyed and the server's aren't replayed
+        write_behind = {
+            **settings.BINDER_WRITE_BEHIND,
+            "JOURNAL_DIR": os.path.join(directory, "journal"),
+        }
+        try:
+            with override_settings(BINDER_WRITE_BEHIND=write_behind):
+                summary = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(directory)
+
+        self.report(summary)
+        results = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "options": {
+                name: options[name]
+                for name in (
+                    "users",
+                    "binders",
+                    "shares",
+                    "paragraphs",
+                    "large",
+                    "large_paragraphs",
+                    "events",
+                    "seed",
+                    "iterations",
+                    "warmup",
+                )
+            },
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "results": summary,
+        }
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved to {options['save']}")
+        if baseline is not None:
+            self.compare(baseline, results, options)
+
+    def run(self, options):
+        start = time.perf_counter()
+        try:
+            data = seed(
+                users=options["users"],
+                binders=options["binders"],
+                shares=options["shares"],
+                paragraphs=options["paragraphs"],
+                large=options["large"],
+                large_paragraphs=options["large_paragraphs"],
+                events=options["events"],
+                seed=options["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(
+            f"Seeded {options['users']} users and {options['binders']} binders "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        # Expected 404s and 409s would be logged as warnings
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        recorder = run(
+            data,
+            options["scenarios"],
+            options["iterations"],
+            warmup=options["warmup"],
+            seed=options["seed"],
+        )
+        return summarize(recorder)
+
+    def report(self, summary):
+        self.stdout.write(
+            f"{'step':<56} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'queries':>8}"
+        )
+        for step, row in summary.items():
+            self.stdout.write(
+                f"{step:<56} {row['requests']:>8} {row['p50']:>8.2f} "
+                f"{row['p95']:>8.2f} {row['p99']:>8.2f} {row['queries']:>8.2f}"
+            )
+
+    def compare(self, baseline, results, options):
+        if baseline.get("options") != results["options"]:
+            self.stdout.write(
+                self.style.WARNING("The baseline was run with different options")
+            )
+        rows = compare(baseline["results"], results["results"], options["threshold"])
+        self.stdout.write(f"\nCompared to {options['compare']}")
+        regressions = 0
+        for step, metric, old, new, regression in rows:
+            change = f"{(new - old) / old:+.0%}" if old else "n/a"
+            line = f"{step:<56} {metric:>8} {old:>10.2f} {new:>10.2f} {change:>7}"
+            if regression:
+                regressions += 1
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{regressions} regressions")
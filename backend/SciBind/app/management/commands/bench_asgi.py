@@ -0,0 +1,217 @@
+import asyncio
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from app.models import BinderContent, BinderModel, EventModel, User
+
+ENDPOINTS = [
+    ("GET", "binders/"),
+    ("GET", "events/"),
+    ("GET", "event-info/{binder}/"),
+    ("GET", "user/"),
+    ("POST", "verify/"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the sync views and their async versions in "
+        "/api/async/, like the front end requesting them in parallel on a page "
+        "load. Uses the configured database and removes what it creates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--binders", type=int, default=30)
+        parser.add_argument(
+            "--url",
+            help=(
+                "Benchmark a running server instead, e.g. http://127.0.0.1:8000 "
+                "for `uvicorn SciBind.asgi:application` or `daphne "
+                "SciBind.asgi:application`"
+            ),
+        )
+
+    def handle(self, *args, concurrency, requests, binders, url, **kwargs):
+        # Servers and worker threads use their own connections, so the data
+        # is committed and deleted afterwards
+        user = User.objects.create_user(username="bench_asgi")
+        # A user has one binder per event
+        events = EventModel.objects.bulk_create(
+            EventModel(name=f"Benchmark {i}", materialtype="Binder", division="C")
+            for i in range(binders)
+        )
+        try:
+            team = [
+                BinderModel.objects.create(owner=user, event=event, content="{}")
+                for event in events
+            ]
+            token = Token.objects.create(user=user)
+            headers = {"Authorization": f"Token {token.key}"}
+            paths = [
+                (method, path.format(binder=team[0].pk)) for method, path in ENDPOINTS
+            ]
+            if url:
+                runners = [(url, self.threaded(self.http_request(url)))]
+            else:
+                from SciBind.asgi import application as asgi
+                from SciBind.wsgi import application as wsgi
+
+                runners = [
+                    ("ASGI", self.concurrent(asgi)),
+                    ("WSGI", self.threaded(self.wsgi_request(wsgi))),
+                ]
+            for label, run in runners:
+                self.stdout.write(f"{label}, {concurrency} concurrent requests")
+                for method, path in paths:
+                    for prefix in ("/api/", "/api/async/"):
+                        latencies, elapsed = run(
+                            method, prefix + path, headers, concurrency, requests
+                        )
+                        self.report(prefix + path, latencies, elapsed)
+        finally:
+            blobs = list(
+                BinderModel.objects.filter(owner=user).values_list("blob", flat=True)
+            )
+            user.delete()
+            EventModel.objects.filter(pk__in=[event.pk for event in events]).delete()
+            BinderContent.objects.filter(pk__in=blobs, binders=None).delete()
+
+    def report(self, path, latencies, elapsed):
+        latencies.sort()
+        self.stdout.write(
+            f"  {path:<28} {len(latencies) / elapsed:>7.0f} req/s, "
+            f"p50 {statistics.median(latencies) * 1000:6.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.1f}ms"
+        )
+
+    def concurrent(self, application):
+        # Runs requests as tasks on one event loop, like an ASGI server
+        async def request(method, path, headers):
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": method,
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "root_path": "",
+                "headers": [(b"host", b"localhost")]
+                + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+                "client": ("127.0.0.1", 50000),
+                "server": ("localhost", 80),
+            }
+            received = asyncio.Event()
+
+            async def receive():
+                if not received.is_set():
+                    received.set()
+                    return {"type": "http.request", "body": b""}
+                # Never disconnects
+                await asyncio.Future()
+
+            status = []
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            if status[0] >= 400:
+                raise RuntimeError(f"{method} {path} returned {status[0]}")
+            return time.perf_counter() - start
+
+        async def run(method, path, headers, concurrency, count):
+            latencies = []
+
+            async def client(requests):
+                for _ in range(requests):
+                    latencies.append(await request(method, path, headers))
+
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(client(count // concurrency) for _ in range(concurrency))
+            )
+            return latencies, time.perf_counter() - start
+
+        return lambda *args: asyncio.run(run(*args))
+
+    def threaded(self, request):
+        # Runs requests in threads, like a threaded WSGI server
+        def run(method, path, headers, concurrency, count):
+            def client(requests):
+                return [request(method, path, headers) for _ in range(requests)]
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as threads:
+                results = threads.map(client, [count // concurrency] * concurrency)
+                latencies = [latency for result in results for latency in result]
+            return latencies, time.perf_counter() - start
+
+        return run
+
+    def wsgi_request(self, application):
+        def request(method, path, headers):
+            environ = {
+                "REQUEST_METHOD": method,
+                "PATH_INFO": path,
+                "QUERY_STRING": "",
+                "SERVER_NAME": "localhost",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "REMOTE_ADDR": "127.0.0.1",
+                "wsgi.input": BytesIO(),
+                "wsgi.url_scheme": "http",
+                "wsgi.errors": BytesIO(),
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+                **{
+                    f"HTTP_{k.upper().replace('-', '_')}": v for k, v in headers.items()
+                },
+            }
+            status = []
+            start = time.perf_counter()
+            response = application(
+                environ, lambda s, h, exc_info=None: status.append(s)
+            )
+            b"".join(response)
+            response.close()
+            if int(status[0].split()[0]) >= 400:
+                raise RuntimeError(f"{method} {path} returned {status[0]}")
+            return time.perf_counter() - start
+
+        return request
+
+    def http_request(self, url):
+        url = urlsplit(url)
+        connections = {}
+
+        def request(method, path, headers):
+            # One keep-alive connection per client thread
+            connection = connections.get(threading.get_ident())
+            if connection is None:
+                connection = connections[
+                    threading.get_ident()
+                ] = http.client.HTTPConnection(url.hostname, url.port or 80)
+            start = time.perf_counter()
+            connection.request(method, path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                raise RuntimeError(f"{method} {path} returned {response.status}")
+            return time.perf_counter() - start
+
+        return request
@@ -0,0 +1,104 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from app.models import BinderModel, EventModel, User
+
+
+def make_document(paragraphs):
+    return {
+        "type": "doc",
+        "content": [
+            {
+                "type": "paragraph",
+                "content": [{"type": "text", "text": f"Paragraph {i} " * 12}],
+            }
+            for i in range(paragraphs)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare full-document saves against JSON Patch saves of binder content"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10, 100, 1000, 5000],
+            help="Document sizes to test, in paragraphs",
+        )
+        parser.add_argument("--saves", type=int, default=50)
+
+    def handle(self, *args, **kwargs):
+        # Everything is rolled back so the benchmark leaves no data behind
+        with transaction.atomic():
+            self.run(kwargs["sizes"], kwargs["saves"])
+            transaction.set_rollback(True)
+
+    def run(self, sizes, saves):
+        user = User.objects.create_user(username="bench_content_updates")
+        token = Token.objects.create(user=user)
+        client = Client(headers={"Authorization": f"Token {token.key}"})
+
+        self.stdout.write(
+            f"{'paragraphs':>10} {'mode':>6} {'sent/save':>12} "
+            f"{'stored/save':>12} {'p50 ms':>8} {'p95 ms':>8}"
+        )
+        for size in sizes:
+            # A user has one binder per event
+            event = EventModel.objects.create(
+                name=f"Benchmark {size}", materialtype="Binder", division="C"
+            )
+            document = make_document(size)
+            binder = BinderModel.objects.create(
+                owner=user, event=event, content=json.dumps(document)
+            )
+            url = f"/api/binders/{binder.id}/"
+
+            timings, sent = [], 0
+            for i in range(saves):
+                document["content"][i % size]["content"][0]["text"] = f"Edit {i}"
+                body = json.dumps({"content": json.dumps(document)})
+                start = time.perf_counter()
+                client.patch(url, body, content_type="application/json")
+                timings.append(time.perf_counter() - start)
+                sent += len(body)
+            self.report(size, "full", sent, binder, saves, timings)
+
+            binder.refresh_from_db()
+            timings, sent = [], 0
+            for i in range(saves):
+                body = json.dumps(
+                    {
+                        "version": binder.version + i,
+                        "patch": [
+                            {
+                                "op": "replace",
+                                "path": f"/content/{i % size}/content/0/text",
+                                "value": f"Patch {i}",
+                            }
+                        ],
+                    }
+                )
+                start = time.perf_counter()
+                client.patch(url + "content/", body, content_type="application/json")
+                timings.append(time.perf_counter() - start)
+                sent += len(body)
+            self.report(size, "patch", sent, binder, saves, timings)
+
+    def report(self, size, mode, sent, binder, saves, timings):
+        binder.refresh_from_db()
+        stored = len(binder.blob.data)
+        timings = sorted(t * 1000 for t in timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{size:>10} {mode:>6} {sent // saves:>12} {stored:>12} "
+            f"{statistics.median(timings):>8.2f} {p95:>8.2f}"
+        )
@@ -0,0 +1,128 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.db.utils import load_backend
+from django.test import override_settings
+
+# SQLite's defaults, which Django uses when no PRAGMAs are set
+DEFAULT_PRAGMAS = {"journal_mode": "delete", "synchronous": "full"}
+
+TABLE = "bench_db_binder"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent binder-style writes and reads on SQLite with and "
+        "without SQLITE_PRAGMAS, and on the configured database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument(
+            "--seconds", type=float, default=3.0, help="Duration of each run"
+        )
+        parser.add_argument(
+            "--size", type=int, default=20000, help="Content size in bytes"
+        )
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(
+            f"{'config':>10} {'writes/s':>10} {'reads/s':>10} {'errors':>8}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas in (
+                ("default", DEFAULT_PRAGMAS),
+                ("tuned", settings.SQLITE_PRAGMAS),
+            ):
+                path = Path(directory) / f"{name}.sqlite3"
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    self.run(name, self.sqlite_connection(path), **kwargs)
+        if connections["default"].vendor != "sqlite":
+            self.run(connections["default"].vendor, self.default_connection, **kwargs)
+
+    @staticmethod
+    def sqlite_connection(path):
+        def connect():
+            config = {
+                **connections["default"].settings_dict,
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": str(path),
+            }
+            backend = load_backend(config["ENGINE"])
+            return backend.DatabaseWrapper(config, "bench_db")
+
+        return connect
+
+    @staticmethod
+    def default_connection():
+        # Django connections are per thread, this is the thread's own one
+        return connections["default"]
+
+    def run(self, name, connect, writers, readers, seconds, size, **kwargs):
+        connection = connect()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            cursor.execute(
+                f"CREATE TABLE {TABLE} "
+                "(id INTEGER PRIMARY KEY, content TEXT, version INTEGER)"
+            )
+            cursor.executemany(
+                f"INSERT INTO {TABLE} VALUES (%s, %s, 0)",
+                [(i, "x" * size) for i in range(writers * 10)],
+            )
+
+        counts = {"writes": 0, "reads": 0, "errors": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def work(kind, index):
+            connection = connect()
+            done = failed = i = 0
+            while time.perf_counter() < deadline:
+                pk = index * 10 + i % 10
+                i += 1
+                try:
+                    with connection.cursor() as cursor:
+                        if kind == "writes":
+                            cursor.execute(
+                                f"UPDATE {TABLE} SET content = %s, "
+                                "version = version + 1 WHERE id = %s",
+                                (str(i % 10) * size, pk),
+                            )
+                        else:
+                            cursor.execute(
+                                f"SELECT content FROM {TABLE} WHERE id = %s", (pk,)
+                            )
+                            cursor.fetchone()
+                    done += 1
+                except DatabaseError:
+                    failed += 1
+            connection.close()
+            with lock:
+                counts[kind] += done
+                counts["errors"] += failed
+
+        threads = [
+            threading.Thread(target=work, args=("writes", i)) for i in range(writers)
+        ] + [
+            threading.Thread(target=work, args=("reads", i % writers))
+            for i in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {TABLE}")
+        connection.close()
+        self.stdout.write(
+            f"{name:>10} {counts['writes'] / seconds:>10.0f} "
+            f"{counts['reads'] / seconds:>10.0f} {counts['errors']:>8}"
+        )
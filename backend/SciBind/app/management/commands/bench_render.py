@@ -0,0 +1,94 @@
+import json
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from app.helpers.renders import render_binder, render_path
+from app.helpers.tasks import start_workers
+from app.models import BinderContent, BinderModel, EventModel, Task, User
+from app.tasks import render_binder_pdf
+
+from .bench_content_updates import make_document
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure rendering the binders of a team to PDF in the request and in "
+        "background workers. Uses the configured database and render directory, "
+        "and removes what it creates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--binders", type=int, default=15, help="Binders printed at once"
+        )
+        parser.add_argument(
+            "--paragraphs",
+            type=int,
+            default=600,
+            help="Paragraphs per binder, 600 is about 40 pages",
+        )
+        parser.add_argument("--workers", type=int, default=settings.TASKS["WORKERS"])
+
+    def handle(self, *args, binders, paragraphs, workers, **kwargs):
+        # The worker processes need to see the binders, so they are committed
+        # and deleted afterwards
+        user = User.objects.create_user(username="bench_render")
+        # A user has one binder per event
+        events = EventModel.objects.bulk_create(
+            EventModel(name=f"Benchmark {i}", materialtype="Binder", division="C")
+            for i in range(binders)
+        )
+        team = []
+        try:
+            for i, event in enumerate(events):
+                document = make_document(paragraphs)
+                document["content"][0]["content"][0]["text"] = f"Binder {i}"
+                team.append(
+                    BinderModel.objects.create(
+                        owner=user, event=event, content=json.dumps(document)
+                    )
+                )
+            self.run(team, workers)
+        finally:
+            blobs = [binder.blob_id for binder in team]
+            for binder in team:
+                render_path(binder).unlink(missing_ok=True)
+            user.delete()
+            EventModel.objects.filter(pk__in=[event.pk for event in events]).delete()
+            BinderContent.objects.filter(pk__in=blobs, binders=None).delete()
+
+    def run(self, team, workers):
+        start = time.perf_counter()
+        for binder in team:
+            render_binder(binder)
+        inline = time.perf_counter() - start
+        with open(render_path(team[-1]), "rb") as f:
+            pages = len(re.findall(rb"/Type\s*/Page\b", f.read()))
+        start = time.perf_counter()
+        for binder in team:
+            render_binder(binder)
+        cached = time.perf_counter() - start
+        self.stdout.write(
+            f"{'in request':>12}: {len(team)} binders ({pages} pages each) in "
+            f"{inline:.2f}s cold, {cached * 1000:.1f}ms cached"
+        )
+
+        for binder in team:
+            render_path(binder).unlink()
+        with override_settings(TASKS={**settings.TASKS, "EAGER": False}):
+            tasks = [render_binder_pdf.enqueue(binder.pk).pk for binder in team]
+        # Includes starting the workers, which a running server doesn't pay
+        start = time.perf_counter()
+        for process in start_workers(workers, burst=True):
+            process.join()
+        elapsed = time.perf_counter() - start
+        done = Task.objects.filter(pk__in=tasks, status=Task.DONE).count()
+        Task.objects.filter(pk__in=tasks).delete()
+        self.stdout.write(
+            f"{f'{workers} workers':>12}: {done} of {len(team)} binders in "
+            f"{elapsed:.2f}s"
+        )
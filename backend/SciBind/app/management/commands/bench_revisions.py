@@ -0,0 +1,83 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from app.helpers.documents import compress_content
+from app.helpers.revisions import get_revision_content
+from app.models import BinderModel, EventModel, User
+
+from .bench_content_updates import make_document
+
+
+class Command(BaseCommand):
+    help = "Measure revision storage and the latency of rebuilding revisions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--saves", type=int, default=200)
+        parser.add_argument("--paragraphs", type=int, default=500)
+        parser.add_argument(
+            "--intervals",
+            type=int,
+            nargs="+",
+            default=[1, 10, 20, 50],
+            help="Keyframe intervals to test",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Approximate number of rebuilds timed per interval",
+        )
+
+    def handle(self, *args, **kwargs):
+        # Everything is rolled back so the benchmark leaves no data behind
+        with transaction.atomic():
+            self.run(**kwargs)
+            transaction.set_rollback(True)
+
+    def run(self, saves, paragraphs, intervals, repeat, **kwargs):
+        user = User.objects.create_user(username="bench_revisions")
+        snapshot, _ = compress_content(json.dumps(make_document(paragraphs)))
+        self.stdout.write(
+            f"{saves} saves of a {paragraphs} paragraph document, "
+            f"{len(snapshot) * saves} bytes as full compressed snapshots"
+        )
+        self.stdout.write(
+            f"{'interval':>8} {'stored':>10} {'ratio':>7} "
+            f"{'rebuild p50 ms':>15} {'rebuild max ms':>15}"
+        )
+        for interval in intervals:
+            # A user has one binder per event
+            event = EventModel.objects.create(
+                name=f"Benchmark {interval}", materialtype="Binder", division="C"
+            )
+            with override_settings(BINDER_REVISION_KEYFRAME_INTERVAL=interval):
+                binder = self.edit(user, event, saves, paragraphs)
+            stored = sum(len(r.data) for r in binder.revisions.only("data"))
+
+            timings = []
+            for number in range(max(1, saves - interval), saves + 1):
+                for _ in range(max(1, repeat // interval)):
+                    start = time.perf_counter()
+                    get_revision_content(binder.pk, number)
+                    timings.append(time.perf_counter() - start)
+            timings = [t * 1000 for t in timings]
+            self.stdout.write(
+                f"{interval:>8} {stored:>10} {stored / (len(snapshot) * saves):>7.3f} "
+                f"{statistics.median(timings):>15.2f} {max(timings):>15.2f}"
+            )
+
+    def edit(self, user, event, saves, paragraphs):
+        document = make_document(paragraphs)
+        binder = BinderModel.objects.create(
+            owner=user, event=event, content=json.dumps(document)
+        )
+        for i in range(1, saves):
+            document["content"][i % paragraphs]["content"][0]["text"] = f"Edit {i}"
+            binder.content = json.dumps(document)
+            binder.save()
+        return binder
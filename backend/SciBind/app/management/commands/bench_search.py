@@ -0,0 +1,109 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.helpers.access import OWNER
+from app.helpers.search import has_fts, search_binders
+from app.models import (
+    BinderAccess,
+    BinderModel,
+    BinderSearchDocument,
+    EventModel,
+    User,
+)
+
+TOPICS = (
+    "cell membrane nucleus protein enzyme heart lung kidney neuron muscle "
+    "bone blood plasma gene chromosome atom molecule orbit planet star "
+    "galaxy comet rock mineral fossil glacier river delta circuit magnet "
+    "force energy wave photon lens mirror friction velocity torque"
+).split()
+
+# A vocabulary with word frequencies following Zipf's law, like real text
+WORDS = TOPICS + [f"term{i}" for i in range(5000)]
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+
+class Command(BaseCommand):
+    help = "Measure binder search latency over many binders"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--binders", type=int, default=20000)
+        parser.add_argument(
+            "--words", type=int, default=500, help="Words of text per binder"
+        )
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--queries", type=int, default=50)
+
+    def handle(self, *args, **kwargs):
+        # Everything is rolled back so the benchmark leaves no data behind
+        with transaction.atomic():
+            self.run(**kwargs)
+            transaction.set_rollback(True)
+
+    def run(self, binders, words, users, queries, **kwargs):
+        random.seed(0)
+        start = time.perf_counter()
+        users = User.objects.bulk_create(
+            User(username=f"bench_search_{i}") for i in range(users)
+        )
+        # Spread evenly over the users, with one binder per user and event
+        events = EventModel.objects.bulk_create(
+            EventModel(name=f"Benchmark {i}", materialtype="Binder", division="C")
+            for i in range(-(-binders // len(users)))
+        )
+        created = BinderModel.objects.bulk_create(
+            (
+                BinderModel(owner=users[i % len(users)], event=events[i // len(users)])
+                for i in range(binders)
+            ),
+            batch_size=1000,
+        )
+        BinderAccess.objects.bulk_create(
+            (
+                BinderAccess(user=binder.owner, binder=binder, role=OWNER)
+                for binder in created
+            ),
+            batch_size=1000,
+        )
+        BinderSearchDocument.objects.bulk_create(
+            (
+                BinderSearchDocument(
+                    binder=binder,
+                    text=" ".join(random.choices(WORDS, WEIGHTS, k=words)),
+                )
+                for binder in created
+            ),
+            batch_size=500,
+        )
+        self.stdout.write(
+            f"Indexed {binders} binders of {words} words in "
+            f"{time.perf_counter() - start:.1f}s "
+            f"({'FTS5' if has_fts() else 'substring matching'})"
+        )
+
+        everything = BinderModel.objects.all()
+        self.stdout.write(f"{'scope':>10} {'query':>16} {'p50 ms':>8} {'p95 ms':>8}")
+        for scope, binders_of in (
+            (
+                "one user",
+                lambda: BinderModel.objects.accessible_to(random.choice(users)),
+            ),
+            ("all", lambda: everything),
+        ):
+            for query in ("cell", "heart blood", "gal", "term4000"):
+                timings = []
+                for _ in range(queries):
+                    binders = binders_of()
+                    start = time.perf_counter()
+                    search_binders(binders, query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f"{scope:>10} {query:>16} {statistics.median(timings):>8.2f} "
+                    f"{p95:>8.2f}"
+                )
@@ -1,65 +1,150 @@
 import csv
-from django.core.management.base import BaseCommand
+import os
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from app.helpers.catalog import event_catalog
 from app.models import EventModel
+from app.tasks import import_events
+
+# CSV column -> EventModel field for the columns that can be updated
+COLUMNS = {
+    "Material Type": "materialtype",
+    "Image Name": "display_image",
+    "Description": "description",
+    "Category": "category",
+}
 
 
 class Command(BaseCommand):
-    help = "Load events from a CSV file"
+    help = "Load events from a CSV file, creating new events and updating existing ones"
 
     def add_arguments(self, parser):
-        parser.add_argument("csv_file", type=str)
+        parser.add_argument("csv_file", type=str, help="CSV file path, or - for stdin")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of events written per query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the changes that would be made without saving them",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the import for the background task workers",
+        )
 
     def handle(self, *args, **kwargs):
-        if EventModel.objects.exists():
-            self.stdout.write(
-                self.style.WARNING("Events already loaded. Modifying events...")
-            )
-            MODIFY = True
+        if kwargs["background"]:
+            return self.enqueue(kwargs["csv_file"], kwargs["batch_size"])
+        start = time.perf_counter()
+        self.batch_size = kwargs["batch_size"]
+        self.dry_run = kwargs["dry_run"]
+        self.verbosity = kwargs["verbosity"]
+        self.to_create, self.to_update = [], {}
+        self.counts = {"created": 0, "updated": 0, "unchanged": 0}
+
+        if kwargs["csv_file"] == "-":
+            self.load(sys.stdin)
         else:
-            MODIFY = False
-        with open(kwargs["csv_file"], "r") as f:
-            reader = csv.DictReader(f)
-            with transaction.atomic():
-                for row in reader:
-                    name, division = row["Name"], row["Division"]
-                    if MODIFY:
-                        if event := EventModel.objects.get(
-                            name=name, division=division
-                        ):
-                            event.materialtype = row.get(
-                                "Material Type", event.materialtype
-                            )
-                            event.display_image = row.get(
-                                "Image Name", event.display_image
-                            )
-                            event.description = row.get(
-                                "Description", event.description
-                            )
-                            event.category = row.get("Category", event.category)
-                            event.save()
-                            self.stdout.write(
-                                self.style.SUCCESS(
-                                    f"Event '{name}' modified successfully."
-                                )
-                            )
-                        else:
-                            self.stdout.write(
-                                self.style.WARNING(f"Event '{name}' does not exist.")
-                            )
-                    else:
-                        EventModel.objects.create(
-                            name=name,
-                            materialtype=row["Material Type"],
-                            division=division,
-                            display_image=row["Image Name"],
-                            description=row["Description"],
-                            category=row["Category"],
-                        )
-                        self.stdout.write(
-                            self.style.SUCCESS(f"Event '{name}' created successfully.")
-                        )
-                    if MODIFY:
-                        self.stdout.write(
-                            self.style.SUCCESS("Events modified successfully.")
-                        )
+            try:
+                with open(kwargs["csv_file"], "r", newline="") as f:
+                    self.load(f)
+            except FileNotFoundError as e:
+                raise CommandError(e)
+
+        if not self.dry_run:
+            event_catalog.invalidate()
+        prefix = "Would have " if self.dry_run else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}{self.counts['created']} created, "
+                f"{self.counts['updated']} updated, "
+                f"{self.counts['unchanged']} unchanged "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        )
+
+    def enqueue(self, csv_file, batch_size):
+        if csv_file == "-":
+            raise CommandError("Can't import from stdin in the background")
+        if not os.path.isfile(csv_file):
+            raise CommandError(f"No such file: {csv_file}")
+        queued = import_events.enqueue(os.path.abspath(csv_file), batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Queued import as task {queued.pk}"))
+
+    def load(self, file):
+        reader = csv.DictReader(file)
+        missing = {"Name", "Division", "Material Type"} - set(reader.fieldnames or [])
+        if missing:
+            raise CommandError(f"Missing columns: {', '.join(sorted(missing))}")
+        columns = [column for column in COLUMNS if column in reader.fieldnames]
+
+        with transaction.atomic():
+            # (name, division) -> event, for existing events and created ones
+            index = {}
+            for event in EventModel.objects.order_by("-id"):
+                index[(event.name, event.division)] = event
+
+            for row in reader:
+                key = (row["Name"], row["Division"])
+                if (event := index.get(key)) is None:
+                    event = index[key] = EventModel(name=key[0], division=key[1])
+                    for column in columns:
+                        setattr(event, COLUMNS[column], row[column])
+                    self.create(event)
+                else:
+                    self.update(event, row, columns)
+            self.flush_creates()
+            self.flush_updates()
+
+    def create(self, event):
+        self.counts["created"] += 1
+        self.log(f"+ {event.name} ({event.division})")
+        self.to_create.append(event)
+        if len(self.to_create) >= self.batch_size:
+            self.flush_creates()
+
+    def update(self, event, row, columns):
+        changes = [
+            (COLUMNS[column], getattr(event, COLUMNS[column]), row[column])
+            for column in columns
+            if getattr(event, COLUMNS[column]) != row[column]
+        ]
+        if not changes:
+            self.counts["unchanged"] += 1
+            return
+        for field, old, new in changes:
+            self.log(f"~ {event.name} ({event.division}) {field}: {old!r} -> {new!r}")
+            setattr(event, field, new)
+
+        if event.pk is None:
+            # Created earlier in this file and not yet written
+            return
+        self.counts["updated"] += event.pk not in self.to_update
+        self.to_update[event.pk] = event
+        if len(self.to_update) >= self.batch_size:
+            self.flush_updates()
+
+    def flush_creates(self):
+        if self.to_create and not self.dry_run:
+            EventModel.objects.bulk_create(self.to_create, batch_size=self.batch_size)
+        self.to_create = []
+
+    def flush_updates(self):
+        if self.to_update and not self.dry_run:
+            EventModel.objects.bulk_update(
+                self.to_update.values(),
+                list(COLUMNS.values()),
+                batch_size=self.batch_size,
+            )
+        self.to_update = {}
+
+    def log(self, message):
+        if self.dry_run or self.verbosity > 1:
+            self.stdout.write(message)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from app.helpers.revisions import copy_revisions, record_revision
+from app.models import BinderModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge the binders a user has for the same event into one, keeping the "
+        "content and history of the others as revisions of it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the binders that would be merged",
+        )
+
+    def handle(self, *args, dry_run, **kwargs):
+        duplicates = (
+            BinderModel.objects.values("owner_id", "event_id")
+            .annotate(count=Count("id"))
+            .filter(count__gt=1)
+            .order_by("owner_id", "event_id")
+        )
+        merged = 0
+        for pair in list(duplicates):
+            # The active binder with the most saves is kept
+            keep, *drop = BinderModel.objects.filter(
+                owner_id=pair["owner_id"], event_id=pair["event_id"]
+            ).order_by("old", "-version", "id")
+            self.stdout.write(
+                f"Owner {pair['owner_id']}, event {pair['event_id']}: keeping "
+                f"binder {keep.pk}, merging {', '.join(str(b.pk) for b in drop)}"
+            )
+            if not dry_run:
+                self.merge(keep, drop)
+            merged += len(drop)
+
+        prefix = "Would merge" if dry_run else "Merged"
+        self.stdout.write(
+            self.style.SUCCESS(f"{prefix} {merged} binders into {len(duplicates)}")
+        )
+
+    @transaction.atomic
+    def merge(self, keep, drop):
+        for binder in drop:
+            if not copy_revisions(binder.pk, keep.pk) and binder.blob_id:
+                # Content saved before revisions were recorded
+                record_revision(keep.pk, binder.content)
+            keep.shared_with.add(*binder.shared_with.exclude(pk=keep.owner_id))
+        if keep.blob_id:
+            # The kept content stays the latest revision
+            record_revision(keep.pk, keep.content)
+        BinderModel.objects.filter(pk__in=[binder.pk for binder in drop]).delete()
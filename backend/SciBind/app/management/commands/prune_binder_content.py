@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from app.models import BinderContent, BinderModel
+
+
+class Command(BaseCommand):
+    help = "Delete stored binder content that no binder refers to anymore"
+
+    def handle(self, *args, **kwargs):
+        quote = connection.ops.quote_name
+        content = quote(BinderContent._meta.db_table)
+        binders = quote(BinderModel._meta.db_table)
+        digest = quote(BinderContent._meta.pk.column)
+        blob = quote(BinderModel._meta.get_field("blob").column)
+        # One statement that checks for references as it deletes, rather than
+        # QuerySet.delete(), which selects the unused rows first and deletes
+        # them in a second query, so content saved in between would be lost
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {content} WHERE NOT EXISTS "
+                f"(SELECT 1 FROM {binders} WHERE {binders}.{blob} = {content}.{digest})"
+            )
+            deleted = cursor.rowcount
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unused documents"))
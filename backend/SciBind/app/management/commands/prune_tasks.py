@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import Task
+
+
+class Command(BaseCommand):
+    help = "Delete finished background tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=7, help="Keep tasks finished this recently"
+        )
+
+    def handle(self, *args, days, **kwargs):
+        deleted, _ = Task.objects.filter(
+            status__in=[Task.DONE, Task.FAILED],
+            finished__lt=timezone.now() - timedelta(days=days),
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} finished tasks"))
@@ -0,0 +1,48 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.helpers.tasks import run_worker, start_workers
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.TASKS["WORKERS"],
+            help="Number of worker processes, 1 runs tasks in this process",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Stop once there are no due tasks instead of waiting for more",
+        )
+
+    def handle(self, *args, processes, burst, **kwargs):
+        if processes <= 1:
+            count = run_worker(burst)
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} tasks"))
+            return
+
+        workers = start_workers(processes, burst)
+
+        def stop(signum, frame):
+            # Workers finish their current task before exiting
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"Started {processes} workers")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # The workers got the interrupt too
+            for worker in workers:
+                worker.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.helpers.loadtest import seed
+from app.models import User
+
+from .bench_api import add_data_arguments
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed the configured database with users, binders shared between "
+        "them and large documents, e.g. to try the front end or the "
+        "benchmarks against realistic data"
+    )
+
+    def add_arguments(self, parser):
+        add_data_arguments(parser)
+        parser.add_argument(
+            "--prefix", default="seed", help="Prefix of the created usernames"
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(
+                f"Users named {options['prefix']}-* exist, choose another --prefix"
+            )
+        start = time.perf_counter()
+        try:
+            data = seed(
+                users=options["users"],
+                binders=options["binders"],
+                shares=options["shares"],
+                paragraphs=options["paragraphs"],
+                large=options["large"],
+                large_paragraphs=options["large_paragraphs"],
+                events=options["events"],
+                prefix=options["prefix"],
+                seed=options["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        user = data.users[0]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(data.users)} users and {options['binders']} binders "
+                f"in {time.perf_counter() - start:.1f}s. Log in as e.g. "
+                f"{user.username} with the token {data.tokens[user.pk]}"
+            )
+        )
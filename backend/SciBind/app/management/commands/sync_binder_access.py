@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.helpers.access import sync_access
+from app.models import BinderAccess, BinderModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the BinderAccess table against binder owners and shared_with, "
+        "and repair it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report differences, exiting with an error if there are any",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of binders checked per query",
+        )
+
+    def handle(self, *args, check, batch_size, **kwargs):
+        totals = [0, 0, 0]
+        binder_ids = BinderModel.objects.order_by("pk").values_list("pk", flat=True)
+        batch = []
+        for binder_id in binder_ids.iterator(chunk_size=batch_size):
+            batch.append(binder_id)
+            if len(batch) == batch_size:
+                self.sync(batch, check, totals)
+                batch = []
+        self.sync(batch, check, totals)
+
+        missing, wrong, stale = totals
+        prefix = "Found" if check else "Fixed"
+        message = (
+            f"{prefix} {missing} missing, {wrong} wrong and {stale} stale rows "
+            f"({BinderAccess.objects.count()} rows)"
+        )
+        if check and any(totals):
+            raise CommandError(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def sync(self, binder_ids, check, totals):
+        if not binder_ids:
+            return
+        for i, count in enumerate(sync_access(binder_ids, dry_run=check)):
+            totals[i] += count
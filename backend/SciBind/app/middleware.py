@@ -0,0 +1,65 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .helpers.metrics import finish_request, registry, route_name, start_request
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database queries and response size of every request
+    per route (see app/helpers/metrics.py). Supports sync and async views
+    without adapting either, and is left out when METRICS["ENABLED"] is off.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        stats, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request(token)
+        self.observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        stats, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request(token)
+        self.observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    @staticmethod
+    def observe(request, response, duration, stats):
+        if response.has_header("Content-Length"):
+            size = int(response["Content-Length"])
+        elif not response.streaming:
+            size = len(response.content)
+        else:
+            size = None
+        registry.observe(
+            request.method,
+            route_name(request),
+            response.status_code,
+            duration,
+            stats,
+            size,
+        )
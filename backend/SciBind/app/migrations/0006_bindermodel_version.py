@@ -0,0 +1,17 @@
+# Generated by Django 5.0.8 on 2026-10-18 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0005_eventmodel_category_eventmodel_description"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bindermodel",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.8 on 2026-10-18 07:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from app.helpers.documents import decode_content, encode_content
+
+
+def move_content_to_blobs(apps, schema_editor):
+    BinderModel = apps.get_model("app", "BinderModel")
+    BinderContent = apps.get_model("app", "BinderContent")
+    for binder in BinderModel.objects.exclude(content__isnull=True).only("content").iterator():
+        digest, data, size = encode_content(binder.content)
+        BinderContent.objects.get_or_create(
+            digest=digest, defaults={"data": data, "size": size}
+        )
+        BinderModel.objects.filter(pk=binder.pk).update(blob_id=digest)
+
+
+def move_blobs_to_content(apps, schema_editor):
+    BinderModel = apps.get_model("app", "BinderModel")
+    for binder in BinderModel.objects.exclude(blob=None).select_related("blob"):
+        BinderModel.objects.filter(pk=binder.pk).update(
+            content=decode_content(binder.blob.data)
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0006_bindermodel_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BinderContent",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.BinaryField()),
+                ("size", models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="bindermodel",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="binders",
+                to="app.bindercontent",
+            ),
+        ),
+        migrations.RunPython(move_content_to_blobs, move_blobs_to_content),
+        migrations.RemoveField(
+            model_name="bindermodel",
+            name="content",
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.8 on 2026-10-18 07:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0007_bindercontent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BinderRevision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("keyframe", models.BooleanField()),
+                ("data", models.BinaryField()),
+                ("size", models.PositiveIntegerField()),
+                (
+                    "binder",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revisions",
+                        to="app.bindermodel",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="binderrevision",
+            constraint=models.UniqueConstraint(
+                fields=("binder", "number"), name="unique_binder_revision"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.8 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from app.helpers.documents import decode_content
+from app.helpers.search import FTS_SCHEMA, FTS_TABLE, extract_text
+
+
+def create_fts_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        if ("ENABLE_FTS5",) not in cursor.fetchall():
+            return
+    for statement in FTS_SCHEMA:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for trigger in ("insert", "delete", "update"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_binders(apps, schema_editor):
+    BinderModel = apps.get_model("app", "BinderModel")
+    BinderSearchDocument = apps.get_model("app", "BinderSearchDocument")
+    binders = BinderModel.objects.exclude(blob=None).select_related("blob")
+    BinderSearchDocument.objects.bulk_create(
+        (
+            BinderSearchDocument(
+                binder_id=binder.pk, text=extract_text(decode_content(binder.blob.data))
+            )
+            for binder in binders.iterator(chunk_size=500)
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0008_binderrevision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BinderSearchDocument",
+            fields=[
+                (
+                    "binder",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="app.bindermodel",
+                    ),
+                ),
+                ("text", models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+        migrations.RunPython(index_binders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_access(apps, schema_editor):
+    BinderModel = apps.get_model("app", "BinderModel")
+    BinderAccess = apps.get_model("app", "BinderAccess")
+    BinderAccess.objects.bulk_create(
+        (
+            BinderAccess(user_id=owner_id, binder_id=binder_id, role="owner")
+            for binder_id, owner_id in BinderModel.objects.values_list(
+                "pk", "owner_id"
+            ).iterator(chunk_size=1000)
+        ),
+        batch_size=1000,
+    )
+    # Binders shared with their owner keep the owner row
+    BinderAccess.objects.bulk_create(
+        (
+            BinderAccess(user_id=user_id, binder_id=binder_id, role="shared")
+            for binder_id, user_id in BinderModel.shared_with.through.objects.values_list(
+                "bindermodel_id", "user_id"
+            ).iterator(
+                chunk_size=1000
+            )
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0010_task"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BinderAccess",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("owner", "Owner"), ("shared", "Shared")],
+                        max_length=10,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "binder",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="access",
+                        to="app.bindermodel",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="binderaccess",
+            constraint=models.UniqueConstraint(
+                fields=("user", "binder"), name="unique_binder_access"
+            ),
+        ),
+        migrations.RunPython(backfill_access, migrations.RunPython.noop),
+    ]
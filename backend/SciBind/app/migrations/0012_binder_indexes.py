@@ -0,0 +1,66 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def check_duplicate_binders(apps, schema_editor):
+    # Merging deletes binders, so it is left to merge_duplicate_binders
+    BinderModel = apps.get_model("app", "BinderModel")
+    duplicates = list(
+        BinderModel.objects.values_list("owner_id", "event_id")
+        .annotate(count=models.Count("id"))
+        .filter(count__gt=1)
+        .order_by("owner_id", "event_id")
+    )
+    if duplicates:
+        pairs = ", ".join(
+            f"(owner {owner_id}, event {event_id})"
+            for owner_id, event_id, _ in duplicates[:20]
+        )
+        if len(duplicates) > 20:
+            pairs += f" and {len(duplicates) - 20} more"
+        raise RuntimeError(
+            f"Users have several binders for the same event: {pairs}. Merge "
+            "them with `manage.py merge_duplicate_binders` and migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0011_binderaccess"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_binders, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="bindermodel",
+            index=models.Index(
+                fields=["owner", "old"], name="app_binder_owner_old_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="eventmodel",
+            index=models.Index(
+                fields=["name", "division"], name="app_event_name_div_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="bindermodel",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "event"), name="unique_binder_owner_event"
+            ),
+        ),
+        # Covered by the indexes above
+        migrations.AlterField(
+            model_name="bindermodel",
+            name="owner",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from SciBind.settings import MEDIA_ROOT
+from .helpers import access
+from .helpers.documents import decode_content, encode_content
+from .helpers.revisions import record_revision
+from .helpers.search import index_binder
 
 import os
 import random
@@ -49,6 +54,12 @@ class EventModel(models.Model):
     description = models.TextField(blank=True, null=True)
     category = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        # load_csv matches events by name and division
+        indexes = [
+            models.Index(fields=["name", "division"], name="app_event_name_div_idx")
+        ]
+
     def __str__(self):
         return self.name
 
@@ -57,8 +68,91 @@ class EventModel(models.Model):
         return self.bindermodel_set.exists()
 
 
+class BinderQuerySet(models.QuerySet):
+    def accessible_to(self, user):
+        """
+        Filters to binders the user owns or that are shared with them.
+
+        Reads the BinderAccess table, where every binder a user can open has
+        one row, so this is a join on its (user, binder) index that needs no
+        DISTINCT and doesn't slow down as more binders are shared.
+        """
+        return self.filter(access__user=user)
+
+    def for_listing(self, fields=None):
+        """
+        Loads what BinderListSerializer needs: the event, and the ids of the
+        users the binders are shared with and of the online users.
+
+        Args:
+            fields: The serialized fields that are needed, or None for all.
+        """
+        queryset = self.select_related("event")
+        for name in ("shared_with", "online_users"):
+            if fields is None or name in fields:
+                queryset = queryset.prefetch_related(
+                    models.Prefetch(name, queryset=User.objects.only("id"))
+                )
+        return queryset
+
+    def update_content(self, content, **kwargs):
+        """
+        Sets the content of the binders, increments their version, records a
+        revision of each and updates their search documents.
+
+        Args:
+            content: The new content value.
+            **kwargs: Other fields to update.
+
+        Returns:
+            int: The number of binders updated.
+        """
+        kwargs.setdefault("version", models.F("version") + 1)
+        blob = BinderContent.store(content)
+        with transaction.atomic():
+            pks = list(self.select_for_update().values_list("pk", flat=True))
+            BinderModel.objects.filter(pk__in=pks).update(blob=blob, **kwargs)
+            for pk in pks:
+                record_revision(pk, content)
+                index_binder(pk, content)
+        return len(pks)
+
+
+class BinderContent(models.Model):
+    """
+    A compressed binder document, addressed by the digest of its content.
+
+    Binders that have the same content share one row, and binder rows only
+    hold the digest, so listing binders never reads documents.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    # Uncompressed size in bytes
+    size = models.PositiveIntegerField()
+
+    @classmethod
+    def store(cls, content):
+        """
+        Returns the BinderContent holding a content value, creating it if
+        needed, or None for empty content.
+        """
+        if content is None:
+            return None
+        digest, data, size = encode_content(content)
+        blob = cls(digest=digest, data=data, size=size)
+        # A single INSERT that does nothing if the content is already stored
+        cls.objects.bulk_create([blob], ignore_conflicts=True)
+        return blob
+
+    @property
+    def value(self):
+        return decode_content(self.data)
+
+
 class BinderModel(models.Model):
-    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    # The indexes below start with the owner
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     event = models.ForeignKey(EventModel, on_delete=models.CASCADE)
     date = models.DateField(auto_now_add=True)
     shared_with = models.ManyToManyField(
@@ -67,17 +161,239 @@ class BinderModel(models.Model):
     materialtype = models.CharField(
         max_length=100, choices=EventModel.materialchoices, blank=True
     )
-    content = models.JSONField(blank=True, null=True)
+    blob = models.ForeignKey(
+        BinderContent,
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name="binders",
+    )
+    # Incremented on every content save, used for optimistic concurrency
+    version = models.PositiveIntegerField(default=0)
     old = models.BooleanField(default=False)
     online_users = models.ManyToManyField(
         User, related_name="online_binders", blank=True
     )
 
-    def save(self, *args, **kwargs):
+    objects = BinderQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # A user has one binder per event, see set_events
+            models.UniqueConstraint(
+                fields=["owner", "event"], name="unique_binder_owner_event"
+            )
+        ]
+        indexes = [
+            # A user's active or archived binders
+            models.Index(fields=["owner", "old"], name="app_binder_owner_old_idx")
+        ]
+
+    @property
+    def content(self):
+        """
+        The binder's document, loaded from its BinderContent on first access.
+        """
+        if "_content" not in self.__dict__:
+            self._content = None if self.blob_id is None else self.blob.value
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._content_changed = True
+
+    def is_accessible_by(self, user):
+        """
+        Returns whether the user owns the binder or it is shared with them.
+        """
+        if self.owner_id == user.pk:
+            return True
+        return BinderAccess.objects.filter(binder_id=self.pk, user_id=user.pk).exists()
+
+    async def ais_accessible_by(self, user):
+        """
+        Async version of is_accessible_by().
+        """
+        if self.owner_id == user.pk:
+            return True
+        return await BinderAccess.objects.filter(
+            binder_id=self.pk, user_id=user.pk
+        ).aexists()
+
+    def save(self, *args, update_fields=None, **kwargs):
         if self.event:
             self.materialtype = self.event.materialtype
             self.division = self.event.division
-        super().save(*args, **kwargs)
+        if update_fields is not None and "content" in update_fields:
+            update_fields = ["blob" if f == "content" else f for f in update_fields]
+        if not self.__dict__.get("_content_changed"):
+            super().save(*args, update_fields=update_fields, **kwargs)
+            return
+        self.blob = BinderContent.store(self._content)
+        with transaction.atomic():
+            super().save(*args, update_fields=update_fields, **kwargs)
+            record_revision(self.pk, self._content)
+            index_binder(self.pk, self._content)
+        del self._content_changed
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to notice owner changes
+        instance._loaded_owner_id = instance.__dict__.get("owner_id")
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        if fields is not None:
+            fields = ["blob" if f == "content" else f for f in fields]
+        super().refresh_from_db(using, fields, **kwargs)
+        if fields is None or "blob" in fields:
+            self.__dict__.pop("_content", None)
+            self.__dict__.pop("_content_changed", None)
 
     def __str__(self):
         return f"{self.event.name} Binder - {self.owner.username}"
+
+
+class BinderAccess(models.Model):
+    """
+    A user's access to a binder, as its owner or shared with them.
+
+    Maintained from BinderModel.owner and shared_with by the signals below,
+    see app/helpers/access.py.
+    """
+
+    roles = [(access.OWNER, "Owner"), (access.SHARED, "Shared")]
+
+    # The (user, binder) constraint's index covers lookups by user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    binder = models.ForeignKey(
+        BinderModel, on_delete=models.CASCADE, related_name="access"
+    )
+    role = models.CharField(max_length=10, choices=roles)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "binder"], name="unique_binder_access"
+            )
+        ]
+
+
+@receiver(post_save, sender=BinderModel)
+def sync_owner_access(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        BinderAccess.objects.bulk_create(
+            [
+                BinderAccess(
+                    user_id=instance.owner_id, binder=instance, role=access.OWNER
+                )
+            ],
+            ignore_conflicts=True,
+        )
+    elif (update_fields is None or "owner" in update_fields) and getattr(
+        instance, "_loaded_owner_id", None
+    ) != instance.owner_id:
+        access.sync_access([instance.pk])
+    instance._loaded_owner_id = instance.owner_id
+
+
+@receiver(m2m_changed, sender=BinderModel.shared_with.through)
+def sync_shared_access(sender, instance, action, reverse, pk_set, **kwargs):
+    # Reverse changes come from user.shared_binders, with binder ids
+    if reverse:
+        binder_ids, user_ids = pk_set, [instance.pk]
+    else:
+        binder_ids, user_ids = [instance.pk], pk_set
+    if action == "post_add":
+        access.share(binder_ids, user_ids)
+    elif action in ("post_remove", "post_clear"):
+        access.unshare(binder_ids, user_ids)
+
+
+class BinderRevision(models.Model):
+    """
+    A saved version of a binder's content.
+
+    Keyframes hold the compressed content, other revisions a compressed JSON
+    Patch against the previous revision (see app/helpers/revisions.py).
+    """
+
+    binder = models.ForeignKey(
+        BinderModel, on_delete=models.CASCADE, related_name="revisions"
+    )
+    number = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    keyframe = models.BooleanField()
+    data = models.BinaryField()
+    # Uncompressed size of the content in bytes
+    size = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["binder", "number"], name="unique_binder_revision"
+            )
+        ]
+
+
+class BinderSearchDocument(models.Model):
+    """
+    The searchable text of a binder (see app/helpers/search.py).
+    """
+
+    binder = models.OneToOneField(
+        BinderModel,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+    )
+    text = models.TextField()
+
+
+class Task(models.Model):
+    """
+    A background task, queued and run by app/helpers/tasks.py.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    statuses = [(s, s.capitalize()) for s in (QUEUED, RUNNING, DONE, FAILED)]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # Higher priority tasks run first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=statuses, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Retries are delayed by moving this into the future
+    run_at = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    # Identifies tasks doing the same work, so it isn't queued twice
+    key = models.CharField(max_length=200, null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # The user allowed to see the task's status
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name="tasks"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "-priority", "run_at"], name="app_task_queue_idx"
+            ),
+            models.Index(fields=["key"], name="app_task_key_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,83 @@
+"""
+Listing of querysets for the list endpoints.
+
+Lists are returned whole by default. With `limit`, they are paginated on the
+id, so a page is a single indexed range query however deep it is, and with
+`stream=1` the rows are serialized and sent as they are fetched, so long lists
+aren't built in memory. `fields` limits the serialized fields in all three
+cases.
+"""
+
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework import pagination, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination on the id, used when the `limit` query parameter is
+    given. Follow the `next` URL of a page for the next one.
+    """
+
+    ordering = "id"
+    page_size = None
+    page_size_query_param = "limit"
+    max_page_size = 1000
+
+
+def stream_json(rows, chunk_size=500):
+    """
+    Yields a JSON array of rows, a chunk of rows at a time.
+
+    Args:
+        rows: An iterable of JSON serializable rows.
+        chunk_size: The number of rows rendered together.
+    """
+    renderer = JSONRenderer()
+    rows = iter(rows)
+    separator = b""
+    yield b"["
+    while chunk := list(islice(rows, chunk_size)):
+        yield separator + b",".join(map(renderer.render, chunk))
+        separator = b","
+    yield b"]"
+
+
+def list_response(request, queryset, serializer_class, chunk_size=500):
+    """
+    Returns a response listing a queryset according to the `fields`, `limit`,
+    `cursor` and `stream` query parameters.
+
+    Args:
+        request: The request object.
+        queryset: The queryset to list.
+        serializer_class: A serializer with SparseFieldsMixin.
+        chunk_size: The number of rows fetched at a time when streaming.
+
+    Returns:
+        Response: The whole list, a page of it, or a streamed list.
+    """
+    context = {"request": request}
+    fields = request.GET.get("fields")
+    fields = fields.split(",") if fields else None
+    try:
+        serializer = serializer_class(fields=fields, context=context)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.GET.get("stream") == "1":
+        rows = queryset.order_by("id").iterator(chunk_size=chunk_size)
+        return StreamingHttpResponse(
+            stream_json(map(serializer.to_representation, rows), chunk_size),
+            content_type="application/json",
+        )
+
+    paginator = CursorPagination()
+    if (page := paginator.paginate_queryset(queryset, request)) is not None:
+        serializer = serializer_class(page, many=True, fields=fields, context=context)
+        return paginator.get_paginated_response(serializer.data)
+    serializer = serializer_class(queryset, many=True, fields=fields, context=context)
+    return Response(serializer.data)
@@ -0,0 +1,55 @@
+from rest_framework import permissions
+
+
+def can_access_binder(request, binder):
+    """
+    Returns whether the request's user can read and edit a binder.
+
+    The answer is remembered on the request, so checking the same binder
+    again while handling the request doesn't query the database.
+
+    Args:
+        request: The request object.
+        binder: The BinderModel instance.
+
+    Returns:
+        bool: True if the user owns the binder or it is shared with them.
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return False
+    memo = getattr(request, "_binder_access", None)
+    if memo is None:
+        memo = request._binder_access = {}
+    if binder.pk not in memo:
+        memo[binder.pk] = binder.is_accessible_by(user)
+    return memo[binder.pk]
+
+
+async def acan_access_binder(request, binder):
+    """
+    Async version of can_access_binder().
+    """
+    user = request.user
+    if not user or not user.is_authenticated:
+        return False
+    memo = getattr(request, "_binder_access", None)
+    if memo is None:
+        memo = request._binder_access = {}
+    if binder.pk not in memo:
+        memo[binder.pk] = await binder.ais_accessible_by(user)
+    return memo[binder.pk]
+
+
+class CanAccessBinder(permissions.BasePermission):
+    """
+    Allows access to binders the user owns or that are shared with them.
+    Only the owner may delete a binder.
+    """
+
+    message = "You don't have permission to access this binder"
+
+    def has_object_permission(self, request, view, obj):
+        if getattr(view, "action", None) == "destroy":
+            return request.user.is_authenticated and obj.owner_id == request.user.pk
+        return can_access_binder(request, obj)
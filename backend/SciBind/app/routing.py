@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import BinderConsumer
+
+websocket_urlpatterns = [
+    path("ws/binders/<int:pk>/", BinderConsumer.as_asgi()),
+]
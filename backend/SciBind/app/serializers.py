@@ -1,8 +1,27 @@
 from rest_framework import serializers
-from .models import BinderModel, EventModel
+from .helpers.images import event_image, image_store, image_url
+from .models import BinderModel, EventModel, User
 
 
-class BinderSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Lets a serializer be limited to some of its fields with a `fields`
+    argument, so clients can trim the payload.
+
+    Raises:
+        ValueError: If a field doesn't exist.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            if unknown := set(fields) - set(self.fields):
+                raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class BinderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     event = serializers.CharField(source="event.name")
     division = serializers.CharField(source="event.division")
     content = serializers.JSONField(required=False)
@@ -16,13 +35,49 @@ class BinderSerializer(serializers.ModelSerializer):
             "shared_with",
             "materialtype",
             "content",
+            "version",
             "old",
             "online_users",
             "division",
         ]
+        read_only_fields = ["version"]
+
+
+class BinderListSerializer(BinderSerializer):
+    """
+    BinderSerializer without the document content, used for listing binders.
+    Adds the cacheable URL of the binder's event image, sized for cards.
+    """
+
+    image = serializers.SerializerMethodField()
+
+    class Meta(BinderSerializer.Meta):
+        fields = [f for f in BinderSerializer.Meta.fields if f != "content"] + ["image"]
 
+    def get_image(self, obj):
+        if url := image_url(event_image(obj.event), self.context.get("request")):
+            return f"{url}?size=card"
+        return None
 
-class EventSerializer(serializers.ModelSerializer):
+
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = EventModel
         fields = ["id", "name", "division", "materialtype", "description", "category"]
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    The user's profile, with the cacheable URL of their profile picture.
+    """
+
+    profile_picture = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ["username", "email", "first_name", "last_name", "profile_picture"]
+
+    def get_profile_picture(self, obj):
+        return image_url(
+            image_store.get(obj.profile_picture), self.context.get("request")
+        )
@@ -0,0 +1,48 @@
+"""
+Background tasks, run by `manage.py run_worker` (see app/helpers/tasks.py).
+"""
+
+from pathlib import Path
+
+from django.core.management import call_command
+
+from .helpers.pdf import PageLimitExceeded, UnsupportedCharacters
+from .helpers.renders import render_binder
+from .helpers.tasks import task
+from .helpers.variants import SIZES, generate
+from .models import BinderModel
+
+
+@task(priority=10)
+def render_binder_pdf(binder_id):
+    """
+    Renders a binder to its cached PDF.
+
+    Returns:
+        dict: The URL of the PDF, or the error if the binder doesn't fit its
+        page limit or has characters that can't be printed, which retrying
+        wouldn't change.
+    """
+    binder = BinderModel.objects.select_related("blob").get(pk=binder_id)
+    try:
+        render_binder(binder)
+    except (PageLimitExceeded, UnsupportedCharacters) as e:
+        return {"error": str(e)}
+    return {"url": f"/api/binders/{binder_id}/pdf/"}
+
+
+@task(priority=5)
+def generate_image_variant(source, destination, size, fmt):
+    """
+    Generates a variant of an image (see app/helpers/variants.py).
+    """
+    if not Path(destination).exists():
+        generate(Path(source), Path(destination), SIZES[size], fmt)
+
+
+@task
+def import_events(csv_file, batch_size=500):
+    """
+    Loads events from a CSV file with the load_csv command.
+    """
+    call_command("load_csv", csv_file, batch_size=batch_size)
@@ -1,9 +1,62 @@
+import asyncio
 import os
+import re
+import base64
+import hashlib
 import csv
+import json
+import tempfile
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from datetime import timedelta
 
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from .models import User, EventModel
+from PIL import Image as PILImage
+from pypdf import PdfReader
+
+from SciBind.asgi import application
+from .authentication import token_cache
+from .consumers import BinderConsumer, BinderSession
+from .helpers.catalog import event_catalog
+from .helpers.images import ImageStore, event_image, image_store, image_url
+from .helpers import loadtest
+from .helpers.metrics import clean_route, registry
+from .helpers.pdf import UnsupportedCharacters, render_pdf
+from .helpers.renders import load_image
+from .helpers.revisions import copy_revisions, get_revision_content
+from .helpers.search import extract_text
+from .helpers.tasks import claim, requeue_stale, run_worker, task
+from .helpers.variants import variant_store
+from .helpers.writebehind import get_buffer
+from .models import (
+    BinderAccess,
+    BinderContent,
+    BinderModel,
+    BinderQuerySet,
+    Task,
+    User,
+    EventModel,
+)
+from .pagination import stream_json
+from .permissions import can_access_binder
+from .views import Binders
 
 from rest_framework.authtoken.models import Token
 
@@ -29,11 +82,8 @@ class UserCreationTest(TestCase):
 
 
 class EventTest(TestCase):
-    def setUp(self):
-        # Make migrations and apply them
-        os.system("python manage.py makemigrations")
-        os.system("python manage.py migrate")
-
+    # The events are loaded from lib/events.csv when the test database is
+    # migrated
     def test_events_exist(self):
         with open("lib/events.csv", "r") as file:
             reader = csv.reader(file)
@@ -90,3 +140,2131 @@ class ProfilePictureTest(TestCase):
             response["Content-Disposition"],
             f"inline; filename={str(self.user.profile_picture).rsplit('\\')[-1].rsplit('/')[-1]}",
         )
+
+
+class TokenAuthenticationTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+
+    def test_cached_lookup(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/user/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/user/", headers=self.headers)
+        self.assertEqual(response.data["username"], "test_user")
+
+    def test_logout_invalidates_cache(self):
+        self.client.get("/api/user/", headers=self.headers)
+        response = self.client.post("/api/logout/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/user/", headers=self.headers)
+        self.assertEqual(response.status_code, 401)
+
+    def test_expired_token_is_rotated_on_login(self):
+        Token.objects.filter(pk=self.token.pk).update(
+            created=timezone.now() - timedelta(hours=2)
+        )
+        response = self.client.post("/api/verify/", headers=self.headers)
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(
+            "/api/login/", {"username": "test_user", "password": "test_password"}
+        )
+        self.assertNotEqual(response.data["token"], self.token.key)
+        response = self.client.post(
+            "/api/verify/",
+            headers={"Authorization": f"Token {response.data['token']}"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class BinderListTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.other = User.objects.create_user(
+            username="other_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+
+    def add_binders(self, count):
+        for i in range(count):
+            event = EventModel.objects.create(
+                name=f"Event {i}", materialtype="Binder", division="C"
+            )
+            BinderModel.objects.create(owner=self.user, event=event, content="{}")
+            shared = BinderModel.objects.create(owner=self.other, event=event)
+            shared.shared_with.add(self.user, self.other)
+            shared.online_users.add(self.other)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/binders/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response.data
+
+    def test_list_queries_are_constant(self):
+        self.add_binders(2)
+        self.count_list_queries()
+        small, data = self.count_list_queries()
+        self.assertEqual(len(data), 4)
+        self.add_binders(10)
+        large, data = self.count_list_queries()
+        self.assertEqual(len(data), 24)
+        self.assertEqual(small, large)
+
+    def test_list_omits_content(self):
+        self.add_binders(1)
+        _, data = self.count_list_queries()
+        self.assertNotIn("content", data[0])
+        self.assertEqual(data[0]["event"], "Event 0")
+        response = self.client.get(
+            f"/api/binders/{data[0]['id']}/", headers=self.headers
+        )
+        self.assertIn("content", response.data)
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.binder = BinderModel.objects.create(owner=self.user, event=event)
+        shared = BinderModel.objects.create(owner=self.other, event=event)
+        shared.shared_with.add(self.user)
+        self.private = BinderModel.objects.create(
+            owner=self.other, event=EventModel.objects.first()
+        )
+
+    def get(self, path, method="get", **headers):
+        sync = getattr(self.client, method)(
+            f"/api/{path}", headers={**self.headers, **headers}
+        )
+        asynchronous = async_to_sync(getattr(self.async_client, method))(
+            f"/api/async/{path}", headers={**self.headers, **headers}
+        )
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        return sync, asynchronous
+
+    def test_same_responses(self):
+        for path, method in [
+            ("binders/", "get"),
+            ("events/", "get"),
+            (f"event-info/{self.binder.id}/", "get"),
+            ("user/", "get"),
+            ("verify/", "post"),
+        ]:
+            with self.subTest(path):
+                sync, asynchronous = self.get(path, method)
+                self.assertEqual(sync.status_code, 200)
+                self.assertEqual(asynchronous.json(), sync.json())
+
+        _, response = self.get("binders/")
+        self.assertEqual(len(response.json()), 2)
+        _, response = self.get("events/")
+        self.assertEqual(
+            self.get("events/", **{"If-None-Match": response["ETag"]})[1].status_code,
+            304,
+        )
+
+    def test_invalid_token(self):
+        for path in ["binders/", "events/", "user/", f"event-info/{self.binder.id}/"]:
+            response = async_to_sync(self.async_client.get)(f"/api/async/{path}")
+            self.assertIn(response.status_code, (400, 401))
+        response = async_to_sync(self.async_client.post)(
+            "/api/async/verify/", headers={"Authorization": "Token invalid"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_event_info_permission(self):
+        self.assertEqual(self.get(f"event-info/{self.private.id}/")[1].status_code, 403)
+        self.assertEqual(self.get("event-info/0/")[1].status_code, 404)
+
+    def test_images_are_looked_up_off_the_event_loop(self):
+        get = image_store.get
+        loops = []
+
+        def record_loop(path):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return get(path)
+
+        with mock.patch.object(image_store, "get", side_effect=record_loop):
+            for path in ("binders/", "user/"):
+                response = async_to_sync(self.async_client.get)(
+                    f"/api/async/{path}", headers=self.headers
+                )
+                self.assertEqual(response.status_code, 200)
+        self.assertTrue(loops)
+        self.assertEqual(set(loops), {None})
+
+    def test_cached_token_needs_no_queries(self):
+        self.get("verify/", "post")
+        with CaptureQueriesContext(connection) as context:
+            response = async_to_sync(self.async_client.post)(
+                "/api/async/verify/", headers=self.headers
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(context), 0)
+        with CaptureQueriesContext(connection) as context:
+            self.get("binders/")
+        # The binders and their shared and online users, for each version
+        self.assertEqual(len(context), 6)
+
+
+class ListingTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+        for event in EventModel.objects.all()[:12]:
+            BinderModel.objects.create(owner=self.user, event=event)
+            shared = BinderModel.objects.create(owner=self.other, event=event)
+            shared.shared_with.add(self.user)
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        if response.streaming:
+            return json.loads(b"".join(response.streaming_content))
+        return response.json()
+
+    def test_fields(self):
+        binders = self.get("/api/binders/?fields=id,event")
+        self.assertEqual(len(binders), 24)
+        self.assertEqual(set(binders[0]), {"id", "event"})
+        events = self.get("/api/events/?fields=id,name")
+        self.assertEqual(set(events[0]), {"id", "name"})
+        self.user.chosen_events.set(EventModel.objects.all()[:2])
+        self.assertEqual(
+            self.get("/api/user-events/?fields=id"),
+            [{"id": event.id} for event in EventModel.objects.all()[:2]],
+        )
+        response = self.client.get("/api/binders/?fields=nope", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        everything = self.get("/api/binders/")
+        url, ids = "/api/binders/?limit=5", []
+        while url:
+            page = self.get(url)
+            self.assertLessEqual(len(page["results"]), 5)
+            ids += [binder["id"] for binder in page["results"]]
+            url = page["next"]
+        self.assertEqual(ids, sorted(binder["id"] for binder in everything))
+
+        page = self.get("/api/events/?limit=3&fields=id")
+        self.assertEqual(len(page["results"]), 3)
+        self.assertIsNotNone(page["next"])
+
+    def test_stream(self):
+        everything = sorted(self.get("/api/binders/"), key=lambda b: b["id"])
+        response = self.client.get("/api/binders/?stream=1", headers=self.headers)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), everything)
+        self.assertEqual(
+            self.get("/api/events/?stream=1&fields=id"),
+            [
+                {"id": pk}
+                for pk in EventModel.objects.order_by("id").values_list("id", flat=True)
+            ],
+        )
+
+    def test_stream_json_chunks(self):
+        for count in [0, 1, 2, 3, 7]:
+            rows = [{"n": i} for i in range(count)]
+            self.assertEqual(json.loads(b"".join(stream_json(rows, 2))), rows)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        registry.reset()
+        # The test client's address
+        self.enterContext(
+            override_settings(
+                METRICS={**settings.METRICS, "ALLOWED_IPS": ["127.0.0.1"]}
+            )
+        )
+        self.user = User.objects.create_user(username="test_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.binder = BinderModel.objects.create(owner=self.user, event=event)
+
+    def metrics(self):
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    def test_records_routes(self):
+        self.client.get("/api/binders/", headers=self.headers)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/binders/", headers=self.headers)
+        queries = len(context)
+        self.client.get(f"/api/binders/{self.binder.id}/", headers=self.headers)
+        self.client.get("/api/binders/0/", headers=self.headers)
+        text = self.metrics()
+
+        route = 'method="GET",route="api/binders/"'
+        self.assertIn(f'scibind_http_requests_total{{{route},status="200"}} 2', text)
+        self.assertIn(f"scibind_http_request_duration_seconds_count{{{route}}} 2", text)
+        self.assertIn(
+            f'scibind_http_request_duration_seconds_bucket{{{route},le="+Inf"}} 2',
+            text,
+        )
+        # The first request also looked up the token
+        self.assertIn(f"scibind_db_queries_total{{{route}}} {2 * queries + 1}", text)
+        self.assertIn(
+            f"scibind_http_response_bytes_total{{{route}}} {2 * len(response.content)}",
+            text,
+        )
+        detail = 'method="GET",route="api/binders/<pk>/"'
+        self.assertIn(f'scibind_http_requests_total{{{detail},status="200"}} 1', text)
+        self.assertIn(f'scibind_http_requests_total{{{detail},status="404"}} 1', text)
+
+    def test_async_view_queries(self):
+        async_to_sync(self.async_client.get)(
+            "/api/async/binders/", headers=self.headers
+        )
+        text = self.metrics()
+        queries = re.search(
+            r'scibind_db_queries_total\{method="GET",route="api/async/binders/"\} (\d+)',
+            text,
+        )
+        self.assertGreaterEqual(int(queries.group(1)), 3)
+
+    def test_slow_requests_log_sql(self):
+        slow = {**settings.METRICS, "SLOW_REQUEST": 0}
+        with override_settings(METRICS=slow):
+            with self.assertLogs("app.helpers.metrics", "WARNING") as logs:
+                self.client.get("/api/binders/", headers=self.headers)
+            self.assertIn("SELECT", logs.output[0])
+            # Logged at most once per interval
+            with self.assertNoLogs("app.helpers.metrics", "WARNING"):
+                self.client.get("/api/binders/", headers=self.headers)
+
+    def test_disabled(self):
+        with override_settings(METRICS={**settings.METRICS, "ENABLED": False}):
+            self.client_class().get("/api/binders/", headers=self.headers)
+        self.assertNotIn("api/binders/", self.metrics())
+
+    def test_access(self):
+        # Requests through a reverse proxy on the same host come from loopback
+        with override_settings(METRICS={**settings.METRICS, "ALLOWED_IPS": []}):
+            self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        remote = {"REMOTE_ADDR": "10.0.0.1"}
+        self.assertEqual(self.client.get("/api/metrics/", **remote).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get("/api/metrics/", headers=self.headers, **remote)
+        self.assertEqual(response.status_code, 200)
+
+
+class BootstrapTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        event_catalog.invalidate()
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+        self.user.chosen_events.set(EventModel.objects.all()[:3])
+
+    def add_binders(self, count):
+        # Events the user has no binder for yet
+        events = EventModel.objects.exclude(bindermodel__owner=self.user)
+        for event in events[:count]:
+            BinderModel.objects.create(owner=self.user, event=event)
+            shared = BinderModel.objects.create(owner=self.other, event=event)
+            shared.shared_with.add(self.user)
+            shared.online_users.add(self.other)
+
+    def get(self, query=""):
+        return self.client.get(f"/api/bootstrap/{query}", headers=self.headers)
+
+    def test_matches_endpoints(self):
+        self.add_binders(2)
+        data = self.get().json()
+        for section, path in [
+            ("user", "/api/user/"),
+            ("events", "/api/events/"),
+            ("binders", "/api/binders/"),
+        ]:
+            response = self.client.get(path, headers=self.headers)
+            self.assertEqual(data[section], response.json())
+        response = self.client.get("/api/user-events/", headers=self.headers)
+        self.assertEqual(
+            data["chosen_events"], [event["id"] for event in response.json()]
+        )
+        self.assertTrue(
+            data["binders"][0]["image"].startswith("http://testserver/api/images/")
+        )
+
+    def test_queries_are_constant(self):
+        self.add_binders(1)
+        self.get()
+        with CaptureQueriesContext(connection) as context:
+            self.get()
+        # Counted right away, later requests reset the query log
+        small = len(context)
+        self.add_binders(10)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(self.get().json()["binders"]), 22)
+        self.assertLessEqual(small, 4)
+        self.assertEqual(small, len(context))
+
+    def test_fields(self):
+        self.add_binders(2)
+        self.get()
+        with CaptureQueriesContext(connection) as context:
+            data = self.get("?fields=user.username,binders.id,binders.event").json()
+        self.assertEqual(data["user"], {"username": "test_user"})
+        self.assertEqual(set(data), {"user", "binders"})
+        self.assertEqual(set(data["binders"][0]), {"id", "event"})
+        # No prefetching of users the binders are shared with
+        self.assertEqual(len(context), 1)
+
+        data = self.get("?fields=events.id,chosen_events").json()
+        self.assertEqual(set(data["events"][0]), {"id"})
+        for query in ["?fields=nope", "?fields=binders.nope", "?fields=events.nope"]:
+            self.assertEqual(self.get(query).status_code, 400)
+
+    def test_not_modified(self):
+        response = self.get()
+        response = self.client.get(
+            "/api/bootstrap/",
+            headers={**self.headers, "If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+        self.add_binders(1)
+        response = self.client.get(
+            "/api/bootstrap/",
+            headers={**self.headers, "If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(BINDER_WRITE_BEHIND={"ENABLED": False})
+class BinderPatchTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.binder = BinderModel.objects.create(
+            owner=self.user,
+            event=event,
+            content='{"type":"doc","content":[{"type":"text","text":"a"}]}',
+        )
+
+    def patch(self, version, patch):
+        return self.client.patch(
+            f"/api/binders/{self.binder.id}/content/",
+            {"version": version, "patch": patch},
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    def test_patch_content(self):
+        response = self.patch(
+            0, [{"op": "replace", "path": "/content/0/text", "value": "b"}]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["version"], 1)
+        self.binder.refresh_from_db()
+        self.assertEqual(self.binder.version, 1)
+        self.assertEqual(json.loads(self.binder.content)["content"][0]["text"], "b")
+
+    def test_version_mismatch(self):
+        response = self.client.patch(
+            f"/api/binders/{self.binder.id}/",
+            {"content": '{"type":"doc"}'},
+            content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.data["version"], 1)
+        response = self.patch(0, [{"op": "add", "path": "/title", "value": "x"}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["version"], 1)
+
+    def test_overlapping_saves_get_distinct_versions(self):
+        # A full save that read the binder before a patch was applied
+        stale = BinderModel.objects.get(pk=self.binder.pk)
+        response = self.patch(0, [{"op": "add", "path": "/title", "value": "x"}])
+        self.assertEqual(response.data["version"], 1)
+        with mock.patch.object(Binders, "get_object", return_value=stale):
+            response = self.client.patch(
+                f"/api/binders/{self.binder.id}/",
+                {"content": '{"type":"doc"}'},
+                content_type="application/json",
+                headers=self.headers,
+            )
+        self.assertEqual(response.data["version"], 2)
+        response = self.patch(1, [{"op": "add", "path": "/title", "value": "y"}])
+        self.assertEqual(response.status_code, 409)
+
+    def test_invalid_patch(self):
+        response = self.patch(0, [{"op": "remove", "path": "/missing"}])
+        self.assertEqual(response.status_code, 400)
+        response = self.patch(0, [{"op": "test", "path": "/type", "value": "x"}])
+        self.assertEqual(response.status_code, 409)
+        for operation in (
+            {"op": "move", "from": 1, "path": "/a"},
+            {"op": "move", "from": "/type", "path": None},
+            {"op": "move", "from": "/content", "path": "/content/0"},
+            # A Unicode digit, which int() doesn't accept
+            {"op": "replace", "path": "/content/\u00b2", "value": "x"},
+        ):
+            with self.subTest(operation=operation):
+                self.assertEqual(self.patch(0, [operation]).status_code, 400)
+
+
+@override_settings(BINDER_SESSION_FLUSH_INTERVAL=60)
+class BinderConsumerTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.other = User.objects.create_user(
+            username="other_user", password="test_password"
+        )
+        self.outsider = User.objects.create_user(
+            username="outsider", password="test_password"
+        )
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.binder = BinderModel.objects.create(
+            owner=self.user, event=event, content='{"type":"doc","content":[]}'
+        )
+        self.binder.shared_with.add(self.other)
+        self.tokens = {
+            user.pk: Token.objects.create(user=user).key
+            for user in (self.user, self.other, self.outsider)
+        }
+
+    async def test_edits_are_broadcast_and_coalesced(self):
+        owner, peer = await self.aconnect(self.user), await self.aconnect(self.other)
+        init = await owner.receive_json_from()
+        self.assertEqual(init["version"], 0)
+        await owner.receive_json_from()  # owner's presence
+        await owner.receive_json_from()  # peer's presence
+        await peer.receive_json_from()  # init
+        presence = await peer.receive_json_from()
+        self.assertCountEqual(presence["online_users"], [self.user.id, self.other.id])
+
+        for i in range(3):
+            await owner.send_json_to(
+                {
+                    "type": "patch",
+                    "version": i,
+                    "patch": [{"op": "add", "path": "/content/-", "value": i}],
+                }
+            )
+            self.assertEqual(
+                await owner.receive_json_from(), {"type": "ack", "version": i + 1}
+            )
+            message = await peer.receive_json_from()
+            self.assertEqual(message["type"], "patch")
+            self.assertEqual(message["version"], i + 1)
+
+        # Nothing is written until the session is flushed
+        binder = await BinderModel.objects.aget(pk=self.binder.pk)
+        self.assertEqual(binder.version, 0)
+
+        await peer.send_json_to({"type": "patch", "version": 1, "patch": []})
+        self.assertEqual((await peer.receive_json_from())["type"], "resync")
+
+        await peer.disconnect()
+        await owner.disconnect()
+        binder = await BinderModel.objects.select_related("blob").aget(
+            pk=self.binder.pk
+        )
+        self.assertEqual(binder.version, 3)
+        self.assertEqual(json.loads(binder.content)["content"], [0, 1, 2])
+        self.assertFalse(await binder.online_users.aexists())
+        self.assertNotIn(self.binder.pk, BinderSession.sessions)
+
+    async def edit_while_saved_elsewhere(self, patch, content):
+        owner = await self.aconnect(self.user)
+        await owner.receive_json_from()  # init
+        await owner.receive_json_from()  # presence
+        await owner.send_json_to({"type": "patch", "version": 0, "patch": patch})
+        self.assertEqual(await owner.receive_json_from(), {"type": "ack", "version": 1})
+        binders = BinderModel.objects.filter(pk=self.binder.pk)
+        await sync_to_async(binders.update_content)(content)
+        await BinderSession.sessions[self.binder.pk].flush()
+        return owner
+
+    async def test_edits_are_rebased_on_saves_elsewhere(self):
+        owner = await self.edit_while_saved_elsewhere(
+            [{"op": "add", "path": "/content/-", "value": "mine"}],
+            '{"type":"doc","content":["theirs"]}',
+        )
+        resync = await owner.receive_json_from()
+        self.assertEqual(resync["type"], "resync")
+        self.assertEqual(resync["version"], 2)
+        self.assertEqual(json.loads(resync["content"])["content"], ["theirs", "mine"])
+        binder = await BinderModel.objects.select_related("blob").aget(
+            pk=self.binder.pk
+        )
+        self.assertEqual(binder.version, 2)
+        self.assertEqual(json.loads(binder.content)["content"], ["theirs", "mine"])
+        await owner.disconnect()
+
+    async def test_edits_that_no_longer_apply_are_reported(self):
+        owner = await self.edit_while_saved_elsewhere(
+            [{"op": "add", "path": "/content/-", "value": "mine"}],
+            '{"type":"doc"}',
+        )
+        conflict = await owner.receive_json_from()
+        self.assertEqual(conflict["type"], "conflict")
+        self.assertEqual(conflict["rejected"], 1)
+        resync = await owner.receive_json_from()
+        self.assertEqual((resync["type"], resync["version"]), ("resync", 1))
+        await owner.disconnect()
+        binder = await BinderModel.objects.select_related("blob").aget(
+            pk=self.binder.pk
+        )
+        self.assertEqual(binder.version, 1)
+
+    async def test_edits_are_broadcast_in_order(self):
+        owner, peer = await self.aconnect(self.user), await self.aconnect(self.other)
+        # The owner's second tab
+        observer = await self.aconnect(self.user)
+        for communicator, messages in ((owner, 4), (peer, 3), (observer, 2)):
+            for _ in range(messages):
+                await communicator.receive_json_from()
+
+        send_json = BinderConsumer.send_json
+
+        async def slow_ack(consumer, content, **kwargs):
+            if content["type"] == "ack" and content["version"] == 1:
+                # Lets the peer's edit in while the owner's is acknowledged
+                await asyncio.sleep(0.1)
+            await send_json(consumer, content, **kwargs)
+
+        with mock.patch.object(BinderConsumer, "send_json", slow_ack):
+            for communicator, version in ((owner, 0), (peer, 1)):
+                await communicator.send_json_to(
+                    {
+                        "type": "patch",
+                        "version": version,
+                        "patch": [{"op": "add", "path": "/content/-", "value": 0}],
+                    }
+                )
+                await asyncio.sleep(0.01)
+            first = await observer.receive_json_from()
+            second = await observer.receive_json_from()
+        self.assertEqual((first["version"], second["version"]), (1, 2))
+        for communicator in (owner, peer, observer):
+            await communicator.disconnect()
+
+    async def test_rejects_users_without_access(self):
+        communicator = await self.aconnect(self.outsider, accept=False)
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+    async def aconnect(self, user, accept=True):
+        communicator = WebsocketCommunicator(
+            application,
+            f"/ws/binders/{self.binder.id}/?token={self.tokens[user.pk]}",
+        )
+        if accept:
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+        return communicator
+
+
+class WriteBehindTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.journal_dir = journal_dir.name
+        self.enterContext(
+            override_settings(
+                BINDER_WRITE_BEHIND={
+                    "ENABLED": True,
+                    "JOURNAL_DIR": self.journal_dir,
+                    "INTERVAL": None,
+                    "MAX_PENDING": 100,
+                }
+            )
+        )
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.binder = BinderModel.objects.create(
+            owner=self.user, event=event, content="{}"
+        )
+
+    def save(self, content):
+        return self.client.patch(
+            f"/api/binders/{self.binder.id}/",
+            {"content": content},
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    def test_saves_are_collapsed(self):
+        for i in range(5):
+            response = self.save(f'{{"n": {i}}}')
+            self.assertEqual(response.status_code, 200)
+        self.binder.refresh_from_db()
+        self.assertEqual(self.binder.content, "{}")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_buffer().flush(), 1)
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.binder.refresh_from_db()
+        self.assertEqual(json.loads(self.binder.content), {"n": 4})
+        self.assertEqual(self.binder.version, 1)
+        self.assertEqual(self.binder.revisions.count(), 2)
+
+    def test_reads_see_buffered_saves(self):
+        self.save('{"n": 1}')
+        response = self.client.get(
+            f"/api/binders/{self.binder.id}/", headers=self.headers
+        )
+        self.assertEqual(json.loads(response.data["content"]), {"n": 1})
+
+    def test_saves_lose_to_newer_writes(self):
+        self.save('{"n": 1}')
+        # Saved by another process in the meantime
+        BinderModel.objects.filter(pk=self.binder.pk).update_content('{"other": 1}')
+        with self.assertLogs("app.helpers.writebehind", "WARNING"):
+            self.assertEqual(get_buffer().flush(), 0)
+        self.binder.refresh_from_db()
+        self.assertEqual(json.loads(self.binder.content), {"other": 1})
+        self.assertEqual(self.binder.version, 1)
+
+    def test_saves_during_a_flush_are_kept(self):
+        self.save('{"n": 1}')
+        buffer = get_buffer()
+        update_content = BinderQuerySet.update_content
+
+        def save_during_flush(queryset, content, **kwargs):
+            # Made against the version the flush is writing over
+            buffer.put(self.binder.pk, '{"n": 2}', 0)
+            return update_content(queryset, content, **kwargs)
+
+        with mock.patch.object(BinderQuerySet, "update_content", save_during_flush):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.binder.refresh_from_db()
+        self.assertEqual(json.loads(self.binder.content), {"n": 2})
+        self.assertEqual(self.binder.version, 2)
+
+    def write_journal(self, *entries):
+        with open(os.path.join(self.journal_dir, "crashed.jsonl"), "w") as f:
+            for content, version in entries:
+                entry = {"id": self.binder.id, "content": content, "version": version}
+                f.write(json.dumps(entry) + "\n")
+            f.write('{"id": 1, "cont')
+
+    def test_replay_crashed_journal(self):
+        self.write_journal(('{"n": 1}', 0), ('{"n": 2}', 0))
+        get_buffer()
+        self.binder.refresh_from_db()
+        self.assertEqual(json.loads(self.binder.content), {"n": 2})
+        self.assertFalse(
+            os.path.exists(os.path.join(self.journal_dir, "crashed.jsonl"))
+        )
+
+    def test_replay_skips_changed_binders(self):
+        self.write_journal(('{"n": 1}', 0))
+        BinderModel.objects.filter(pk=self.binder.pk).update_content('{"newer": 1}')
+        with self.assertLogs("app.helpers.writebehind", "WARNING"):
+            get_buffer()
+        self.binder.refresh_from_db()
+        self.assertEqual(json.loads(self.binder.content), {"newer": 1})
+
+
+class EventCatalogTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        event_catalog.invalidate()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+
+    def test_catalog_is_cached(self):
+        response = self.client.get("/api/events/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), EventModel.objects.count())
+        with self.assertNumQueries(0):
+            cached = self.client.get("/api/events/", headers=self.headers)
+        self.assertEqual(cached["ETag"], response["ETag"])
+
+    def test_conditional_get(self):
+        response = self.client.get("/api/events/", headers=self.headers)
+        response = self.client.get(
+            "/api/events/",
+            headers={**self.headers, "If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_last_modified_is_kept_while_unchanged(self):
+        response = self.client.get("/api/events/", headers=self.headers)
+        with mock.patch("time.time", return_value=time.time() + 3600):
+            event_catalog.invalidate()
+            rebuilt = self.client.get("/api/events/", headers=self.headers)
+            self.assertEqual(rebuilt["Last-Modified"], response["Last-Modified"])
+            response = self.client.get(
+                "/api/events/",
+                headers={
+                    **self.headers,
+                    "If-Modified-Since": response["Last-Modified"],
+                },
+            )
+            self.assertEqual(response.status_code, 304)
+            EventModel.objects.create(
+                name="New Event", materialtype="none", division="A"
+            )
+            changed = self.client.get("/api/events/", headers=self.headers)
+        self.assertNotEqual(changed["Last-Modified"], rebuilt["Last-Modified"])
+
+    def test_invalidated_on_save(self):
+        etag = self.client.get("/api/events/", headers=self.headers)["ETag"]
+        EventModel.objects.create(name="New Event", materialtype="none", division="A")
+        response = self.client.get("/api/events/", headers=self.headers)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("New Event", [event["name"] for event in response.data])
+
+
+class LoadCsvTest(TestCase):
+    header = "Name,Material Type,Division,Image Name,Description,Category\n"
+
+    def load(self, rows, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(self.header + "".join(rows))
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command("load_csv", f.name, *args, stdout=out)
+        return out.getvalue()
+
+    def rows(self, count, description="Test"):
+        return [
+            f"Event {i},Binder,C,science.png,{description},Physics\n"
+            for i in range(count)
+        ]
+
+    def test_import_is_idempotent(self):
+        EventModel.objects.all().delete()
+        self.assertIn("20 created", self.load(self.rows(20)))
+        self.assertIn("20 unchanged", self.load(self.rows(20)))
+        self.assertEqual(EventModel.objects.count(), 20)
+
+        output = self.load(self.rows(20, description="Changed"))
+        self.assertIn("0 created, 20 updated", output)
+        self.assertEqual(EventModel.objects.filter(description="Changed").count(), 20)
+
+    def test_queries_do_not_grow_with_rows(self):
+        EventModel.objects.all().delete()
+        with CaptureQueriesContext(connection) as small:
+            self.load(self.rows(5))
+        EventModel.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.load(self.rows(100))
+        self.assertEqual(len(small), len(large))
+
+    def test_dry_run(self):
+        count = EventModel.objects.count()
+        output = self.load(
+            self.rows(1) + ["Optics,Binder,B,science.png,New description,Physics\n"],
+            "--dry-run",
+        )
+        self.assertIn("+ Event 0 (C)", output)
+        self.assertIn("~ Optics (B) description", output)
+        self.assertEqual(EventModel.objects.count(), count)
+        self.assertFalse(
+            EventModel.objects.filter(description="New description").exists()
+        )
+
+
+class SetEventsTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+        self.events = [
+            EventModel.objects.create(
+                name=f"Event {i}", materialtype="Cheatsheet", division="C"
+            ).id
+            for i in range(16)
+        ]
+
+    def set_events(self, events):
+        return self.client.post(
+            "/api/event-set/",
+            {"events": events},
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    def active_binders(self):
+        return set(
+            BinderModel.objects.filter(owner=self.user, old=False).values_list(
+                "event_id", flat=True
+            )
+        )
+
+    def test_binders_are_reconciled(self):
+        a, b, c = self.events[:3]
+        self.assertEqual(self.set_events([a, b]).status_code, 200)
+        self.assertEqual(self.active_binders(), {a, b})
+        self.set_events([b, c])
+        self.assertEqual(self.active_binders(), {b, c})
+        self.set_events([a])
+        self.assertEqual(self.active_binders(), {a})
+        self.assertEqual(BinderModel.objects.filter(owner=self.user).count(), 3)
+        self.assertEqual(set(self.user.chosen_events.values_list("id", flat=True)), {a})
+        binder = BinderModel.objects.get(owner=self.user, event_id=a)
+        self.assertEqual(binder.materialtype, "Cheatsheet")
+
+    def test_unknown_event_changes_nothing(self):
+        response = self.set_events([self.events[0], 999999])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.user.chosen_events.exists())
+        self.assertFalse(BinderModel.objects.exists())
+
+    def test_queries_do_not_grow_with_events(self):
+        self.set_events([])
+        with CaptureQueriesContext(connection) as small:
+            self.set_events(self.events[:2])
+        self.set_events([])
+        BinderModel.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.set_events(self.events[2:])
+        self.assertEqual(len(small), len(large))
+
+
+class BinderAccessTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.owner, self.member, self.outsider = [
+            User.objects.create_user(username=name, password="test_password")
+            for name in ("owner", "member", "outsider")
+        ]
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.binder = BinderModel.objects.create(owner=self.owner, event=event)
+        self.binder.shared_with.add(self.member)
+
+    def headers(self, user):
+        token = Token.objects.get_or_create(user=user)[0]
+        return {"Authorization": f"Token {token.key}"}
+
+    def test_accessible_to(self):
+        for user, expected in ((self.owner, 1), (self.member, 1), (self.outsider, 0)):
+            self.assertEqual(BinderModel.objects.accessible_to(user).count(), expected)
+
+    def test_permission_checks(self):
+        url = f"/api/binders/{self.binder.id}/"
+        response = self.client.get(url, headers=self.headers(self.member))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, headers=self.headers(self.outsider))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            f"/api/get_binder_image/{self.binder.id}/",
+            headers=self.headers(self.outsider),
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client.delete(url, headers=self.headers(self.member))
+        self.assertEqual(response.status_code, 403)
+
+    def test_checks_are_memoized(self):
+        request = RequestFactory().get("/")
+        request.user = self.member
+        with self.assertNumQueries(1):
+            self.assertTrue(can_access_binder(request, self.binder))
+            self.assertTrue(can_access_binder(request, self.binder))
+        request.user = self.owner
+        request._binder_access = {}
+        with self.assertNumQueries(0):
+            self.assertTrue(can_access_binder(request, self.binder))
+
+
+class ImageTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            username="test_user", password="test_password"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {self.token.key}"}
+        event = EventModel.objects.create(
+            name="Test Event",
+            materialtype="Binder",
+            division="C",
+            display_image="science.png",
+        )
+        self.binder = BinderModel.objects.create(owner=self.user, event=event)
+
+    def test_hashed_image_url(self):
+        response = self.client.get("/api/binders/", headers=self.headers)
+        url = response.data[0]["image"]
+        self.assertRegex(url, r"/api/images/[0-9a-f]{16}/science.png\?size=card$")
+        url = url.split("?")[0]
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response["Cache-Control"])
+        with open("lib/images/event_images/science.png", "rb") as f:
+            self.assertEqual(response.content, f.read())
+        response = self.client.get(url.replace("science.png", "other.png"))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get(self):
+        url = f"/api/get_binder_image/{self.binder.id}/"
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            url, headers={**self.headers, "If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_unknown_digests_dont_rescan(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        store = ImageStore(root.name, cache_size=1000, max_item_size=100)
+        path = Path(root.name) / "a.png"
+        path.write_bytes(b"a")
+        digest = hashlib.sha256(b"a").hexdigest()[:16]
+
+        clock = mock.patch("app.helpers.images.time.monotonic", return_value=100)
+        with clock as monotonic, mock.patch("os.walk", wraps=os.walk) as walk:
+            self.assertEqual(store.find(digest).path, path.resolve())
+            for i in range(10):
+                self.assertIsNone(store.find(f"{i:016x}"))
+            self.assertEqual(walk.call_count, 1)
+
+            (Path(root.name) / "b.png").write_bytes(b"b")
+            other = hashlib.sha256(b"b").hexdigest()[:16]
+            self.assertIsNone(store.find(other))
+            # Added files are found once the directories are checked again
+            monotonic.return_value = 110
+            self.assertEqual(store.find(other).name, "b.png")
+            self.assertIsNone(store.find(f"{0:016x}"))
+            self.assertEqual(walk.call_count, 2)
+
+    @override_settings(IMAGE_SENDFILE_HEADER="X-Accel-Redirect")
+    def test_sendfile(self):
+        response = self.client.get("/api/picture/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertTrue(
+            response["X-Accel-Redirect"].startswith(
+                "/protected-images/profile_pictures/"
+            )
+        )
+
+
+@override_settings(TASKS={**settings.TASKS, "EAGER": True})
+class ImageVariantTest(TestCase):
+    def setUp(self):
+        variant_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(variant_dir.cleanup)
+        self.enterContext(
+            mock.patch.object(variant_store, "root", Path(variant_dir.name))
+        )
+        event = EventModel(display_image="science.png")
+        self.url = image_url(event_image(event))
+
+    def get(self, query, accept="*/*"):
+        return self.client.get(f"{self.url}?{query}", headers={"Accept": accept})
+
+    def test_negotiated_webp(self):
+        response = self.get("size=card", accept="image/webp,image/*")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("Accept", response["Vary"])
+        image = PILImage.open(BytesIO(response.content))
+        self.assertEqual(image.format, "WEBP")
+        self.assertLessEqual(max(image.size), 256)
+        self.assertLess(
+            len(response.content), self.client.get(self.url).content.__len__()
+        )
+
+    def test_fallback_format(self):
+        response = self.get("size=thumb")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertLessEqual(max(PILImage.open(BytesIO(response.content)).size), 64)
+        response = self.get("size=thumb&format=jpeg")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        response = self.client.get(
+            f"{self.url}?size=thumb&format=jpeg",
+            headers={"If-None-Match": response["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_size(self):
+        self.assertEqual(self.get("size=huge").status_code, 400)
+        self.assertEqual(self.get("format=bmp").status_code, 400)
+
+    def test_generated_in_background(self):
+        original = self.client.get(self.url)
+        with override_settings(TASKS={**settings.TASKS, "EAGER": False}):
+            # The original is served until the variant is generated
+            response = self.get("size=thumb&format=png")
+            self.assertEqual(response["ETag"], original["ETag"])
+            self.assertIn("no-store", response["Cache-Control"])
+            self.get("size=thumb&format=png")
+            self.assertEqual(Task.objects.filter(status=Task.QUEUED).count(), 1)
+            run_worker(burst=True)
+        response = self.get("size=thumb&format=png")
+        self.assertNotEqual(response["ETag"], original["ETag"])
+        self.assertLessEqual(max(PILImage.open(BytesIO(response.content)).size), 64)
+
+
+class SQLiteTuningTest(TestCase):
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            # 1 is NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class BinderContentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test_user")
+        self.event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.document = json.dumps({"type": "doc", "text": "Lorem ipsum " * 500})
+
+    def test_content_is_compressed_and_deduplicated(self):
+        for event in EventModel.objects.all()[:3]:
+            BinderModel.objects.create(
+                owner=self.user, event=event, content=self.document
+            )
+        self.assertEqual(BinderContent.objects.count(), 1)
+        blob = BinderContent.objects.get()
+        self.assertEqual(blob.size, len(json.dumps(self.document)))
+        self.assertLess(len(blob.data), blob.size / 10)
+
+    def test_content_is_loaded_lazily(self):
+        binder = BinderModel.objects.create(
+            owner=self.user, event=self.event, content=self.document
+        )
+        with self.assertNumQueries(1):
+            binder = BinderModel.objects.get(pk=binder.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(binder.content, self.document)
+            self.assertEqual(binder.content, self.document)
+
+    def test_save_content(self):
+        binder = BinderModel.objects.create(owner=self.user, event=self.event)
+        self.assertIsNone(binder.content)
+        binder.content = self.document
+        binder.save(update_fields=["content"])
+        binder.refresh_from_db()
+        self.assertEqual(binder.content, self.document)
+        binder.content = None
+        binder.save()
+        self.assertIsNone(BinderModel.objects.get(pk=binder.pk).blob_id)
+
+    def test_prune(self):
+        binder = BinderModel.objects.create(
+            owner=self.user, event=self.event, content=self.document
+        )
+        binder.content = "{}"
+        binder.save()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("prune_binder_content", stdout=StringIO())
+        # Deleted in the same statement that checks for references
+        self.assertEqual(
+            [q["sql"].split()[0] for q in queries if "bindercontent" in q["sql"]],
+            ["DELETE"],
+        )
+        self.assertEqual(
+            list(BinderContent.objects.values_list("digest", flat=True)),
+            [binder.blob_id],
+        )
+
+
+@override_settings(
+    BINDER_WRITE_BEHIND={"ENABLED": False}, BINDER_REVISION_KEYFRAME_INTERVAL=5
+)
+class BinderRevisionTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username="test_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+        event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+        self.document = {
+            "type": "doc",
+            "content": [
+                {"type": "paragraph", "text": f"Paragraph {i} " * 20} for i in range(50)
+            ],
+        }
+        self.binder = BinderModel.objects.create(
+            owner=self.user, event=event, content=json.dumps(self.document)
+        )
+        self.versions = [json.dumps(self.document)]
+        for i in range(11):
+            self.document["content"][i]["text"] = f"Edit {i}"
+            if i % 3 == 0:
+                self.document["content"].insert(0, {"type": "heading", "n": i})
+            self.versions.append(json.dumps(self.document))
+            self.binder.content = self.versions[-1]
+            self.binder.save()
+
+    def test_keyframes_and_deltas(self):
+        revisions = list(self.binder.revisions.order_by("number"))
+        self.assertEqual([r.number for r in revisions], list(range(1, 13)))
+        self.assertEqual([r.number for r in revisions if r.keyframe], [1, 6, 11])
+        for revision in revisions:
+            if not revision.keyframe:
+                self.assertLess(len(revision.data), revision.size / 20)
+
+    def test_list_revisions(self):
+        response = self.client.get(
+            f"/api/binders/{self.binder.id}/revisions/", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["number"], 12)
+        self.assertEqual(len(response.data), 12)
+
+    def test_get_revision(self):
+        for number, content in enumerate(self.versions, start=1):
+            response = self.client.get(
+                f"/api/binders/{self.binder.id}/revisions/{number}/",
+                headers=self.headers,
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data["content"]), json.loads(content))
+        response = self.client.get(
+            f"/api/binders/{self.binder.id}/revisions/13/", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_patch_records_revision(self):
+        response = self.client.patch(
+            f"/api/binders/{self.binder.id}/content/",
+            {
+                "version": self.binder.version,
+                "patch": [{"op": "remove", "path": "/content/0"}],
+            },
+            content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        revision = self.binder.revisions.latest("number")
+        self.assertEqual(revision.number, 13)
+        self.assertFalse(revision.keyframe)
+
+    def test_other_users_cannot_read_revisions(self):
+        other = User.objects.create_user(username="other_user")
+        token = Token.objects.create(user=other)
+        response = self.client.get(
+            f"/api/binders/{self.binder.id}/revisions/1/",
+            headers={"Authorization": f"Token {token.key}"},
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_copy_revisions(self):
+        other = BinderModel.objects.create(
+            owner=self.user, event=EventModel.objects.first(), content='{"a": 1}'
+        )
+        self.assertEqual(copy_revisions(self.binder.pk, other.pk), 12)
+        contents = [get_revision_content(other.pk, number) for number in range(1, 14)]
+        self.assertEqual(contents[0], '{"a": 1}')
+        self.assertEqual(
+            [json.loads(content) for content in contents[1:]],
+            [json.loads(content) for content in self.versions],
+        )
+
+    def test_merge_duplicate_binders_without_duplicates(self):
+        out = StringIO()
+        call_command("merge_duplicate_binders", stdout=out)
+        self.assertIn("Merged 0 binders into 0", out.getvalue())
+
+
+@override_settings(BINDER_WRITE_BEHIND={"ENABLED": False})
+class MergeDuplicateBindersTest(TransactionTestCase):
+    """
+    Creates duplicate binders before the migration that forbids them.
+    """
+
+    def setUp(self):
+        self.migrate([("app", "0011_binderaccess")])
+        self.addCleanup(self.migrate, None)
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other_user")
+        self.event = EventModel.objects.create(
+            name="Test Event", materialtype="Binder", division="C"
+        )
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets or executor.loader.graph.leaf_nodes())
+
+    def test_merge(self):
+        drop = BinderModel.objects.create(
+            owner=self.user, event=self.event, content='{"n": 1}', old=True
+        )
+        drop.content = '{"n": 2}'
+        drop.save()
+        drop.shared_with.add(self.other)
+        keep = BinderModel.objects.create(
+            owner=self.user, event=self.event, content='{"n": 3}'
+        )
+        with self.assertRaisesMessage(RuntimeError, "merge_duplicate_binders"):
+            self.migrate([("app", "0012_binder_indexes")])
+
+        out = StringIO()
+        call_command("merge_duplicate_binders", stdout=out)
+        self.assertIn("Merged 1 binders into 1", out.getvalue())
+        self.assertEqual(
+            list(BinderModel.objects.filter(owner=self.user, event=self.event)),
+            [keep],
+        )
+        keep.refresh_from_db()
+        self.assertEqual(keep.content, '{"n": 3}')
+        contents = [
+            json.loads(get_revision_content(keep.pk, number))["n"]
+            for number in range(1, keep.revisions.count() + 1)
+        ]
+        self.assertEqual(contents, [3, 1, 2, 3])
+        self.assertEqual(
+            set(BinderAccess.objects.values_list("binder_id", "user_id", "role")),
+            {
+                (keep.pk, self.user.pk, "owner"),
+                (keep.pk, self.other.pk, "shared"),
+            },
+        )
+        self.migrate([("app", "0012_binder_indexes")])
+
+
+@override_settings(BINDER_WRITE_BEHIND={"ENABLED": False})
+class SearchTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+
+    def create(self, owner, *paragraphs, **kwargs):
+        document = {
+            "type": "doc",
+            "content": [
+                {
+                    "type": "paragraph",
+                    "content": [
+                        {"type": "text", "text": text, "marks": [{"type": "bold"}]}
+                    ],
+                }
+                for text in paragraphs
+            ],
+        }
+        # A user has one binder per event
+        event = EventModel.objects.exclude(bindermodel__owner=owner).first()
+        return BinderModel.objects.create(
+            owner=owner, event=event, content=json.dumps(document), **kwargs
+        )
+
+    def search(self, q):
+        response = self.client.get("/api/search/", {"q": q}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_extract_text(self):
+        binder = self.create(self.user, "The heart", "pumps blood")
+        self.assertEqual(binder.search_document.text, "The heart\npumps blood")
+        # Content that isn't JSON is searched as it is, without the
+        # characters that mark highlights in snippets
+        self.assertEqual(extract_text("{not \ue000json\ue001"), "{not json")
+
+    def test_search_is_ranked_and_scoped(self):
+        mine = self.create(self.user, "The heart pumps blood", "heart heart")
+        other = self.create(self.user, "The lungs", "and the heart")
+        shared = self.create(self.other, "Heart chambers")
+        shared.shared_with.add(self.user)
+        self.create(self.other, "Private heart notes")
+        self.create(self.user, "Archived heart", old=True)
+
+        results = self.search("heart")
+        self.assertEqual([r["id"] for r in results][0], mine.id)
+        self.assertEqual({r["id"] for r in results}, {mine.id, other.id, shared.id})
+        self.assertIn("<mark>heart</mark>", results[0]["snippet"])
+        self.assertEqual(results[0]["event"], mine.event.name)
+
+    def test_search_follows_saves(self):
+        binder = self.create(self.user, "Mitochondria")
+        self.assertEqual(len(self.search("mitochon")), 1)
+        BinderModel.objects.filter(pk=binder.pk).update_content(
+            json.dumps(
+                {"type": "doc", "content": [{"type": "text", "text": "Ribosome"}]}
+            )
+        )
+        self.assertEqual(self.search("mitochondria"), [])
+        self.assertEqual(len(self.search("ribosome")), 1)
+        binder.delete()
+        self.assertEqual(self.search("ribosome"), [])
+
+    def test_query_syntax_is_literal(self):
+        self.create(self.user, 'Say "hello" AND (world)')
+        self.assertEqual(len(self.search('"hello" AND (wor')), 1)
+        self.assertEqual(self.search("***"), [])
+
+    @mock.patch("app.helpers.search.has_fts", return_value=False)
+    def test_substring_fallback(self, has_fts):
+        binder = self.create(self.user, "The heart pumps blood")
+        self.create(self.other, "Private heart notes")
+        results = self.search("HEART blood")
+        self.assertEqual([r["id"] for r in results], [binder.id])
+        self.assertIn("<mark>heart</mark>", results[0]["snippet"])
+
+    def test_snippets_are_escaped(self):
+        self.create(self.user, '<img src=x onerror="alert(1)"> heart \ue000 & more')
+        expected = "onerror=&quot;alert(1)&quot;&gt; <mark>heart</mark>  &amp; more"
+        snippet = self.search("heart")[0]["snippet"]
+        self.assertTrue(snippet.endswith(expected), snippet)
+        with mock.patch("app.helpers.search.has_fts", return_value=False):
+            snippet = self.search("heart")[0]["snippet"]
+        self.assertTrue(snippet.endswith(expected), snippet)
+
+
+class PrintTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        render_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(render_dir.cleanup)
+        self.enterContext(
+            override_settings(
+                PRINT_RENDER_DIR=Path(render_dir.name),
+                TASKS={**settings.TASKS, "EAGER": True},
+                BINDER_WRITE_BEHIND={"ENABLED": False},
+            )
+        )
+        self.user = User.objects.create_user(username="test_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+
+    def document(self, paragraphs):
+        return {
+            "type": "doc",
+            "content": [
+                {"type": "heading", "attrs": {"level": 1}, "content": []},
+                *(
+                    {
+                        "type": "paragraph",
+                        "content": [{"type": "text", "text": f"Line {i} " * 20}],
+                    }
+                    for i in range(paragraphs)
+                ),
+            ],
+        }
+
+    def create(self, materialtype, paragraphs):
+        event = EventModel.objects.create(
+            name="Test Event", materialtype=materialtype, division="C"
+        )
+        return BinderModel.objects.create(
+            owner=self.user,
+            event=event,
+            content=json.dumps(self.document(paragraphs)),
+        )
+
+    def get(self, binder, **headers):
+        return self.client.get(
+            f"/api/binders/{binder.id}/pdf/", headers={**self.headers, **headers}
+        )
+
+    def read(self, pdf):
+        return PdfReader(BytesIO(pdf))
+
+    def test_pdf_structure(self):
+        pdf, pages = render_pdf(self.document(300), "Binder")
+        self.assertGreater(pages, 10)
+        reader = self.read(pdf)
+        self.assertEqual(len(reader.pages), pages)
+        self.assertEqual(reader.pages[0].mediabox[2:], [612, 792])
+        text = reader.pages[-1].extract_text()
+        self.assertIn("Line 299", text)
+        self.assertIn(f"{pages} / {pages}", text)
+
+    def paragraph(self, *content):
+        return {"type": "doc", "content": [{"type": "paragraph", "content": content}]}
+
+    def test_unicode_text(self):
+        text = "ΔG = ΔH − TΔS, λ ≈ 500 nm, H₂O"
+        pdf, _ = render_pdf(
+            self.paragraph(
+                {"type": "text", "text": text},
+                {"type": "text", "text": " Δ", "marks": [{"type": "italic"}]},
+            ),
+            "Binder",
+        )
+        page = self.read(pdf).pages[0]
+        self.assertIn(text, page.extract_text())
+        # Only the regular font is used, subset and embedded
+        fonts = [font.get_object() for font in page["/Resources"]["/Font"].values()]
+        self.assertEqual(len(fonts), 1)
+        self.assertRegex(fonts[0]["/BaseFont"], r"^/[A-Z]{6}\+DejaVuSansMono")
+        descriptor = fonts[0]["/DescendantFonts"][0].get_object()["/FontDescriptor"]
+        self.assertIn("/FontFile2", descriptor)
+
+    def test_unsupported_characters(self):
+        with self.assertRaisesMessage(UnsupportedCharacters, "漢"):
+            render_pdf(self.paragraph({"type": "text", "text": "漢 ok"}), "Binder")
+        binder = self.create("Binder", 1)
+        binder.content = json.dumps(self.paragraph({"type": "text", "text": "漢 ok"}))
+        binder.save()
+        response = self.get(binder)
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("漢", response.data["error"])
+
+    def test_images(self):
+        png = BytesIO()
+        PILImage.new("RGBA", (2000, 100), (255, 0, 0, 128)).save(png, "PNG")
+        jpeg = BytesIO()
+        PILImage.new("RGB", (40, 30)).save(jpeg, "JPEG")
+        document = {
+            "type": "doc",
+            "content": [
+                {"type": "image", "attrs": {"src": "a.png"}},
+                {"type": "image", "attrs": {"src": "a.png"}},
+                {"type": "image", "attrs": {"src": "b.jpg"}},
+                {"type": "image", "attrs": {"src": "missing.png", "alt": "Cell"}},
+                {"type": "image", "attrs": {"src": "broken.png", "alt": "Broken"}},
+            ],
+        }
+        images = {
+            "a.png": png.getvalue(),
+            "b.jpg": jpeg.getvalue(),
+            "broken.png": png.getvalue()[:100],
+        }
+        pdf, _ = render_pdf(document, "Binder", images.get)
+        page = self.read(pdf).pages[0]
+        xobjects = {
+            name: xobject.get_object()
+            for name, xobject in page["/Resources"]["/XObject"].items()
+        }
+        self.assertEqual(
+            sorted(
+                (x["/Width"], x["/Height"], x["/Filter"]) for x in xobjects.values()
+            ),
+            [(40, 30, "/DCTDecode"), (2000, 100, "/FlateDecode")],
+        )
+        # Scaled down to the column width
+        draws = re.findall(
+            rb"([\d.]+) 0 0 [\d.]+ [\d.]+ [\d.]+ cm /(\w+) Do",
+            page.get_contents().get_data(),
+        )
+        self.assertEqual(
+            [
+                (float(width), xobjects["/" + name.decode()]["/Width"])
+                for width, name in draws
+            ],
+            [(504, 2000), (504, 2000), (30, 40)],
+        )
+        text = page.extract_text()
+        self.assertIn("[image: Cell]", text)
+        self.assertIn("[image: Broken]", text)
+
+    def test_load_image(self):
+        png = BytesIO()
+        PILImage.new("RGB", (4, 4)).save(png, "PNG")
+        src = "data:image/png;base64," + base64.b64encode(png.getvalue()).decode()
+        self.assertEqual(load_image(src), png.getvalue())
+        with mock.patch("socket.create_connection") as connect:
+            for src in (
+                "http://127.0.0.1/image.png",
+                "http://localhost:8000/api/images/x.png",
+                "http://10.0.0.1/image.png",
+                "file:///etc/passwd",
+            ):
+                self.assertIsNone(load_image(src))
+            connect.assert_not_called()
+
+    def test_cheatsheet_is_shrunk_to_fit(self):
+        _, binder_pages = render_pdf(self.document(150), "Binder")
+        _, pages = render_pdf(self.document(150), "Cheatsheet")
+        self.assertGreater(binder_pages, 2)
+        self.assertLessEqual(pages, 2)
+
+    def test_print_binder(self):
+        binder = self.create("Binder", 100)
+        response = self.get(binder)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        pdf = b"".join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+        with mock.patch("app.helpers.renders.render_pdf") as render:
+            response = self.get(binder)
+            self.assertEqual(b"".join(response.streaming_content), pdf)
+            response = self.get(binder, **{"If-None-Match": response["ETag"]})
+            self.assertEqual(response.status_code, 304)
+            render.assert_not_called()
+
+        binder.content = json.dumps(self.document(10))
+        binder.save()
+        response = self.get(binder)
+        self.assertNotEqual(b"".join(response.streaming_content), pdf)
+
+    def test_cheatsheet_over_page_limit(self):
+        binder = self.create("Cheatsheet", 2000)
+        self.assertEqual(self.get(binder).status_code, 422)
+
+    def test_render_in_background(self):
+        binder = self.create("Binder", 10)
+        with override_settings(TASKS={**settings.TASKS, "EAGER": False}):
+            response = self.get(binder)
+            self.assertEqual(response.status_code, 202)
+            # Requesting it again doesn't queue another render
+            self.assertEqual(self.get(binder)["Location"], response["Location"])
+            status = self.client.get(response["Location"], headers=self.headers)
+            self.assertEqual(status.json()["status"], "queued")
+            call_command("run_worker", "--processes", "1", "--burst", stdout=StringIO())
+            status = self.client.get(response["Location"], headers=self.headers)
+            self.assertEqual(status.json()["status"], "done")
+            self.assertEqual(
+                status.json()["result"]["url"], f"/api/binders/{binder.id}/pdf/"
+            )
+            response = self.get(binder)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+            binder = self.create("Cheatsheet", 2000)
+            self.assertEqual(self.get(binder).status_code, 202)
+            run_worker(burst=True)
+            with mock.patch("app.helpers.renders.render_pdf") as render:
+                self.assertEqual(self.get(binder).status_code, 422)
+                self.assertEqual(self.get(binder).status_code, 422)
+                render.assert_not_called()
+
+
+calls = []
+
+
+@task
+def record_call(value):
+    calls.append(value)
+    return value
+
+
+@task(max_attempts=2)
+def fail_once(value):
+    calls.append(value)
+    if calls.count(value) == 1:
+        raise ValueError("First attempt fails")
+    return value
+
+
+class TaskTest(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.user = User.objects.create_user(username="test_user")
+        token = Token.objects.create(user=self.user)
+        self.headers = {"Authorization": f"Token {token.key}"}
+
+    def test_priority_order(self):
+        record_call.enqueue("low", priority=-1)
+        record_call.enqueue("default")
+        record_call.enqueue("high", priority=5)
+        self.assertEqual(calls, [])
+        self.assertEqual(run_worker(burst=True), 3)
+        self.assertEqual(calls, ["high", "default", "low"])
+        self.assertEqual(Task.objects.filter(status=Task.DONE).count(), 3)
+
+    def test_retry_with_backoff(self):
+        queued = fail_once.enqueue("value")
+        with self.assertLogs("app.helpers.tasks", "WARNING"):
+            run_worker(burst=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("First attempt fails", queued.error)
+        self.assertGreater(queued.run_at, timezone.now())
+        # The retry isn't due yet
+        self.assertEqual(run_worker(burst=True), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        run_worker(burst=True)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.result), (Task.DONE, "value"))
+
+    def test_fails_after_max_attempts(self):
+        queued = fail_once.enqueue("value")
+        Task.objects.update(max_attempts=1)
+        with self.assertLogs("app.helpers.tasks", "WARNING"):
+            run_worker(burst=True)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 1))
+        self.assertIsNotNone(queued.finished)
+
+    def test_eager(self):
+        with override_settings(TASKS={**settings.TASKS, "EAGER": True}):
+            queued = record_call.enqueue("now")
+        self.assertEqual(calls, ["now"])
+        self.assertEqual(queued.status, Task.DONE)
+
+    def test_key_deduplicates_pending_tasks(self):
+        first = record_call.enqueue("a", key="same")
+        self.assertEqual(record_call.enqueue("a", key="same").pk, first.pk)
+        run_worker(burst=True)
+        self.assertNotEqual(record_call.enqueue("a", key="same").pk, first.pk)
+
+    def test_requeue_stale(self):
+        queued = record_call.enqueue("a")
+        Task.objects.update(
+            status=Task.RUNNING, started=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale(), 1)
+        run_worker(burst=True)
+        self.assertEqual(calls, ["a"])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.DONE)
+
+    def test_stale_tasks_run_out_of_attempts(self):
+        queued = record_call.enqueue("a")
+        Task.objects.update(max_attempts=2)
+        for attempt in (1, 2):
+            self.assertTrue(claim(queued, "worker"))
+            queued.refresh_from_db()
+            self.assertEqual(queued.attempts, attempt)
+            # The worker died while running it
+            Task.objects.update(started=timezone.now() - timedelta(hours=1))
+            if attempt == 1:
+                self.assertEqual(requeue_stale(), 1)
+        with self.assertLogs("app.helpers.tasks", "WARNING"):
+            self.assertEqual(requeue_stale(), 0)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+        self.assertEqual(run_worker(burst=True), 0)
+
+    def test_status(self):
+        queued = record_call.enqueue("a", user=self.user)
+        other = record_call.enqueue("b")
+        response = self.client.get(f"/api/tasks/{queued.pk}/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "queued")
+        response = self.client.get(f"/api/tasks/{other.pk}/", headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_background_import(self):
+        call_command("load_csv", "lib/events.csv", "--background", stdout=StringIO())
+        queued = Task.objects.get()
+        self.assertEqual(queued.name, "app.tasks.import_events")
+        self.assertTrue(os.path.isabs(queued.args[0]))
+
+
+class LoadTestTest(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.data = loadtest.seed(users=6, binders=20, shares=2, large=0.5, seed=1)
+
+    def test_seed(self):
+        self.assertEqual(BinderModel.objects.count(), 20)
+        for user in self.data.users:
+            self.assertEqual(
+                sorted(self.data.accessible[user.pk]),
+                sorted(
+                    BinderModel.objects.accessible_to(user).values_list("id", flat=True)
+                ),
+            )
+        with self.assertRaises(ValueError):
+            loadtest.seed(users=1, binders=100, prefix="too_many")
+
+    def test_scenarios(self):
+        recorder = loadtest.run(
+            self.data, loadtest.SCENARIOS, iterations=3, warmup=1, seed=1
+        )
+        summary = loadtest.summarize(recorder)
+        self.assertEqual(summary["dashboard GET /api/binders/"]["requests"], 3)
+        self.assertGreater(summary["dashboard GET /api/bootstrap/"]["queries"], 0)
+        self.assertEqual(
+            summary["autosave PATCH /api/binders/<pk>/"]["requests"], 3 * 5
+        )
+        self.assertIn("set_events POST /api/event-set/", summary)
+        self.assertIn("images GET /api/get_binder_image/<pk>/", summary)
+
+        baseline = json.loads(json.dumps(summary))
+        step = "dashboard GET /api/binders/"
+        summary[step]["queries"] += 1
+        summary[step]["p95"] = baseline[step]["p95"] * 2
+        regressions = {
+            (row[0], row[1]) for row in loadtest.compare(baseline, summary) if row[4]
+        }
+        self.assertEqual(regressions, {(step, "queries"), (step, "p95")})
+
+
+class BinderAccessTableTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner")
+        self.other = User.objects.create_user(username="other")
+        self.third = User.objects.create_user(username="third")
+        self.event = EventModel.objects.first()
+        self.binder = BinderModel.objects.create(owner=self.owner, event=self.event)
+
+    def rows(self):
+        return set(
+            BinderAccess.objects.filter(binder=self.binder).values_list(
+                "user__username", "role"
+            )
+        )
+
+    def test_signals(self):
+        self.assertEqual(self.rows(), {("owner", "owner")})
+        self.binder.shared_with.add(self.other, self.third, self.owner)
+        self.assertEqual(
+            self.rows(),
+            {("owner", "owner"), ("other", "shared"), ("third", "shared")},
+        )
+        self.binder.shared_with.remove(self.third)
+        self.third.shared_binders.add(self.binder)
+        self.other.shared_binders.remove(self.binder)
+        self.assertEqual(self.rows(), {("owner", "owner"), ("third", "shared")})
+        self.third.shared_binders.clear()
+        self.binder.shared_with.set([self.other])
+        self.assertEqual(self.rows(), {("owner", "owner"), ("other", "shared")})
+
+        # The new owner's shared row becomes the owner row
+        self.binder.owner = self.other
+        self.binder.save()
+        self.assertEqual(self.rows(), {("other", "owner")})
+        self.binder.shared_with.add(self.owner)
+        self.binder.owner = self.owner
+        self.binder.save(update_fields=["owner"])
+        self.assertEqual(self.rows(), {("owner", "owner"), ("other", "shared")})
+
+        # Content saves don't touch the table
+        binder = BinderModel.objects.get(pk=self.binder.pk)
+        with CaptureQueriesContext(connection) as context:
+            binder.old = True
+            binder.save()
+        self.assertNotIn("binderaccess", " ".join(q["sql"] for q in context).lower())
+
+    def test_accessible_to(self):
+        self.binder.shared_with.add(self.other)
+        BinderModel.objects.create(owner=self.third, event=self.event)
+        self.assertEqual(
+            list(BinderModel.objects.accessible_to(self.other)), [self.binder]
+        )
+        self.assertEqual(BinderModel.objects.accessible_to(self.owner).count(), 1)
+        self.assertTrue(self.binder.is_accessible_by(self.other))
+        self.assertFalse(self.binder.is_accessible_by(self.third))
+        sql = str(BinderModel.objects.accessible_to(self.owner).query).upper()
+        self.assertNotIn("DISTINCT", sql)
+        self.assertNotIn(" OR ", sql)
+
+    def test_set_events(self):
+        token = Token.objects.create(user=self.other)
+        response = self.client.post(
+            "/api/event-set/",
+            {"events": [self.event.pk]},
+            content_type="application/json",
+            headers={"Authorization": f"Token {token.key}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        binder = BinderModel.objects.get(owner=self.other)
+        self.assertTrue(
+            BinderAccess.objects.filter(user=self.other, binder=binder, role="owner")
+        )
+
+    def test_sync_command(self):
+        self.binder.shared_with.add(self.other)
+        BinderAccess.objects.filter(user=self.owner).delete()
+        BinderAccess.objects.filter(user=self.other).update(role="owner")
+        BinderAccess.objects.create(user=self.third, binder=self.binder, role="shared")
+        with self.assertRaisesMessage(
+            CommandError, "Found 1 missing, 1 wrong and 1 stale rows"
+        ):
+            call_command("sync_binder_access", "--check", stdout=StringIO())
+        call_command("sync_binder_access", stdout=StringIO())
+        self.assertEqual(self.rows(), {("owner", "owner"), ("other", "shared")})
+        call_command("sync_binder_access", "--check", stdout=StringIO())
+
+
+class IndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = loadtest.seed(users=50, binders=500, paragraphs=1, large=0)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index):
+        # SQLite names the indexes of unique constraints itself
+        if connection.vendor == "sqlite" and index.startswith("unique_"):
+            index = {
+                "unique_binder_owner_event": "sqlite_autoindex_app_bindermodel",
+                "unique_binder_access": "sqlite_autoindex_app_binderaccess",
+            }[index]
+        plan = queryset.explain()
+        self.assertIn(index, plan, plan)
+
+    def test_hot_filters_use_indexes(self):
+        user = self.data.users[0]
+        events = [event.pk for event in self.data.events[:3]]
+        self.assertUsesIndex(
+            BinderModel.objects.filter(owner=user, old=False),
+            "app_binder_owner_old_idx",
+        )
+        self.assertUsesIndex(
+            BinderModel.objects.filter(owner=user, event_id__in=events),
+            "unique_binder_owner_event",
+        )
+        self.assertUsesIndex(
+            EventModel.objects.filter(name="Anatomy and Physiology", division="B"),
+            "app_event_name_div_idx",
+        )
+        self.assertUsesIndex(
+            BinderModel.objects.accessible_to(user).filter(old=False),
+            "unique_binder_access",
+        )
+
+    def test_one_binder_per_event(self):
+        binder = BinderModel.objects.filter(owner=self.data.users[0]).first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BinderModel.objects.create(owner=binder.owner, event=binder.event)
+
+
+def api_routes(patterns=None, prefix="api/"):
+    """
+    Returns the routes of app/urls.py, as metrics name them.
+    """
+    from django.urls import URLResolver
+
+    from . import urls
+
+    routes = set()
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            routes |= api_routes(pattern.url_patterns, route)
+        # The router's format suffix versions of its routes
+        elif "format>" not in clean_route(route):
+            routes.add(clean_route(route))
+    return routes
+
+
+# (method, route, request path, request body, query budget) for every route.
+# Paths and bodies are formatted with the attributes of QueryBudgetTest.
+QUERY_BUDGETS = [
+    ("GET", "api/", "/api/", None, 1),
+    ("GET", "api/binders/", "/api/binders/", None, 4),
+    ("GET", "api/binders/<pk>/", "/api/binders/{binder}/", None, 6),
+    (
+        "PATCH",
+        "api/binders/<pk>/content/",
+        "/api/binders/{binder}/content/",
+        {"version": "{version}", "patch": [{"op": "add", "path": "/x", "value": 1}]},
+        11,
+    ),
+    (
+        "PATCH",
+        "api/binders/<pk>/",
+        "/api/binders/{binder}/",
+        {"content": '{{"type": "doc", "content": []}}'},
+        13,
+    ),
+    ("GET", "api/binders/<pk>/pdf/", "/api/binders/{binder}/pdf/", None, 5),
+    (
+        "GET",
+        "api/binders/<pk>/revisions/",
+        "/api/binders/{binder}/revisions/",
+        None,
+        3,
+    ),
+    (
+        "GET",
+        "api/binders/<pk>/revisions/<number>/",
+        "/api/binders/{binder}/revisions/1/",
+        None,
+        3,
+    ),
+    ("GET", "api/events/", "/api/events/", None, 2),
+    ("GET", "api/events/<pk>/", "/api/events/{event}/", None, 2),
+    (
+        "POST",
+        "api/register/",
+        "/api/register/",
+        {
+            "username": "{prefix}-new",
+            "password": "password",
+            "email": "new@example.com",
+            "first_name": "New",
+            "last_name": "User",
+        },
+        7,
+    ),
+    (
+        "POST",
+        "api/login/",
+        "/api/login/",
+        {"username": "{prefix}-0", "password": "password"},
+        3,
+    ),
+    ("GET", "api/user/", "/api/user/", None, 1),
+    ("GET", "api/picture/", "/api/picture/", None, 1),
+    ("POST", "api/verify/", "/api/verify/", None, 1),
+    ("POST", "api/event-set/", "/api/event-set/", {"events": "{events}"}, 13),
+    ("GET", "api/user-events/", "/api/user-events/", None, 2),
+    (
+        "GET",
+        "api/get_binder_image/<int:pk>/",
+        "/api/get_binder_image/{binder}/",
+        None,
+        2,
+    ),
+    ("GET", "api/event-info/<int:pk>/", "/api/event-info/{binder}/", None, 2),
+    ("GET", "api/images/<str:digest>/<str:name>", "{image}", None, 0),
+    ("GET", "api/search/", "/api/search/?q=Paragraph", None, 4),
+    ("GET", "api/tasks/<int:pk>/", "/api/tasks/{task}/", None, 2),
+    ("GET", "api/bootstrap/", "/api/bootstrap/", None, 6),
+    ("GET", "api/metrics/", "/api/metrics/", None, 1),
+    ("GET", "api/async/binders/", "/api/async/binders/", None, 4),
+    ("GET", "api/async/events/", "/api/async/events/", None, 2),
+    (
+        "GET",
+        "api/async/event-info/<int:pk>/",
+        "/api/async/event-info/{binder}/",
+        None,
+        2,
+    ),
+    ("GET", "api/async/user/", "/api/async/user/", None, 1),
+    ("POST", "api/async/verify/", "/api/async/verify/", None, 1),
+    # Deletes the token, so it runs last
+    ("POST", "api/logout/", "/api/logout/", None, 2),
+]
+
+
+@override_settings(BINDER_WRITE_BEHIND={"ENABLED": False})
+class QueryBudgetTest(TestCase):
+    """
+    Requests every route with a small and a large dataset, and checks that
+    the number of queries stays within the route's budget and doesn't grow
+    with the data, e.g. from a query per binder.
+    """
+
+    def setUp(self):
+        self.counts = {}
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(
+            api_routes() - {route for _, route, *_ in QUERY_BUDGETS}, set()
+        )
+
+    def test_query_budgets(self):
+        # The users have 2 and 12 binders, shared with others
+        small = self.measure(loadtest.seed(users=3, binders=6, prefix="small"))
+        large = self.measure(loadtest.seed(users=10, binders=120, prefix="large"))
+        for method, route, *_, budget in QUERY_BUDGETS:
+            queries = large[method, route]
+            with self.subTest(method=method, route=route):
+                self.assertLessEqual(
+                    len(queries), budget, self.describe(method, route, queries)
+                )
+                self.assertLessEqual(
+                    len(queries),
+                    len(small[method, route]),
+                    "More queries with more data: "
+                    + self.describe(method, route, queries),
+                )
+
+    def measure(self, data):
+        """
+        Makes every request in QUERY_BUDGETS as the first user of a dataset.
+
+        Returns:
+            dict: (method, route) -> the SQL of the request's queries.
+        """
+        user = data.users[0]
+        user.set_password("password")
+        # Staff, to read the metrics
+        user.is_staff = True
+        user.save(update_fields=["password", "is_staff"])
+        binder = BinderModel.objects.filter(owner=user).first()
+        values = {
+            "prefix": user.username.rsplit("-", 1)[0],
+            "binder": binder.pk,
+            "version": binder.version,
+            "event": data.events[-1].pk,
+            # Keeps the binder's event, so the binder isn't archived
+            "events": [binder.event_id] + [event.pk for event in data.events[:3]],
+            "image": image_url(event_image(binder.event)),
+            "task": Task.objects.create(name="test", user=user).pk,
+        }
+        headers = {"Authorization": f"Token {data.tokens[user.pk]}"}
+        captured = {}
+        for method, route, path, body, _ in QUERY_BUDGETS:
+            # Cold caches, so the counts don't depend on earlier requests
+            token_cache.clear()
+            event_catalog.invalidate()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.generic(
+                    method,
+                    path.format(**values),
+                    json.dumps(self.format(body, values)) if body else "",
+                    content_type="application/json",
+                    headers=headers,
+                )
+            captured[method, route] = [query["sql"] for query in context]
+            self.assertLess(
+                response.status_code, 400, f"{method} {path}: {response.content}"
+            )
+        return captured
+
+    def format(self, body, values):
+        if isinstance(body, dict):
+            return {key: self.format(value, values) for key, value in body.items()}
+        if isinstance(body, list):
+            return [self.format(value, values) for value in body]
+        if isinstance(body, str) and body.startswith("{") and body[1:-1] in values:
+            return values[body[1:-1]]
+        if isinstance(body, str):
+            return body.format(**values)
+        return body
+
+    def describe(self, method, route, queries):
+        return f"{method} {route} made {len(queries)} queries:\n" + "\n".join(queries)
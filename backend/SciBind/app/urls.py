@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import Binders, Events
 from .views import (
     register,
@@ -11,6 +12,12 @@ from .views import (
     set_events,
     get_events,
     get_binder_image,
+    get_event_info,
+    hashed_image,
+    search,
+    get_task,
+    bootstrap,
+    metrics,
 )
 
 
@@ -29,4 +36,16 @@ urlpatterns = [
     path("event-set/", set_events),
     path("user-events/", get_events),
     path("get_binder_image/<int:pk>/", get_binder_image),
+    path("event-info/<int:pk>/", get_event_info),
+    path("images/<str:digest>/<str:name>", hashed_image),
+    path("search/", search),
+    path("tasks/<int:pk>/", get_task),
+    path("bootstrap/", bootstrap),
+    path("metrics/", metrics),
+    # Async versions of the views requested on every page load
+    path("async/binders/", async_views.binders),
+    path("async/events/", async_views.events),
+    path("async/event-info/<int:pk>/", async_views.event_info),
+    path("async/user/", async_views.user),
+    path("async/verify/", async_views.validate_token),
 ]
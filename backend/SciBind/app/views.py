@@ -1,34 +1,60 @@
-import os
 import re
 
 from django.conf import settings
 from django.contrib.auth import authenticate
-from django.http import FileResponse, HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags
 from django.views.decorators.csrf import csrf_exempt
 
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F
 
 from rest_framework import permissions, status
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import viewsets
 
-from .models import BinderModel, EventModel, User
-from .serializers import BinderSerializer, EventSerializer
-
+from .authentication import rotate_token
+from .helpers import access
+from .helpers.catalog import event_catalog
+from .helpers.documents import parse_content, serialize_content
+from .helpers.images import IMMUTABLE, REVALIDATE, event_image, image_store
+from .helpers.jsonpatch import JsonPatchConflict, JsonPatchError, apply_patch
+from .helpers.metrics import registry
+from .helpers.renders import cached_render, render_key
+from .helpers.revisions import get_revision_content
+from .helpers.search import search_binders
+from .helpers.variants import serve_variant
+from .helpers.writebehind import flush_pending, get_buffer
+from .models import BinderAccess, BinderModel, EventModel, Task, User
+from .pagination import list_response
+from .permissions import CanAccessBinder, can_access_binder
+from .serializers import (
+    BinderListSerializer,
+    BinderSerializer,
+    EventSerializer,
+    UserSerializer,
+)
+from .tasks import render_binder_pdf
+
+import hashlib
 import json
 
 
 def get_user(request):
-    if "Authorization" not in request.headers:
-        return None
-    token = request.headers.get("Authorization").split(" ")[1]
-    try:
-        user = Token.objects.get(key=token).user
-        return user
-    except Token.DoesNotExist:
-        return None
+    """
+    Returns the user authenticated for this request, or None.
+
+    Authentication itself runs once per request through the default DRF
+    authentication classes (see CachedTokenAuthentication).
+    """
+    if request.user and request.user.is_authenticated:
+        return request.user
+    return None
 
 
 class Binders(viewsets.ModelViewSet):
@@ -43,6 +69,7 @@ class Binders(viewsets.ModelViewSet):
     model = BinderModel
     serializer_class = BinderSerializer
     queryset = BinderModel.objects.all()
+    permission_classes = [CanAccessBinder]
 
     def list(self, request):
         user = get_user(request)
@@ -50,11 +77,20 @@ class Binders(viewsets.ModelViewSet):
             return Response(
                 {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
             )
-        queryset = BinderModel.objects.filter(
-            Q(owner=user) | Q(shared_with=user), old=False
-        ).distinct()
-        serializer = BinderSerializer(queryset, many=True)
-        return Response(serializer.data)
+        fields = request.GET.get("fields")
+        queryset = (
+            BinderModel.objects.accessible_to(user)
+            .filter(old=False)
+            .for_listing(fields.split(",") if fields else None)
+        )
+        return list_response(request, queryset, BinderListSerializer)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        # Make sure buffered saves are visible to the reader
+        if flush_pending(instance.pk):
+            instance.refresh_from_db(fields=["content", "version"])
+        return Response(self.get_serializer(instance).data)
 
     def create(self, request):
         user = get_user(request)
@@ -73,7 +109,7 @@ class Binders(viewsets.ModelViewSet):
             )
 
         instance = self.get_object()
-        if instance.owner != user and user not in instance.shared_with.all():
+        if not can_access_binder(request, instance):
             return Response(
                 {"error": "You don't have permission to edit this binder"},
                 status=status.HTTP_403_FORBIDDEN,
@@ -91,39 +127,232 @@ class Binders(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+
+        # Content-only saves (autosaves) go through the write-behind buffer
+        buffer = get_buffer()
+        if buffer is not None and set(serializer.validated_data) == {"content"}:
+            buffer.put(
+                instance.pk, serializer.validated_data["content"], instance.version
+            )
+            instance.content = serializer.validated_data["content"]
+            instance.version += 1
+            return Response(serializer.data)
+
+        if flush_pending(instance.pk):
+            instance.refresh_from_db(fields=["content", "version"])
+        if "content" in serializer.validated_data:
+            # Incremented in the database so overlapping saves get distinct
+            # versions
+            serializer.save(version=F("version") + 1)
+            instance.refresh_from_db(fields=["version"])
+        else:
+            self.perform_update(serializer)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["patch"])
+    def content(self, request, pk=None):
+        """
+        Applies a JSON Patch (RFC 6902) to a binder's content.
+
+        The request body must contain the version the patch was made against
+        and the list of operations, e.g. {"version": 3, "patch": [...]}.
+
+        Args:
+            request: The request object.
+            pk: The id of the binder.
+
+        Returns:
+            Response: A response containing the new version, or 409 if the
+            binder has changed since the given version.
+        """
+        user = get_user(request)
+        if user is None:
+            return Response(
+                {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        instance = self.get_object()
+        if not can_access_binder(request, instance):
+            return Response(
+                {"error": "You don't have permission to edit this binder"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+        if flush_pending(instance.pk):
+            instance.refresh_from_db(fields=["content", "version"])
+
+        version = request.data.get("version")
+        if not isinstance(version, int):
+            return Response(
+                {"error": "A version number is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if version != instance.version:
+            return Response(
+                {"error": "Version mismatch", "version": instance.version},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            document = apply_patch(
+                parse_content(instance.content),
+                request.data.get("patch"),
+                in_place=True,
+            )
+        except JsonPatchConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except (JsonPatchError, json.JSONDecodeError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only write if nobody saved the binder since it was read
+        updated = BinderModel.objects.filter(
+            pk=instance.pk, version=version
+        ).update_content(serialize_content(document, like=instance.content))
+        if not updated:
+            instance.refresh_from_db(fields=["version"])
+            return Response(
+                {"error": "Version mismatch", "version": instance.version},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({"version": version + 1})
+
+    @action(detail=True, methods=["get"])
+    def pdf(self, request, pk=None):
+        """
+        Returns a binder rendered as a PDF for printing.
+
+        Cheat sheets are shrunk to fit their page limit. Renders are cached
+        until the binder's content changes. Binders that aren't rendered yet
+        are queued for rendering, and the client can poll the returned task
+        before requesting the PDF again.
+
+        Args:
+            request: The request object.
+            pk: The id of the binder.
+
+        Returns:
+            FileResponse: The PDF, 304 if the client's copy is current, 202
+            with the rendering task if it isn't rendered yet, or 422 if a cheat
+            sheet doesn't fit its page limit or the binder has characters
+            that can't be printed.
+        """
+        user = get_user(request)
+        if user is None:
+            return Response(
+                {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        instance = self.get_object()
+        if flush_pending(instance.pk):
+            instance.refresh_from_db(fields=["content", "version"])
+
+        key = render_key(instance)
+        etag = f'"{key}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            if (path := cached_render(instance)) is None:
+                key = f"render:{key}"
+                # Rendering doesn't retry a binder it couldn't render
+                task = Task.objects.filter(key=key, status=Task.DONE).last()
+                if task is None or "error" not in task.result:
+                    task = render_binder_pdf.enqueue(instance.pk, user=user, key=key)
+                if task.status == Task.DONE and "error" in task.result:
+                    return Response(
+                        task.result, status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                # Tasks run right away with TASKS["EAGER"]
+                if (path := cached_render(instance)) is None:
+                    response = Response(
+                        task_status(task), status=status.HTTP_202_ACCEPTED
+                    )
+                    response["Location"] = f"/api/tasks/{task.pk}/"
+                    response["Retry-After"] = "1"
+                    return response
+            response = FileResponse(
+                open(path, "rb"),
+                content_type="application/pdf",
+                filename=f"{instance.event.name}.pdf",
+            )
+        response["ETag"] = etag
+        patch_cache_control(response, **REVALIDATE)
+        return response
+
+    @action(detail=True, methods=["get"])
+    def revisions(self, request, pk=None):
+        """
+        Lists a binder's revisions, newest first, without their content.
+        """
+        user = get_user(request)
+        if user is None:
+            return Response(
+                {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        instance = self.get_object()
+        flush_pending(instance.pk)
+        revisions = instance.revisions.order_by("-number").values(
+            "number", "created", "keyframe", "size"
+        )
+        return Response(list(revisions))
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"revisions/(?P<number>[0-9]+)",
+        url_name="revision",
+    )
+    def revision(self, request, pk=None, number=None):
+        """
+        Returns the content of a binder at a revision.
+
+        Args:
+            request: The request object.
+            pk: The id of the binder.
+            number: The revision number.
+        """
+        user = get_user(request)
+        if user is None:
+            return Response(
+                {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        instance = self.get_object()
+        flush_pending(instance.pk)
+        try:
+            content = get_revision_content(instance.pk, int(number))
+        except LookupError:
+            return Response(
+                {"error": "Revision not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response({"number": int(number), "content": content})
+
 
 # Binder Card Component Event Image
+@api_view(["GET"])
 def get_binder_image(request, pk):
     user = get_user(request)
     if user is None:
         return HttpResponse("Invalid token", status=status.HTTP_400_BAD_REQUEST)
     try:
-        binder = BinderModel.objects.get(id=pk)
+        binder = BinderModel.objects.select_related("event").get(id=pk)
     except BinderModel.DoesNotExist:
         return HttpResponse("Binder not found", status=status.HTTP_404_NOT_FOUND)
     if binder.old:
         return HttpResponse(
             "Binder has been archived", status=status.HTTP_404_NOT_FOUND
         )
-    elif binder.owner != user and user not in binder.shared_with.all():
+    elif not can_access_binder(request, binder):
         return HttpResponse(
             "You don't have permission to view this binder",
             status=status.HTTP_403_FORBIDDEN,
         )
-    event = binder.event
-    file_path = event.display_image
-    file_path = os.path.join("lib", "images", "event_images", file_path)
-    if os.path.exists(file_path):
-        response = FileResponse(open(file_path, "rb"))
-        response[
-            "Content-Disposition"
-        ] = f"inline; filename={os.path.basename(file_path)}"
-        return response
-    else:
+    if image := event_image(binder.event):
+        return serve_variant(request, image)
+    return HttpResponse("Image not found", status=status.HTTP_404_NOT_FOUND)
+
+
+# Content-hashed images, e.g. from image URLs in the binder list
+def hashed_image(request, digest, name):
+    if (image := image_store.find(digest)) is None or image.name != name:
         return HttpResponse("Image not found", status=status.HTTP_404_NOT_FOUND)
+    return serve_variant(request, image, cache_control=IMMUTABLE)
 
 
 class Events(viewsets.ModelViewSet):
@@ -142,9 +371,19 @@ class Events(viewsets.ModelViewSet):
                 {"error": "Invalid token"}, status=status.HTTP_401_UNAUTHORIZED
             )
 
-        queryset = EventModel.objects.all()
-        serializer = EventSerializer(queryset, many=True)
-        return Response(serializer.data)
+        if {"fields", "limit", "cursor", "stream"} & set(request.GET):
+            return list_response(request, EventModel.objects.all(), EventSerializer)
+
+        data, etag, last_modified = event_catalog.get()
+        if response := get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        ):
+            return response
+        response = Response(data)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
 
 # Event Info for Document Editor
@@ -156,10 +395,10 @@ def get_event_info(request, pk: int):
     if user is None:
         return HttpResponse("Invalid token", status=status.HTTP_400_BAD_REQUEST)
     try:
-        binder = BinderModel.objects.get(id=pk)
+        binder = BinderModel.objects.select_related("event").get(id=pk)
     except BinderModel.DoesNotExist:
         return HttpResponse("Binder not found", status=status.HTTP_404_NOT_FOUND)
-    if user != binder.owner and user not in binder.shared_with.all():
+    if not can_access_binder(request, binder):
         return HttpResponse(
             "You don't have permission to view this binder",
             status=status.HTTP_403_FORBIDDEN,
@@ -197,7 +436,7 @@ def login(request):
         return Response(
             {"error": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST
         )
-    token, _ = Token.objects.get_or_create(user=user)
+    token = rotate_token(user)
     return Response({"token": token.key})
 
 
@@ -260,14 +499,7 @@ def user(request):
     user = get_user(request)
     if user is None:
         return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
-    return Response(
-        {
-            "username": user.username,
-            "email": user.email,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-        }
-    )
+    return Response(UserSerializer(user, context={"request": request}).data)
 
 
 @api_view(["GET"])
@@ -284,14 +516,8 @@ def profile_picture(request):
     user = get_user(request)
     if user is None:
         return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
-    if user.profile_picture:
-        file_path = os.path.join(str(user.profile_picture))
-        if os.path.exists(file_path):
-            response = FileResponse(open(file_path, "rb"))
-            response[
-                "Content-Disposition"
-            ] = f"inline; filename={os.path.basename(file_path)}"
-            return response
+    if user.profile_picture and (image := image_store.get(user.profile_picture)):
+        return serve_variant(request, image)
     return Response(
         {"error": "Profile picture not found"}, status=status.HTTP_404_NOT_FOUND
     )
@@ -331,36 +557,71 @@ def set_events(request):
 
     # TODO: Add logic for event division migration
     # Get the new set of event IDs
-    new_event_ids = set(request.data.get("events", []))
-
-    # Get the current set of event IDs
-    current_event_ids = set(user.chosen_events.values_list("id", flat=True))
+    if hasattr(request.data, "getlist"):
+        event_ids = request.data.getlist("events")
+    else:
+        event_ids = request.data.get("events", [])
+    try:
+        new_event_ids = {int(event_id) for event_id in event_ids}
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "Event ids must be integers"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    # Find events to add and remove
-    events_to_add = new_event_ids - current_event_ids
-    events_to_remove = current_event_ids - new_event_ids
+    # Validate all of the IDs in one query
+    events = dict(
+        EventModel.objects.filter(id__in=new_event_ids).values_list(
+            "id", "materialtype"
+        )
+    )
+    if missing := new_event_ids - events.keys():
+        return Response(
+            {"error": f"Event with id {min(missing)} not found"},
+            status=status.HTTP_404_NOT_FOUND,
+        )
 
-    # Remove events
-    user.chosen_events.remove(*events_to_remove)
+    with transaction.atomic():
+        # Get the current set of event IDs
+        current_event_ids = set(user.chosen_events.values_list("id", flat=True))
 
-    # Add new events
-    for event_id in events_to_add:
-        try:
-            event = EventModel.objects.get(id=event_id)
-            user.chosen_events.add(event)
-        except EventModel.DoesNotExist:
-            return Response(
-                {"error": f"Event with id {event_id} not found"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        # Remove and add events
+        if events_to_remove := current_event_ids - new_event_ids:
+            user.chosen_events.remove(*events_to_remove)
+        if events_to_add := new_event_ids - current_event_ids:
+            user.chosen_events.add(*events_to_add)
 
-    # Update binders
-    BinderModel.objects.filter(owner=user).update(old=True)
+        # Update binders, only touching rows whose state changes
+        binders = BinderModel.objects.filter(owner=user)
+        binders.filter(old=False).exclude(event_id__in=new_event_ids).update(old=True)
+        binders.filter(old=True, event_id__in=new_event_ids).update(old=False)
 
-    for event in user.chosen_events.all():
-        binder, created = BinderModel.objects.get_or_create(owner=user, event=event)
-        binder.old = False
-        binder.save()
+        existing = set(
+            binders.filter(event_id__in=new_event_ids).values_list(
+                "event_id", flat=True
+            )
+        )
+        if missing := new_event_ids - existing:
+            # A concurrent request may have created some of them already
+            BinderModel.objects.bulk_create(
+                (
+                    BinderModel(
+                        owner=user, event_id=event_id, materialtype=events[event_id]
+                    )
+                    for event_id in missing
+                ),
+                ignore_conflicts=True,
+            )
+            # bulk_create() doesn't send the signal that creates these
+            BinderAccess.objects.bulk_create(
+                (
+                    BinderAccess(user=user, binder_id=binder_id, role=access.OWNER)
+                    for binder_id in binders.filter(event_id__in=missing).values_list(
+                        "pk", flat=True
+                    )
+                ),
+                ignore_conflicts=True,
+            )
 
     return Response({"message": "Events set successfully"})
 
@@ -379,6 +640,200 @@ def get_events(request):
     user = get_user(request)
     if user is None:
         return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
-    events = user.chosen_events.all()
-    serializer = EventSerializer(events, many=True)
-    return Response(serializer.data)
+    return list_response(request, user.chosen_events.all(), EventSerializer)
+
+
+# Sections of the bootstrap response
+BOOTSTRAP_SECTIONS = ["user", "chosen_events", "events", "binders"]
+
+
+def parse_fields(value, sections):
+    """
+    Parses a `fields` query parameter like "user,binders.id,binders.event".
+
+    Args:
+        value: The parameter, or None to select everything.
+        sections: The names of the sections that can be selected.
+
+    Returns:
+        dict: The selected sections, each mapped to the set of its selected
+        fields, or None for all of them.
+
+    Raises:
+        ValueError: If a section doesn't exist.
+    """
+    if value is None:
+        return dict.fromkeys(sections)
+    selected = {}
+    for name in filter(None, value.split(",")):
+        section, _, field = name.partition(".")
+        if section not in sections:
+            raise ValueError(f"Unknown section: {section}")
+        if not field:
+            selected[section] = None
+        elif section not in selected or selected[section] is not None:
+            selected.setdefault(section, set()).add(field)
+    return selected
+
+
+@api_view(["GET"])
+def bootstrap(request):
+    """
+    A view returning everything the dashboard needs on load in one response:
+    the user, the ids of their chosen events, the event catalog, and the
+    binders they can access with their image URLs. It takes at most four
+    queries, however many binders there are.
+
+    Args:
+        request: The request object, optionally with a `fields` query
+            parameter selecting sections and fields, e.g.
+            `fields=user,binders.id,binders.event`.
+
+    Returns:
+        HttpResponse: A response containing the selected sections, or 304 if
+        the client's copy is current.
+    """
+    user = get_user(request)
+    if user is None:
+        return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fields = parse_fields(request.GET.get("fields"), BOOTSTRAP_SECTIONS)
+        if fields.get("chosen_events"):
+            raise ValueError("chosen_events has no fields")
+        data = {}
+        if "user" in fields:
+            data["user"] = UserSerializer(
+                user, fields=fields["user"], context={"request": request}
+            ).data
+        if "chosen_events" in fields:
+            data["chosen_events"] = list(
+                User.chosen_events.through.objects.filter(user_id=user.pk).values_list(
+                    "eventmodel_id", flat=True
+                )
+            )
+        if "events" in fields:
+            events, _, _ = event_catalog.get()
+            if selected := fields["events"]:
+                if unknown := selected - set(EventSerializer.Meta.fields):
+                    raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+                events = [
+                    {k: v for k, v in event.items() if k in selected}
+                    for event in events
+                ]
+            data["events"] = events
+        if "binders" in fields:
+            binders = BinderModel.objects.accessible_to(user).filter(old=False)
+            data["binders"] = BinderListSerializer(
+                binders.for_listing(fields["binders"]),
+                many=True,
+                fields=fields["binders"],
+                context={"request": request},
+            ).data
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    body = JSONRenderer().render(data)
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    patch_cache_control(response, **REVALIDATE)
+    return response
+
+
+@api_view(["GET"])
+def search(request):
+    """
+    A view for searching the content of the binders the user can access.
+
+    Args:
+        request: The request object, with the words to search for in the `q`
+            query parameter and optionally the number of results in `limit`.
+
+    Returns:
+        Response: A response containing the matching binders, best first,
+        with snippets of their content.
+    """
+    user = get_user(request)
+    if user is None:
+        return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+    except ValueError:
+        return Response(
+            {"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    binders = BinderModel.objects.accessible_to(user).filter(old=False)
+    results = search_binders(binders, request.GET.get("q", ""), limit)
+    events = dict(
+        BinderModel.objects.filter(pk__in=[pk for pk, _ in results]).values_list(
+            "pk", "event__name"
+        )
+    )
+    return Response(
+        [{"id": pk, "event": events[pk], "snippet": snippet} for pk, snippet in results]
+    )
+
+
+def task_status(task):
+    return {
+        "id": task.pk,
+        "name": task.name.rsplit(".", 1)[-1],
+        "status": task.status,
+        "attempts": task.attempts,
+        "result": task.result,
+        # Only the exception, not the traceback
+        "error": task.error.strip().splitlines()[-1] if task.error else None,
+    }
+
+
+@api_view(["GET"])
+def get_task(request, pk):
+    """
+    A view for polling the status of a background task the user queued.
+
+    Args:
+        request: The request object.
+        pk: The id of the task.
+
+    Returns:
+        Response: A response containing the task's status and, once it is
+        done, its result.
+    """
+    user = get_user(request)
+    if user is None:
+        return Response({"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        queued = Task.objects.get(pk=pk, user=user)
+    except Task.DoesNotExist:
+        return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(task_status(queued))
+
+
+@api_view(["GET"])
+def metrics(request):
+    """
+    A view exporting request metrics for Prometheus. Only staff users and
+    the addresses in METRICS["ALLOWED_IPS"] may read them.
+
+    Args:
+        request: The request object.
+
+    Returns:
+        HttpResponse: The metrics of this process in the Prometheus text
+        format.
+    """
+    user = get_user(request)
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS["ALLOWED_IPS"] and (
+        user is None or not user.is_staff
+    ):
+        return Response(
+            {"error": "You don't have permission to read metrics"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )